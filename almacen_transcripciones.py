@@ -0,0 +1,370 @@
+"""
+Almacén compacto de transcripciones en un solo archivo, mapeado en memoria.
+
+En vez de una lista de objetos (un dict por transcripción, timestamps como
+strings) se guardan columnas: el canal como id de una tabla de canales, inicio
+y fin como epochs int64, y los textos concatenados en un bloque UTF-8 con sus
+offsets. El índice invertido también va en el archivo (vocabulario ordenado +
+posting lists con posiciones), así que abrirlo no tokeniza nada: se mapea el
+archivo, se lee el encabezado y listo. Los textos y las posting lists se
+decodifican recién cuando se usan y las páginas las maneja el sistema operativo,
+por lo que el tiempo de arranque y la memoria propia no crecen con el corpus.
+
+    python almacen_transcripciones.py transcripciones.jsonl --salida transcripciones.almacen
+    ALMACEN_TRANSCRIPCIONES=transcripciones.almacen uvicorn main:app
+"""
+import argparse
+import json
+import mmap
+import os
+import sys
+from array import array
+from bisect import bisect_left
+
+from backends_busqueda import BackendMemoria
+from catalogo_segmentos import iso_a_epoch, epoch_a_iso
+from indice_invertido import IndiceInvertido
+
+MAGIA = b"TRNSCR01"
+ALINEACION = 8
+
+# Columnas del archivo: nombre -> typecode de array
+COLUMNAS = {
+    "canal": "H",             # id en la tabla de canales del encabezado
+    "inicio": "q",            # epoch
+    "fin": "q",
+    "texto_offsets": "Q",     # n + 1 offsets dentro de "textos"
+    "textos": "B",
+    "vocabulario_offsets": "Q",
+    "vocabulario": "B",       # términos ordenados, UTF-8 concatenado
+    "postings_offsets": "Q",  # por término, rango dentro de postings_docs
+    "postings_docs": "I",
+    "posiciones_offsets": "Q",  # por entrada de postings_docs, rango dentro de posiciones
+    "posiciones": "I",
+}
+
+
+def escribir_almacen(ruta: str, transcripciones, stemming: bool = False) -> int:
+    """
+    Arma el archivo a partir de Transcripciones (o cualquier cosa con canal, texto,
+    start_timestamp y end_timestamp). Se escribe a un temporal y se renombra al final.
+    Returns:
+        int: cantidad de transcripciones escritas
+    """
+    filas = sorted(
+        ((iso_a_epoch(t.start_timestamp), t.canal or "", iso_a_epoch(t.end_timestamp), t.texto or "")
+         for t in transcripciones),
+        key=lambda f: (f[0], f[1]),
+    )
+    canales = sorted({f[1] for f in filas})
+    id_canal = {c: i for i, c in enumerate(canales)}
+
+    columnas = {nombre: array(tipo) for nombre, tipo in COLUMNAS.items()}
+    textos = bytearray()
+    columnas["texto_offsets"].append(0)
+    indice = IndiceInvertido(stemming=stemming)
+    for doc_id, (inicio, canal, fin, texto) in enumerate(filas):
+        columnas["canal"].append(id_canal[canal])
+        columnas["inicio"].append(inicio)
+        columnas["fin"].append(fin)
+        textos += texto.encode("utf-8")
+        columnas["texto_offsets"].append(len(textos))
+        indice.agregar(doc_id, texto)
+    columnas["textos"] = array("B", textos)
+
+    vocabulario = bytearray()
+    columnas["vocabulario_offsets"].append(0)
+    columnas["postings_offsets"].append(0)
+    columnas["posiciones_offsets"].append(0)
+    for termino in sorted(indice._postings):
+        vocabulario += termino.encode("utf-8")
+        columnas["vocabulario_offsets"].append(len(vocabulario))
+        for doc_id, posiciones in sorted(indice._postings[termino].items()):
+            columnas["postings_docs"].append(doc_id)
+            columnas["posiciones"].extend(posiciones)
+            columnas["posiciones_offsets"].append(len(columnas["posiciones"]))
+        columnas["postings_offsets"].append(len(columnas["postings_docs"]))
+    columnas["vocabulario"] = array("B", vocabulario)
+
+    # Encabezado: dónde arranca cada columna (alineada a 8 bytes para leerla con memoryview.cast)
+    secciones = {}
+    desplazamiento = 0
+    for nombre, columna in columnas.items():
+        secciones[nombre] = [desplazamiento, len(columna)]
+        desplazamiento += _alinear(len(columna) * columna.itemsize)
+    encabezado = json.dumps({
+        "cantidad": len(filas),
+        "canales": canales,
+        "stemming": stemming,
+        "orden_bytes": sys.byteorder,
+        "secciones": secciones,
+    }).encode("utf-8")
+
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "wb") as f:
+        f.write(MAGIA)
+        f.write(len(encabezado).to_bytes(8, "little"))
+        f.write(encabezado)
+        f.write(b"\0" * (_alinear(f.tell()) - f.tell()))
+        for columna in columnas.values():
+            datos = columna.tobytes()
+            f.write(datos)
+            f.write(b"\0" * (_alinear(len(datos)) - len(datos)))
+    os.replace(temporal, ruta)
+    return len(filas)
+
+
+def _alinear(n: int) -> int:
+    return (n + ALINEACION - 1) // ALINEACION * ALINEACION
+
+
+class AlmacenTranscripciones:
+    """Lectura del archivo de escribir_almacen. Se comporta como una secuencia de transcripciones."""
+
+    def __init__(self, ruta: str):
+        self.ruta = ruta
+        with open(ruta, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mmap[:len(MAGIA)] != MAGIA:
+            raise ValueError(f"{ruta} no es un almacén de transcripciones")
+        largo = int.from_bytes(self._mmap[8:16], "little")
+        encabezado = json.loads(self._mmap[16:16 + largo])
+        if encabezado["orden_bytes"] != sys.byteorder:
+            raise ValueError(f"{ruta} se generó en una máquina con otro orden de bytes, hay que regenerarlo")
+        self.cantidad = encabezado["cantidad"]
+        self.canales = encabezado["canales"]
+        self.stemming = encabezado["stemming"]
+
+        base = _alinear(16 + largo)
+        vista = memoryview(self._mmap)
+        for nombre, tipo in COLUMNAS.items():
+            desde, cantidad = encabezado["secciones"][nombre]
+            tamanio = array(tipo).itemsize
+            columna = vista[base + desde:base + desde + cantidad * tamanio]
+            setattr(self, f"_{nombre}", columna if tipo == "B" else columna.cast(tipo))
+        self.indice = IndiceAlmacen(self)
+
+    def __len__(self):
+        return self.cantidad
+
+    def __getitem__(self, doc_id: int):
+        if not 0 <= doc_id < self.cantidad:
+            raise IndexError(doc_id)
+        return TranscripcionAlmacen(self, doc_id)
+
+    def texto(self, doc_id: int) -> str:
+        return bytes(self._textos[self._texto_offsets[doc_id]:self._texto_offsets[doc_id + 1]]).decode("utf-8")
+
+    def canal(self, doc_id: int) -> str:
+        return self.canales[self._canal[doc_id]]
+
+    def inicio(self, doc_id: int) -> int:
+        return self._inicio[doc_id]
+
+    def fin(self, doc_id: int) -> int:
+        return self._fin[doc_id]
+
+    def buscar(self, canal: str, start_timestamp: str):
+        """doc_id de la transcripción de `canal` que arranca en `start_timestamp`, o None."""
+        try:
+            inicio = iso_a_epoch(start_timestamp)
+        except ValueError:
+            return None
+        # Las filas están ordenadas por inicio: bisect directo sobre la columna mapeada
+        i = bisect_left(self._inicio, inicio)
+        while i < self.cantidad and self._inicio[i] == inicio:
+            if self.canal(i) == canal:
+                return i
+            i += 1
+        return None
+
+
+class TranscripcionAlmacen:
+    """Misma interfaz que Transcripcion; el texto se lee del archivo recién cuando se pide."""
+
+    __slots__ = ("_almacen", "id")
+
+    def __init__(self, almacen: AlmacenTranscripciones, doc_id: int):
+        self._almacen = almacen
+        self.id = doc_id
+
+    @property
+    def canal(self):
+        return self._almacen.canal(self.id)
+
+    @property
+    def texto(self):
+        return self._almacen.texto(self.id)
+
+    @property
+    def start_timestamp(self):
+        return epoch_a_iso(self._almacen.inicio(self.id))
+
+    @property
+    def end_timestamp(self):
+        return epoch_a_iso(self._almacen.fin(self.id))
+
+
+class _Vocabulario:
+    """Términos ordenados decodificados a pedido (bisect funciona sobre cualquier secuencia)."""
+
+    def __init__(self, almacen: AlmacenTranscripciones):
+        self._offsets = almacen._vocabulario_offsets
+        self._bytes = almacen._vocabulario
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return bytes(self._bytes[self._offsets[i]:self._offsets[i + 1]]).decode("utf-8")
+
+    def indice_de(self, termino: str):
+        i = bisect_left(self, termino)
+        return i if i < len(self) and self[i] == termino else None
+
+
+class _PostingsAlmacen:
+    """Lo que IndiceInvertido espera en _postings (termino -> {doc_id: [posiciones]}), leído del archivo."""
+
+    def __init__(self, almacen: AlmacenTranscripciones, vocabulario: _Vocabulario):
+        self._vocabulario = vocabulario
+        self._offsets = almacen._postings_offsets
+        self._docs = almacen._postings_docs
+        self._posiciones_offsets = almacen._posiciones_offsets
+        self._posiciones = almacen._posiciones
+
+    def __len__(self):
+        return len(self._vocabulario)
+
+    def __contains__(self, termino):
+        return self._vocabulario.indice_de(termino) is not None
+
+    def __getitem__(self, termino: str) -> dict:
+        i = self._vocabulario.indice_de(termino)
+        if i is None:
+            raise KeyError(termino)
+        desde, hasta = self._offsets[i], self._offsets[i + 1]
+        offsets = self._posiciones_offsets
+        return {
+            self._docs[j]: self._posiciones[offsets[j]:offsets[j + 1]].tolist()
+            for j in range(desde, hasta)
+        }
+
+    def get(self, termino: str, defecto=None):
+        try:
+            return self[termino]
+        except KeyError:
+            return defecto
+
+
+class IndiceAlmacen(IndiceInvertido):
+    """IndiceInvertido de solo lectura sobre las columnas del almacén."""
+
+    def __init__(self, almacen: AlmacenTranscripciones):
+        super().__init__(stemming=almacen.stemming)
+        self._vocabulario = _Vocabulario(almacen)
+        self._postings = _PostingsAlmacen(almacen, self._vocabulario)
+
+    def agregar(self, doc_id: int, texto: str):
+        raise TypeError("El índice del almacén es de solo lectura; las transcripciones nuevas van a un IndiceInvertido aparte")
+
+
+class _IndiceCombinado:
+    """El índice del almacén más uno en memoria para lo que se agrega después de abrirlo."""
+
+    def __init__(self, base: IndiceAlmacen, nuevos: IndiceInvertido, cantidad_base: int):
+        self.base = base
+        self.nuevos = nuevos
+        self.stemming = base.stemming
+        self.cantidad_base = cantidad_base
+        # doc_id del almacén que se reemplazaron (sus términos nuevos están en `nuevos`)
+        self.ocultos = set()
+
+    def agregar(self, doc_id: int, texto: str):
+        self.nuevos.agregar(doc_id, texto)
+
+    def quitar(self, doc_id: int, texto: str):
+        # El índice mapeado no se puede modificar: los del almacén se ocultan
+        if doc_id < self.cantidad_base:
+            self.ocultos.add(doc_id)
+        self.nuevos.quitar(doc_id, texto)
+
+    def buscar(self, consulta: str) -> set:
+        return (self.base.buscar(consulta) - self.ocultos) | self.nuevos.buscar(consulta)
+
+
+class _ListaTranscripciones:
+    """Las del almacén seguidas de las agregadas en memoria; los doc_id siguen siendo posiciones."""
+
+    def __init__(self, almacen: AlmacenTranscripciones):
+        self._almacen = almacen
+        self._agregadas = []
+        # doc_id del almacén -> la transcripción que lo reemplazó (se reingestó la misma)
+        self._reemplazos = {}
+
+    def __len__(self):
+        return len(self._almacen) + len(self._agregadas)
+
+    def __getitem__(self, doc_id: int):
+        if doc_id < len(self._almacen):
+            return self._reemplazos.get(doc_id) or self._almacen[doc_id]
+        return self._agregadas[doc_id - len(self._almacen)]
+
+    def __setitem__(self, doc_id: int, transcripcion):
+        if doc_id < len(self._almacen):
+            self._reemplazos[doc_id] = transcripcion
+        else:
+            self._agregadas[doc_id - len(self._almacen)] = transcripcion
+
+    def append(self, transcripcion):
+        self._agregadas.append(transcripcion)
+
+
+class BackendAlmacen(BackendMemoria):
+    """BackendMemoria sobre un AlmacenTranscripciones: misma búsqueda y paginado, sin cargar el corpus."""
+
+    def __init__(self, almacen: AlmacenTranscripciones):
+        self.almacen = almacen
+        self.transcripciones = _ListaTranscripciones(almacen)
+        # Solo para las transcripciones agregadas después de abrir el almacén
+        self._por_canal_inicio = {}
+        self.indice = _IndiceCombinado(almacen.indice, IndiceInvertido(stemming=almacen.stemming), len(almacen))
+
+    def _clave_orden(self, doc_id: int) -> list:
+        # Directo de las columnas, sin armar la transcripción ni formatear la fecha
+        if doc_id < len(self.almacen):
+            return [self.almacen.inicio(doc_id), self.almacen.canal(doc_id), doc_id]
+        t = self.transcripciones[doc_id]
+        return [iso_a_epoch(t.start_timestamp), t.canal or "", doc_id]
+
+    def _instante(self, fecha: str) -> int:
+        try:
+            return iso_a_epoch(fecha)
+        except TypeError as e:
+            raise ValueError(f"Fecha inválida: {fecha!r}") from e
+
+    def _cursor(self, clave: list) -> list:
+        return [epoch_a_iso(clave[0]), *clave[1:]]
+
+    def _doc_id(self, canal: str, start_timestamp: str):
+        doc_id = self._por_canal_inicio.get((canal, start_timestamp))
+        if doc_id is None:
+            doc_id = self.almacen.buscar(canal, start_timestamp)
+        return doc_id
+
+
+def main(argv=None):
+    from ingesta_bulk import leer_transcripciones
+
+    parser = argparse.ArgumentParser(description="Arma un almacén de transcripciones a partir de archivos JSONL")
+    parser.add_argument("archivos", nargs="+", help="Archivos JSONL (como los de ingesta_bulk.py), o - para stdin")
+    parser.add_argument("--salida", required=True)
+    parser.add_argument("--stemming", action="store_true")
+    args = parser.parse_args(argv)
+    cantidad = escribir_almacen(args.salida, leer_transcripciones(args.archivos), stemming=args.stemming)
+    print(f"{cantidad} transcripciones en {args.salida} ({os.path.getsize(args.salida)} bytes)", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import os
+import shutil
+import time
+import zlib
+from collections import defaultdict
+
+from catalogo_segmentos import Segmento
+from metricas import migracion_segmentos, migracion_bytes
+
+# Segmentos repartidos en varias raíces (discos), por antigüedad.
+# La configuración es una lista "ruta=días,ruta,ruta" de la raíz más nueva a la de
+# archivo, p. ej. "/ssd/canales=2,/hdd1/canales,/hdd2/canales": los segmentos de
+# menos de 2 días van en el SSD y los demás se reparten entre los dos HDD. Raíces
+# consecutivas con los mismos días forman un nivel; dentro de un nivel cada segmento
+# va a un disco fijo según su nombre, así los segmentos seguidos de un canal quedan
+# en discos distintos y se pueden leer en paralelo. El grabador escribe en la primera
+# raíz y el catálogo (CatalogoCanal) mira el canal en todas.
+# Un migrador en segundo plano mueve los segmentos que envejecieron al nivel que les
+# toca: copia a un temporal, renombra (el catálogo pasa a leer la copia nueva) y
+# borra el original recién después de `gracia` segundos, para que los trabajos y
+# descargas que ya resolvieron la ruta vieja terminen sin problemas.
+
+logger = logging.getLogger(__name__)
+
+SEGUNDOS_POR_DIA = 86400
+
+
+class Raiz:
+    def __init__(self, directorio: str, dias: float = None):
+        """
+        Args:
+            directorio (str): Carpeta con una subcarpeta por canal
+            dias (float): Antigüedad máxima de los segmentos de esta raíz (None = sin límite)
+        """
+        self.directorio = directorio
+        self.dias = dias
+
+    def __repr__(self):
+        return f"Raiz({self.directorio!r}, dias={self.dias})"
+
+
+def parsear_raices(texto: str) -> list:
+    """'/ssd/canales=2,/hdd1/canales,/hdd2/canales' -> [Raiz, ...]"""
+    raices = []
+    for parte in texto.split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        directorio, _, dias = parte.partition("=")
+        raices.append(Raiz(directorio.strip(), float(dias) if dias.strip() else None))
+    if not raices:
+        raise ValueError("No hay ninguna raíz de segmentos configurada")
+    return raices
+
+
+class AlmacenamientoSegmentos:
+    def __init__(self, raices: list):
+        self.raices = raices
+        # Raíces consecutivas con los mismos días = un nivel
+        self.niveles = []
+        for raiz in raices:
+            if self.niveles and self.niveles[-1][0].dias == raiz.dias:
+                self.niveles[-1].append(raiz)
+            else:
+                self.niveles.append([raiz])
+
+    @property
+    def principal(self) -> str:
+        """Donde escribe el grabador (y donde se guardan los proxies)."""
+        return self.raices[0].directorio
+
+    @property
+    def directorios(self) -> list:
+        return [r.directorio for r in self.raices]
+
+    def nivel_de(self, ruta: str):
+        """Nivel de la raíz en la que está `ruta` (<raíz>/<canal>/<segmento>), None si no está en ninguna."""
+        raiz = os.path.normpath(os.path.dirname(os.path.dirname(ruta)))
+        for i, nivel in enumerate(self.niveles):
+            if any(os.path.normpath(r.directorio) == raiz for r in nivel):
+                return i
+        return None
+
+    def destino(self, segmento, ahora: float = None):
+        """
+        Nivel y raíz que le tocan a `segmento` por su antigüedad. El último nivel se queda
+        con todo lo que no entra en los anteriores, tenga o no días configurados.
+        Returns:
+            tuple: (nivel, Raiz)
+        """
+        edad = (time.time() if ahora is None else ahora) - segmento.fin
+        i = next((i for i, nivel in enumerate(self.niveles)
+                  if nivel[0].dias is None or edad < nivel[0].dias * SEGUNDOS_POR_DIA), len(self.niveles) - 1)
+        nivel = self.niveles[i]
+        # Fijo por nombre: el mismo segmento siempre va al mismo disco del nivel
+        return i, nivel[zlib.crc32(segmento.nombre.encode()) % len(nivel)]
+
+
+class MigradorSegmentos:
+    def __init__(self, almacenamiento: AlmacenamientoSegmentos, catalogo, gracia: float = 3600.0,
+                 por_vuelta: int = 16, al_mover=()):
+        """
+        Args:
+            gracia (float): Segundos que se conserva el original después de copiarlo
+            por_vuelta (int): Segmentos que se mueven como máximo en cada vuelta
+            al_mover: Funciones (origen, destino) a llamar después de cada copia (p. ej. MetadatosSegmentos.mover)
+        """
+        self.almacenamiento = almacenamiento
+        self.catalogo = catalogo
+        self.gracia = gracia
+        self.por_vuelta = por_vuelta
+        self.al_mover = list(al_mover)
+        # ruta original -> momento (monotonic) a partir del cual se puede borrar
+        self._por_borrar = {}
+
+    def pendientes(self, ahora: float = None) -> list:
+        """(canal, segmento, raíz de destino) de los segmentos que están en un nivel más nuevo que el que les toca."""
+        movimientos = []
+        for canal in self.catalogo.canales():
+            catalogo = self.catalogo.canal(canal)
+            catalogo.refrescar()
+            for segmento in catalogo.segmentos:
+                actual = self.almacenamiento.nivel_de(segmento.ruta)
+                nivel, raiz = self.almacenamiento.destino(segmento, ahora)
+                # Solo hacia niveles más viejos: un segmento no rejuvenece
+                if actual is not None and nivel > actual:
+                    movimientos.append((canal, segmento, raiz))
+        return movimientos
+
+    def copiar(self, origen: str, destino: str):
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        temporal = destino + ".tmp"
+        try:
+            # copy2 conserva el mtime: la clave del cache de clips y los metadatos siguen valiendo
+            shutil.copy2(origen, temporal)
+            with open(temporal, "rb") as f:
+                os.fsync(f.fileno())
+            os.replace(temporal, destino)
+        except BaseException:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            raise
+
+    async def mover(self, canal: str, segmento, raiz: Raiz):
+        origen = segmento.ruta
+        destino = os.path.join(raiz.directorio, canal, segmento.nombre)
+        await asyncio.to_thread(self.copiar, origen, destino)
+        migracion_bytes.inc(os.path.getsize(destino))
+        migracion_segmentos.inc(resultado="copiado")
+        # Las lecturas nuevas ya van a la copia (el catálogo haría lo mismo en su próximo refresco)
+        segmento.ruta = destino
+        for funcion in self.al_mover:
+            funcion(origen, destino)
+        self._por_borrar[origen] = time.monotonic() + self.gracia
+        logger.info("Segmento movido de raíz", extra={"origen": origen, "destino": destino})
+
+    def duplicados(self) -> list:
+        """
+        Originales que ya tienen su copia completa en una raíz posterior (p. ej. si el proceso se
+        reinició durante la gracia). Se vuelven a poner en espera, no se borran en el momento.
+        """
+        sobrantes = []
+        for canal in self.catalogo.canales():
+            vistos = {}
+            for directorio in self.almacenamiento.directorios:
+                carpeta = os.path.join(directorio, canal)
+                try:
+                    with os.scandir(carpeta) as it:
+                        archivos = [(e.name, e.stat().st_size) for e in it if e.is_file()]
+                except FileNotFoundError:
+                    continue
+                for nombre, tamanio in archivos:
+                    if Segmento.desde_nombre(nombre) is None:
+                        continue
+                    anterior = vistos.get(nombre)
+                    if anterior is not None and anterior[1] == tamanio:
+                        sobrantes.append(anterior[0])
+                    vistos[nombre] = (os.path.join(carpeta, nombre), tamanio)
+        return sobrantes
+
+    def borrar_vencidos(self):
+        ahora = time.monotonic()
+        for ruta in self.duplicados():
+            self._por_borrar.setdefault(ruta, ahora + self.gracia)
+        for ruta, momento in list(self._por_borrar.items()):
+            if momento > ahora:
+                continue
+            del self._por_borrar[ruta]
+            try:
+                os.remove(ruta)
+                migracion_segmentos.inc(resultado="borrado")
+            except FileNotFoundError:
+                pass
+
+    async def vigilar(self, intervalo: float):
+        """
+        Cada `intervalo` segundos mueve hasta `por_vuelta` segmentos (los más viejos primero),
+        en paralelo entre discos de destino y de a uno por disco, y borra los originales vencidos.
+        """
+        while True:
+            try:
+                movimientos = (await asyncio.to_thread(self.pendientes))[:self.por_vuelta]
+                por_disco = defaultdict(list)
+                for canal, segmento, raiz in movimientos:
+                    por_disco[raiz.directorio].append((canal, segmento, raiz))
+
+                async def mover_todos(lista):
+                    for canal, segmento, raiz in lista:
+                        try:
+                            await self.mover(canal, segmento, raiz)
+                        except OSError as e:
+                            migracion_segmentos.inc(resultado="error")
+                            logger.warning("No se pudo mover el segmento",
+                                           extra={"archivo": segmento.ruta, "destino": raiz.directorio, "error": str(e)})
+
+                await asyncio.gather(*(mover_todos(lista) for lista in por_disco.values()))
+                await asyncio.to_thread(self.borrar_vencidos)
+            except Exception:
+                logger.exception("Error moviendo segmentos entre raíces")
+            await asyncio.sleep(intervalo)
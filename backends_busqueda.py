@@ -0,0 +1,456 @@
+import heapq
+import logging
+from datetime import datetime, timezone
+
+from indice_invertido import IndiceInvertido, tokenizar, resaltar
+from transcripciones_mock import Transcripcion
+
+# Backends de búsqueda detrás de TranscripcionesHandler.
+# - BackendMemoria: el índice invertido en memoria (lo que se usaba hasta ahora)
+# - BackendElasticsearch: el índice "streaming_tv" de mapping_elastic.py, con un
+#   único AsyncElasticsearch (pool de conexiones) creado al levantar la app
+# - ElasticsearchFalso: cliente en proceso con la misma interfaz que AsyncElasticsearch
+#   (la parte que usamos), para probar BackendElasticsearch sin un cluster
+
+INDICE_ES = "streaming_tv"
+FORMATO_TS = "%Y-%m-%dT%H:%M:%SZ"
+
+# Campos del mapping de streaming_tv <-> atributos de Transcripcion
+CAMPO_CANAL = "channel"
+CAMPO_TEXTO = "text"
+CAMPO_INICIO = "datetime"
+CAMPO_FIN = "end_datetime"
+# Copia del _id como keyword: desempata el orden de /buscar (Elasticsearch 8 no deja ordenar por _id)
+CAMPO_ID = "doc_id"
+
+# Largo del fragmento resaltado que se devuelve en vez del texto completo
+ANCHO_FRAGMENTO = 160
+
+logger = logging.getLogger(__name__)
+
+
+def normalizar_fecha(valor):
+    """Cualquier fecha ISO que devuelva Elasticsearch -> '2025-09-12T12:07:30Z' (lo que espera /videos)."""
+    if not valor:
+        return None
+    dt = datetime.fromisoformat(str(valor).replace("Z", "+00:00"))
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc)
+    return dt.strftime(FORMATO_TS)
+
+
+def documento_a_transcripcion(doc_id, fuente: dict) -> Transcripcion:
+    return Transcripcion(
+        id=doc_id,
+        canal=fuente.get(CAMPO_CANAL),
+        texto=fuente.get(CAMPO_TEXTO, ""),
+        start_timestamp=normalizar_fecha(fuente.get(CAMPO_INICIO)),
+        end_timestamp=normalizar_fecha(fuente.get(CAMPO_FIN)),
+    )
+
+
+def transcripcion_a_documento(t: Transcripcion) -> dict:
+    return {
+        CAMPO_CANAL: t.canal,
+        CAMPO_TEXTO: t.texto,
+        CAMPO_INICIO: t.start_timestamp,
+        CAMPO_FIN: t.end_timestamp,
+    }
+
+
+class PaginaResultados:
+    """
+    Una página de resultados ordenada por (inicio, canal).
+    `fragmentos[i]` es el pedazo resaltado de `resultados[i]` y `siguiente` los valores
+    de orden del último resultado (para pedir la página siguiente), o None si no hay más.
+    """
+
+    def __init__(self, resultados: list, fragmentos: list, siguiente=None):
+        self.resultados = resultados
+        self.fragmentos = fragmentos
+        self.siguiente = siguiente
+
+
+class BackendBusqueda:
+    """Interfaz común. Todos los métodos son async para que Elasticsearch no bloquee el loop."""
+
+    # True si todos los workers ven el mismo índice (lo que agrega uno no hace falta agregarlo en los otros)
+    compartido = False
+
+    async def buscar(self, palabra: str, canal: str = None, desde: str = None, hasta: str = None,
+                     tamanio: int = None, despues_de: list = None) -> PaginaResultados:
+        """
+        Args:
+            canal (str): Solo resultados de ese canal
+            desde, hasta (str): Rango de start_timestamp (ISO, inclusive)
+            tamanio (int): Resultados por página (None = todos, hasta el tope del backend)
+            despues_de (list): `siguiente` de la página anterior (estilo search_after)
+        """
+        raise NotImplementedError
+
+    async def obtener(self, canal: str, start_timestamp: str):
+        """La transcripción completa de un canal en un instante, o None."""
+        raise NotImplementedError
+
+    async def obtener_varios(self, pares: list) -> list:
+        """Como `obtener` para [(canal, start_timestamp), ...]; devuelve la lista en el mismo orden."""
+        return [await self.obtener(canal, start_timestamp) for canal, start_timestamp in pares]
+
+    async def agregar(self, transcripcion: Transcripcion) -> bool:
+        """
+        Returns:
+            bool: False si ya estaba (la misma transcripción reingestada), que se reemplaza en vez de duplicarse
+        """
+        raise NotImplementedError
+
+    def validar_cursor(self, despues_de: list):
+        """ValueError si `despues_de` no tiene la forma de un `siguiente` de este backend (p. ej. un cursor armado a mano)."""
+        raise NotImplementedError
+
+    async def cerrar(self):
+        pass
+
+
+class BackendMemoria(BackendBusqueda):
+    def __init__(self, transcripciones=(), stemming: bool = False):
+        self.transcripciones = []
+        self._por_canal_inicio = {}
+        # El índice se arma una sola vez al cargar; después se actualiza con agregar
+        self.indice = IndiceInvertido(stemming=stemming)
+        for t in transcripciones:
+            self.agregar_sync(t)
+
+    def agregar_sync(self, transcripcion: Transcripcion) -> bool:
+        # Una por canal e instante de inicio: si ya había una, esta la reemplaza en el mismo doc_id
+        clave = (transcripcion.canal, transcripcion.start_timestamp)
+        doc_id = self._doc_id(*clave)
+        nueva = doc_id is None
+        if nueva:
+            doc_id = len(self.transcripciones)
+            self.transcripciones.append(transcripcion)
+        else:
+            self.indice.quitar(doc_id, self.transcripciones[doc_id].texto)
+            self.transcripciones[doc_id] = transcripcion
+        self._por_canal_inicio[clave] = doc_id
+        self.indice.agregar(doc_id, transcripcion.texto)
+        return nueva
+
+    async def agregar(self, transcripcion: Transcripcion) -> bool:
+        return self.agregar_sync(transcripcion)
+
+    def _doc_id(self, canal: str, start_timestamp: str):
+        return self._por_canal_inicio.get((canal, start_timestamp))
+
+    async def obtener(self, canal: str, start_timestamp: str):
+        doc_id = self._doc_id(canal, start_timestamp)
+        return None if doc_id is None else self.transcripciones[doc_id]
+
+    def _clave_orden(self, doc_id: int) -> list:
+        """[inicio, canal, doc_id]: el orden de los resultados. Los filtros se aplican sobre esta clave."""
+        t = self.transcripciones[doc_id]
+        return [t.start_timestamp, t.canal or "", doc_id]
+
+    def _instante(self, fecha: str):
+        """Fecha ISO -> el valor comparable con el inicio de _clave_orden."""
+        return fecha
+
+    def _cursor(self, clave: list) -> list:
+        """Clave de orden -> valores de `siguiente` (los que después vuelven como despues_de)."""
+        return clave
+
+    def validar_cursor(self, despues_de: list):
+        # [inicio ISO, canal, doc_id], lo que arma _cursor
+        if (len(despues_de) != 3 or not isinstance(despues_de[0], str) or not isinstance(despues_de[1], str)
+                or type(despues_de[2]) is not int or not normalizar_fecha(despues_de[0])):
+            raise ValueError("cursor inválido")
+        self._instante(despues_de[0])
+
+    async def buscar(self, palabra: str, canal: str = None, desde: str = None, hasta: str = None,
+                     tamanio: int = None, despues_de: list = None) -> PaginaResultados:
+        # Solo se tocan los documentos que matchean, no todo el corpus
+        doc_ids = self.indice.buscar(palabra)
+        desde, hasta = normalizar_fecha(desde), normalizar_fecha(hasta)
+        desde = None if desde is None else self._instante(desde)
+        hasta = None if hasta is None else self._instante(hasta)
+        limite = None if despues_de is None else [self._instante(despues_de[0]), *despues_de[1:]]
+        candidatos = []
+        for doc_id in doc_ids:
+            clave = self._clave_orden(doc_id)
+            if canal is not None and clave[1] != canal:
+                continue
+            if (desde is not None and clave[0] < desde) or (hasta is not None and clave[0] > hasta):
+                continue
+            if limite is not None and clave <= limite:
+                continue
+            candidatos.append(clave)
+
+        if tamanio is None:
+            pagina = sorted(candidatos)
+            siguiente = None
+        else:
+            # Solo ordenamos lo que entra en la página (+1 para saber si hay más)
+            pagina = heapq.nsmallest(tamanio + 1, candidatos)
+            siguiente = self._cursor(pagina[tamanio - 1]) if len(pagina) > tamanio else None
+            pagina = pagina[:tamanio]
+
+        resultados = [self.transcripciones[clave[2]] for clave in pagina]
+        fragmentos = [resaltar(t.texto, palabra, ANCHO_FRAGMENTO, self.indice.stemming) for t in resultados]
+        return PaginaResultados(resultados, fragmentos, siguiente)
+
+
+class BackendElasticsearch(BackendBusqueda):
+    compartido = True
+
+    def __init__(self, cliente, indice: str = INDICE_ES, tamanio_maximo: int = 1000):
+        """
+        Args:
+            cliente: AsyncElasticsearch (o ElasticsearchFalso), compartido por toda la app
+            tamanio_maximo (int): Tope de resultados por búsqueda
+        """
+        self.cliente = cliente
+        self.indice = indice
+        self.tamanio_maximo = tamanio_maximo
+
+    @classmethod
+    def crear(cls, url: str, timeout: float = 5.0, reintentos: int = 2, conexiones: int = 20, **kwargs):
+        """Crea el backend con un AsyncElasticsearch (un pool de conexiones para toda la app)."""
+        # Import acá: el paquete elasticsearch[async] solo hace falta si se usa este backend
+        from elasticsearch import AsyncElasticsearch
+
+        cliente = AsyncElasticsearch(
+            url,
+            request_timeout=timeout,
+            max_retries=reintentos,
+            retry_on_timeout=True,
+            connections_per_node=conexiones,
+        )
+        return cls(cliente, **kwargs)
+
+    async def buscar(self, palabra: str, canal: str = None, desde: str = None, hasta: str = None,
+                     tamanio: int = None, despues_de: list = None) -> PaginaResultados:
+        # Los filtros van en "filter": se aplican antes del scoring y Elasticsearch los cachea
+        filtros = []
+        if canal is not None:
+            filtros.append({"term": {f"{CAMPO_CANAL}.keyword": canal}})
+        if desde is not None or hasta is not None:
+            rango = {}
+            if desde is not None:
+                rango["gte"] = desde
+            if hasta is not None:
+                rango["lte"] = hasta
+            filtros.append({"range": {CAMPO_INICIO: rango}})
+
+        tamanio_pedido = self.tamanio_maximo if tamanio is None else min(tamanio, self.tamanio_maximo)
+        parametros = dict(
+            index=self.indice,
+            query={"bool": {
+                # Igual que el índice en memoria: frase, con la última palabra como prefijo
+                "must": [{"match_phrase_prefix": {CAMPO_TEXTO: {"query": palabra}}}],
+                "filter": filtros,
+            }},
+            # Canal e id desempatan: con search_after, dos hits con la misma clave de orden podrían saltearse
+            sort=[{CAMPO_INICIO: "asc"}, {f"{CAMPO_CANAL}.keyword": "asc"}, {CAMPO_ID: "asc"}],
+            size=tamanio_pedido + 1,
+            source=[CAMPO_CANAL, CAMPO_TEXTO, CAMPO_INICIO, CAMPO_FIN],
+            highlight={
+                "encoder": "html",
+                "pre_tags": ["<em>"],
+                "post_tags": ["</em>"],
+                "fields": {CAMPO_TEXTO: {
+                    "fragment_size": ANCHO_FRAGMENTO,
+                    "number_of_fragments": 1,
+                    "no_match_size": ANCHO_FRAGMENTO,
+                }},
+            },
+            # Solo lo que usamos: ahorra serializar/parsear metadatos de cada hit
+            filter_path=["hits.hits._id", "hits.hits._source", "hits.hits.sort", "hits.hits.highlight"],
+        )
+        if despues_de is not None:
+            parametros["search_after"] = list(despues_de)
+
+        respuesta = await self.cliente.search(**parametros)
+        hits = respuesta.get("hits", {}).get("hits", [])
+        siguiente = hits[tamanio_pedido - 1].get("sort") if len(hits) > tamanio_pedido else None
+        hits = hits[:tamanio_pedido]
+        resultados = [documento_a_transcripcion(h["_id"], h["_source"]) for h in hits]
+        fragmentos = [(h.get("highlight", {}).get(CAMPO_TEXTO) or [""])[0] for h in hits]
+        return PaginaResultados(resultados, fragmentos, siguiente)
+
+    @staticmethod
+    def _consulta_obtener(canal: str, start_timestamp: str) -> dict:
+        return dict(
+            query={"bool": {"filter": [
+                {"term": {f"{CAMPO_CANAL}.keyword": canal}},
+                {"range": {CAMPO_INICIO: {"gte": start_timestamp, "lte": start_timestamp}}},
+            ]}},
+            size=1,
+            _source=[CAMPO_CANAL, CAMPO_TEXTO, CAMPO_INICIO, CAMPO_FIN],
+        )
+
+    async def obtener(self, canal: str, start_timestamp: str):
+        consulta = self._consulta_obtener(canal, start_timestamp)
+        respuesta = await self.cliente.search(
+            index=self.indice,
+            query=consulta["query"],
+            size=consulta["size"],
+            source=consulta["_source"],
+            filter_path=["hits.hits._id", "hits.hits._source"],
+        )
+        hits = respuesta.get("hits", {}).get("hits", [])
+        return documento_a_transcripcion(hits[0]["_id"], hits[0]["_source"]) if hits else None
+
+    async def obtener_varios(self, pares: list) -> list:
+        # Un solo _msearch en vez de un _search por transcripción
+        if not pares:
+            return []
+        busquedas = []
+        for canal, start_timestamp in pares:
+            busquedas.append({"index": self.indice})
+            busquedas.append(self._consulta_obtener(canal, start_timestamp))
+        respuesta = await self.cliente.msearch(
+            searches=busquedas,
+            filter_path=["responses.hits.hits._id", "responses.hits.hits._source", "responses.error"],
+        )
+        resultados = []
+        for (canal, start_timestamp), r in zip(pares, respuesta.get("responses", [])):
+            hits = r.get("hits", {}).get("hits", [])
+            if "error" in r:
+                # Falla solo esa búsqueda, no el lote
+                logger.warning("Falló una búsqueda del msearch", extra={"canal": canal, "start_timestamp": start_timestamp,
+                                                                        "error": str(r["error"])})
+            resultados.append(documento_a_transcripcion(hits[0]["_id"], hits[0]["_source"]) if hits else None)
+        return resultados
+
+    def validar_cursor(self, despues_de: list):
+        # [inicio (epoch en ms como lo devuelve Elasticsearch), canal, id]
+        if (len(despues_de) != 3 or type(despues_de[0]) not in (int, str)
+                or not all(isinstance(v, str) for v in despues_de[1:])):
+            raise ValueError("cursor inválido")
+
+    async def agregar(self, transcripcion: Transcripcion) -> bool:
+        # Con el mismo id (ver ingesta_bulk.id_documento) Elasticsearch reemplaza el documento
+        respuesta = await self.cliente.index(
+            index=self.indice,
+            id=str(transcripcion.id),
+            document={**transcripcion_a_documento(transcripcion), CAMPO_ID: str(transcripcion.id)},
+        )
+        return respuesta.get("result") != "updated"
+
+    async def cerrar(self):
+        await self.cliente.close()
+
+
+class ElasticsearchFalso:
+    """
+    Stand-in en proceso de AsyncElasticsearch. Implementa lo que usa BackendElasticsearch
+    (index, search con match_phrase_prefix/bool/term/range, sort, search_after, highlight, size, msearch, close)
+    sobre un dict.
+    """
+
+    def __init__(self, documentos: dict = None):
+        self.documentos = dict(documentos or {})
+        self.busquedas = 0
+        self.multibusquedas = 0
+
+    async def index(self, index: str, id: str, document: dict, **kwargs):
+        resultado = "updated" if id in self.documentos else "created"
+        self.documentos[id] = dict(document)
+        return {"_index": index, "_id": id, "result": resultado}
+
+    async def search(self, index: str, query: dict = None, sort=None, size: int = 10, source=None,
+                     filter_path=None, search_after=None, highlight=None, **kwargs):
+        self.busquedas += 1
+        hits = [
+            {"_index": index, "_id": doc_id, "_source": fuente}
+            for doc_id, fuente in self.documentos.items()
+            if self._cumple(query or {"match_all": {}}, fuente)
+        ]
+        if sort:
+            campos = [next(iter(c.items())) for c in sort]
+            for h in hits:
+                h["sort"] = [str(h["_source"].get(campo.removesuffix(".keyword")) or "") for campo, _ in campos]
+            for i, (_, orden) in reversed(list(enumerate(campos))):
+                hits.sort(key=lambda h: h["sort"][i], reverse=orden == "desc")
+            if search_after is not None:
+                # Alcanza para orden ascendente, que es lo único que pide BackendElasticsearch
+                hits = [h for h in hits if h["sort"] > list(search_after)]
+        total = len(hits)
+        hits = hits[:size]
+        if highlight is not None:
+            frase = _texto_de_match(query or {})
+            for h in hits:
+                h["highlight"] = {
+                    campo: [resaltar(h["_source"].get(campo, ""), frase, opciones.get("fragment_size", 100))]
+                    for campo, opciones in highlight.get("fields", {}).items()
+                }
+        if source is not None:
+            for h in hits:
+                h["_source"] = {k: v for k, v in h["_source"].items() if k in source}
+        return {"hits": {"total": {"value": total, "relation": "eq"}, "hits": hits}}
+
+    async def msearch(self, searches: list, index: str = None, filter_path=None, **kwargs):
+        """Pares encabezado/cuerpo como los de AsyncElasticsearch.msearch; cada cuerpo va a `search`."""
+        self.multibusquedas += 1
+        respuestas = []
+        for encabezado, cuerpo in zip(searches[0::2], searches[1::2]):
+            cuerpo = dict(cuerpo)
+            respuesta = await self.search(index=encabezado.get("index", index), source=cuerpo.pop("_source", None),
+                                          **cuerpo)
+            respuestas.append({**respuesta, "status": 200})
+        return {"responses": respuestas}
+
+    async def close(self):
+        pass
+
+    def _cumple(self, query: dict, fuente: dict) -> bool:
+        tipo, cuerpo = next(iter(query.items()))
+        if tipo == "match_all":
+            return True
+        if tipo == "match_phrase_prefix":
+            campo, valor = next(iter(cuerpo.items()))
+            texto = valor["query"] if isinstance(valor, dict) else valor
+            indice = IndiceInvertido()
+            indice.agregar(0, fuente.get(campo, ""))
+            return 0 in indice.buscar_frase(tokenizar(texto))
+        if tipo == "term":
+            campo, valor = next(iter(cuerpo.items()))
+            valor = valor["value"] if isinstance(valor, dict) else valor
+            return fuente.get(campo.removesuffix(".keyword")) == valor
+        if tipo == "terms":
+            campo, valores = next(iter(cuerpo.items()))
+            return fuente.get(campo.removesuffix(".keyword")) in valores
+        if tipo == "range":
+            campo, limites = next(iter(cuerpo.items()))
+            valor = normalizar_fecha(fuente.get(campo))
+            if valor is None:
+                return False
+            for op, limite in limites.items():
+                limite = normalizar_fecha(limite)
+                if (op == "gte" and valor < limite) or (op == "gt" and valor <= limite) \
+                        or (op == "lte" and valor > limite) or (op == "lt" and valor >= limite):
+                    return False
+            return True
+        if tipo == "bool":
+            clausulas = [q for clave in ("must", "filter") for q in _como_lista(cuerpo.get(clave))]
+            return all(self._cumple(q, fuente) for q in clausulas)
+        raise ValueError(f"Query no soportada por ElasticsearchFalso: {tipo}")
+
+
+def _texto_de_match(query: dict) -> str:
+    """El texto del primer match_phrase_prefix de la query (para resaltar)."""
+    tipo, cuerpo = next(iter(query.items()))
+    if tipo == "match_phrase_prefix":
+        valor = next(iter(cuerpo.values()))
+        return valor["query"] if isinstance(valor, dict) else valor
+    if tipo == "bool":
+        for q in _como_lista(cuerpo.get("must")):
+            texto = _texto_de_match(q)
+            if texto:
+                return texto
+    return ""
+
+
+def _como_lista(valor):
+    if valor is None:
+        return []
+    return valor if isinstance(valor, list) else [valor]
@@ -0,0 +1,307 @@
+"""
+Benchmark de carga de los endpoints principales, contra los datos de generar_datos_bench.py.
+
+Cada escenario manda una lista de requests armada con una semilla fija (mismas
+consultas, mismos canales, mismos rangos en cada corrida) con N clientes en paralelo,
+y reporta latencias p50/p95/p99 y throughput. El JSON de salida guarda además el
+commit, la máquina y los parámetros, para poder comparar corridas entre commits.
+Solo usa la stdlib y no necesita red (salvo localhost).
+
+    python generar_datos_bench.py /tmp/bench --canales 4 --dias 1 --modo clips
+    python benchmark.py /tmp/bench --levantar --concurrencia 8 --requests 500 --salida base.json
+    python benchmark.py /tmp/bench --levantar --comparar base.json
+
+Escenarios: buscar, videos, segmentos, concatenar, descargar. concatenar y descargar
+necesitan segmentos reales (--modo clips) y ffmpeg.
+"""
+import argparse
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote, urlencode, urlparse
+
+from generar_datos_bench import ARCHIVO_MANIFIESTO, ARCHIVO_TRANSCRIPCIONES, iso, nombre_segmento
+
+ESCENARIOS = ("buscar", "videos", "segmentos", "concatenar", "descargar")
+DIRECTORIO_REPO = os.path.dirname(os.path.abspath(__file__))
+
+
+class Cliente:
+    """Una conexión keep-alive por thread, como haría un navegador."""
+
+    def __init__(self, url: str, timeout: float = 120.0):
+        partes = urlparse(url)
+        self.host = partes.hostname
+        self.puerto = partes.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _conexion(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = self._local.conexion = http.client.HTTPConnection(self.host, self.puerto, timeout=self.timeout)
+        return conexion
+
+    def request(self, metodo: str, ruta: str, cuerpo: dict = None):
+        """Returns: (estado, cuerpo en bytes)"""
+        datos = json.dumps(cuerpo).encode() if cuerpo is not None else None
+        headers = {"Content-Type": "application/json"} if datos is not None else {}
+        for intento in range(2):
+            conexion = self._conexion()
+            try:
+                conexion.request(metodo, ruta, body=datos, headers=headers)
+                respuesta = conexion.getresponse()
+                return respuesta.status, respuesta.read()
+            except (http.client.HTTPException, ConnectionError):
+                # El servidor cerró la conexión keep-alive: se reabre una vez
+                conexion.close()
+                self._local.conexion = None
+                if intento == 1:
+                    raise
+
+
+def percentil(ordenados: list, p: float) -> float:
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not ordenados:
+        return 0.0
+    return ordenados[max(0, math.ceil(p / 100 * len(ordenados)) - 1)]
+
+
+def armar_requests(escenario: str, manifiesto: dict, cantidad: int, rng: random.Random, clip: str = None) -> list:
+    """Lista de (metodo, ruta, cuerpo) determinística para la semilla de `rng`."""
+    canales = manifiesto["canales"]
+    duracion = manifiesto["duracion_segmento"]
+    total = manifiesto["segmentos_por_canal"]
+    inicio = manifiesto["inicio_epoch"]
+    requests = []
+    for _ in range(cantidad):
+        canal = rng.choice(canales)
+        if escenario == "buscar":
+            requests.append(("GET", "/buscar?" + urlencode({"palabra": rng.choice(manifiesto["consultas"])}), None))
+        elif escenario == "videos":
+            instante = inicio + rng.randrange(total * duracion)
+            parametros = {"canal": canal, "timestamp_start": iso(instante), "timestamp_end": iso(instante + duracion)}
+            requests.append(("GET", "/videos?" + urlencode(parametros), None))
+        elif escenario == "segmentos":
+            desde = inicio + rng.randrange(total) * duracion
+            requests.append(("GET", f"/segmentos/{quote(canal)}/{quote(nombre_segmento(canal, desde, desde + duracion))}", None))
+        elif escenario == "concatenar":
+            cantidad_videos = rng.randint(2, 4)
+            primero = rng.randrange(max(1, total - cantidad_videos))
+            videos = [nombre_segmento(canal, inicio + i * duracion, inicio + (i + 1) * duracion)
+                      for i in range(primero, min(total, primero + cantidad_videos))]
+            requests.append(("POST", "/concatenar", {"canal": canal, "videos": videos}))
+        elif escenario == "descargar":
+            requests.append(("GET", "/descargar?" + urlencode({"clip": clip}), None))
+    return requests
+
+
+def preparar_clip(cliente: Cliente, manifiesto: dict) -> str:
+    """Genera un clip con /concatenar para el escenario descargar."""
+    canal = manifiesto["canales"][0]
+    inicio, duracion = manifiesto["inicio_epoch"], manifiesto["duracion_segmento"]
+    videos = [nombre_segmento(canal, inicio + i * duracion, inicio + (i + 1) * duracion) for i in range(3)]
+    estado, cuerpo = cliente.request("POST", "/concatenar", {"canal": canal, "videos": videos})
+    if estado != 200:
+        raise RuntimeError(f"No se pudo generar el clip para descargar (HTTP {estado}): {cuerpo[:200]!r}")
+    return json.loads(cuerpo)["archivo"]
+
+
+def correr_escenario(cliente: Cliente, requests: list, concurrencia: int, calentamiento: int = 0) -> dict:
+    for metodo, ruta, cuerpo in requests[:calentamiento]:
+        cliente.request(metodo, ruta, cuerpo)
+
+    pendientes = iter(requests[calentamiento:])
+    lock = threading.Lock()
+    latencias, estados = [], {}
+    bytes_recibidos = 0
+
+    def trabajar():
+        nonlocal bytes_recibidos
+        while True:
+            with lock:
+                siguiente = next(pendientes, None)
+            if siguiente is None:
+                return
+            metodo, ruta, cuerpo = siguiente
+            inicio = time.perf_counter()
+            try:
+                estado, datos = cliente.request(metodo, ruta, cuerpo)
+            except OSError:
+                estado, datos = 0, b""
+            segundos = time.perf_counter() - inicio
+            with lock:
+                latencias.append(segundos)
+                estados[estado] = estados.get(estado, 0) + 1
+                bytes_recibidos += len(datos)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia) as pool:
+        for _ in range(concurrencia):
+            pool.submit(trabajar)
+    segundos = time.perf_counter() - inicio
+
+    latencias.sort()
+    ms = [l * 1000 for l in latencias]
+    return {
+        "requests": len(latencias),
+        "errores": sum(c for e, c in estados.items() if not 200 <= e < 400),
+        "estados": {str(e): c for e, c in sorted(estados.items())},
+        "segundos": round(segundos, 3),
+        "requests_por_segundo": round(len(latencias) / segundos, 1) if segundos else 0.0,
+        "mb_por_segundo": round(bytes_recibidos / segundos / 1e6, 2) if segundos else 0.0,
+        "p50_ms": round(percentil(ms, 50), 2),
+        "p95_ms": round(percentil(ms, 95), 2),
+        "p99_ms": round(percentil(ms, 99), 2),
+        "max_ms": round(ms[-1], 2) if ms else 0.0,
+        "media_ms": round(sum(ms) / len(ms), 2) if ms else 0.0,
+    }
+
+
+def contexto() -> dict:
+    """Qué se midió y dónde, para que dos reportes se puedan comparar."""
+    def git(*args):
+        try:
+            return subprocess.run(["git", *args], cwd=DIRECTORIO_REPO, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "cambios_sin_commitear": bool(git("status", "--porcelain", "--untracked-files=no")),
+        "fecha": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def levantar_servidor(datos: str, puerto: int, directorio_trabajo: str, timeout: float = 60.0) -> subprocess.Popen:
+    """
+    Levanta uvicorn con main:app sobre los segmentos y transcripciones de `datos` y espera a que responda.
+    Corre parado en `directorio_trabajo` (vacío): clips/, miniaturas y la base de metadatos empiezan
+    de cero en cada corrida, así la segunda no mide solo aciertos del cache. Los vigilantes van
+    apagados para que no compitan por CPU con lo que se mide.
+    """
+    env = {
+        **os.environ,
+        "RAICES_SEGMENTOS": os.path.abspath(os.path.join(datos, "canales")),
+        "TRANSCRIPCIONES_JSONL": os.path.abspath(os.path.join(datos, ARCHIVO_TRANSCRIPCIONES)),
+        "MINIATURAS_INTERVALO": "0",
+        "PROXIES_INTERVALO": "0",
+        "METADATOS_INTERVALO": "0",
+        "MIGRACION_INTERVALO": "0",
+        "LOG_NIVEL": "WARNING",
+    }
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", DIRECTORIO_REPO,
+         "--host", "127.0.0.1", "--port", str(puerto), "--log-level", "warning", "--no-access-log"],
+        cwd=directorio_trabajo, env=env,
+    )
+    limite = time.monotonic() + timeout
+    while time.monotonic() < limite:
+        if proceso.poll() is not None:
+            raise RuntimeError(f"uvicorn terminó con código {proceso.returncode}")
+        try:
+            conexion = http.client.HTTPConnection("127.0.0.1", puerto, timeout=2)
+            conexion.request("GET", "/metrics")
+            if conexion.getresponse().status == 200:
+                return proceso
+        except OSError:
+            time.sleep(0.2)
+    proceso.terminate()
+    raise RuntimeError("uvicorn no respondió a tiempo")
+
+
+def comparar(actual: dict, base: dict):
+    """Imprime la diferencia de latencias y throughput contra un reporte anterior."""
+    print(f"Comparando contra {base['contexto'].get('commit')} ({base['contexto'].get('fecha')})")
+    for escenario, r in actual["escenarios"].items():
+        b = base["escenarios"].get(escenario)
+        if not b or "error" in r or "error" in b:
+            continue
+        cambios = []
+        for metrica in ("p50_ms", "p95_ms", "p99_ms", "requests_por_segundo"):
+            if b[metrica]:
+                cambios.append(f"{metrica} {b[metrica]} -> {r[metrica]} ({(r[metrica] - b[metrica]) / b[metrica]:+.1%})")
+        print(f"  {escenario}: " + ", ".join(cambios))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark de /buscar, /videos, /segmentos, /concatenar y /descargar")
+    parser.add_argument("datos", help="Carpeta generada con generar_datos_bench.py")
+    parser.add_argument("--url", default="http://127.0.0.1:8000", help="Servidor ya levantado (ignorado con --levantar)")
+    parser.add_argument("--levantar", action="store_true", help="Levanta uvicorn sobre los datos y lo baja al final")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--escenarios", default=",".join(ESCENARIOS))
+    parser.add_argument("--concurrencia", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=500, help="Requests por escenario")
+    parser.add_argument("--requests-concatenar", type=int, default=50, help="Requests del escenario concatenar (corre ffmpeg)")
+    parser.add_argument("--calentamiento", type=int, default=10)
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--salida", default="resultados_benchmark.json")
+    parser.add_argument("--comparar", help="Reporte JSON anterior contra el que comparar")
+    args = parser.parse_args(argv)
+
+    with open(os.path.join(args.datos, ARCHIVO_MANIFIESTO), encoding="utf-8") as f:
+        manifiesto = json.load(f)
+
+    servidor = directorio_trabajo = None
+    url = args.url
+    if args.levantar:
+        directorio_trabajo = tempfile.mkdtemp(prefix="benchmark_")
+        servidor = levantar_servidor(args.datos, args.puerto, directorio_trabajo)
+        url = f"http://127.0.0.1:{args.puerto}"
+    cliente = Cliente(url)
+
+    reporte = {
+        "contexto": contexto(),
+        "parametros": {
+            "concurrencia": args.concurrencia, "requests": args.requests,
+            "requests_concatenar": args.requests_concatenar, "calentamiento": args.calentamiento,
+            "semilla": args.semilla, "servidor_levantado": args.levantar,
+        },
+        "datos": {k: v for k, v in manifiesto.items() if k != "consultas"},
+        "escenarios": {},
+    }
+    try:
+        for escenario in args.escenarios.split(","):
+            # Cada escenario con su propio generador: agregar o sacar uno no cambia los requests de los demás
+            rng = random.Random(f"{args.semilla}-{escenario}")
+            cantidad = args.requests_concatenar if escenario == "concatenar" else args.requests
+            try:
+                clip = preparar_clip(cliente, manifiesto) if escenario == "descargar" else None
+                requests = armar_requests(escenario, manifiesto, cantidad + args.calentamiento, rng, clip)
+                resultado = correr_escenario(cliente, requests, args.concurrencia, args.calentamiento)
+            except RuntimeError as e:
+                resultado = {"error": str(e)}
+            reporte["escenarios"][escenario] = resultado
+            print(f"{escenario}: {json.dumps(resultado)}", file=sys.stderr)
+    finally:
+        if servidor is not None:
+            servidor.terminate()
+            servidor.wait(timeout=30)
+        if directorio_trabajo is not None:
+            shutil.rmtree(directorio_trabajo, ignore_errors=True)
+
+    with open(args.salida, "w", encoding="utf-8") as f:
+        json.dump(reporte, f, indent=2, ensure_ascii=False)
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as f:
+            comparar(reporte, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
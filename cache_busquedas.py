@@ -0,0 +1,114 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+
+from backends_busqueda import normalizar_fecha
+from indice_invertido import tokenizar
+
+# Cache de páginas de /buscar delante del backend.
+# La clave es la consulta normalizada (los mismos tokens que usa el índice, así
+# "Inflación" e "inflacion" comparten entrada) más los filtros, el tamaño y el cursor.
+# Las entradas vencen a los `ttl` segundos y se desalojan las menos usadas por
+# encima de `capacidad`. Cuando entra una transcripción nueva se borran solo las
+# entradas a las que les podría cambiar el resultado: las de ese canal (o sin
+# filtro de canal) cuyo rango de fechas incluye el inicio de la transcripción.
+# Las consultas idénticas que llegan mientras la primera todavía está buscando
+# esperan ese mismo resultado en vez de ir al backend.
+
+
+class CacheBusquedas:
+    def __init__(self, capacidad: int = 1000, ttl: float = 60.0):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.aciertos = 0
+        self.fallos = 0
+        self.invalidadas = 0
+        # clave -> (vence, PaginaResultados), de la menos a la más usada
+        self._entradas = OrderedDict()
+        # clave -> Task de la búsqueda en curso
+        self._en_vuelo = {}
+
+    def __len__(self):
+        return len(self._entradas)
+
+    @staticmethod
+    def clave(palabra: str, canal=None, desde=None, hasta=None, tamanio=None, despues_de=None) -> tuple:
+        return (
+            " ".join(tokenizar(palabra)),
+            canal,
+            normalizar_fecha(desde),
+            normalizar_fecha(hasta),
+            tamanio,
+            # El cursor viene del cliente y puede traer cualquier JSON; como texto siempre es hasheable
+            json.dumps(despues_de) if despues_de is not None else None,
+        )
+
+    async def obtener(self, clave: tuple, buscar):
+        """
+        Args:
+            clave (tuple): La de CacheBusquedas.clave
+            buscar: Función async sin argumentos que consulta el backend si no hay entrada vigente
+        Returns:
+            PaginaResultados
+        """
+        entrada = self._entradas.get(clave)
+        if entrada is not None:
+            vence, pagina = entrada
+            if vence > time.monotonic():
+                self._entradas.move_to_end(clave)
+                self.aciertos += 1
+                return pagina
+            del self._entradas[clave]
+
+        tarea = self._en_vuelo.get(clave)
+        if tarea is None:
+            self.fallos += 1
+            tarea = asyncio.ensure_future(self._buscar_y_guardar(clave, buscar))
+            self._en_vuelo[clave] = tarea
+        else:
+            self.aciertos += 1
+        # shield: si el cliente que disparó la búsqueda se va, los demás igual reciben el resultado
+        return await asyncio.shield(tarea)
+
+    async def _buscar_y_guardar(self, clave: tuple, buscar):
+        try:
+            pagina = await buscar()
+        finally:
+            # Si mientras se buscaba se invalidó la clave, el resultado puede estar viejo: no se guarda
+            vigente = self._en_vuelo.get(clave) is asyncio.current_task()
+            if vigente:
+                del self._en_vuelo[clave]
+        if vigente:
+            self._guardar(clave, pagina)
+        return pagina
+
+    def _guardar(self, clave: tuple, pagina):
+        if self.capacidad <= 0:
+            return
+        self._entradas[clave] = (time.monotonic() + self.ttl, pagina)
+        self._entradas.move_to_end(clave)
+        while len(self._entradas) > self.capacidad:
+            self._entradas.popitem(last=False)
+
+    def invalidar(self, canal: str, start_timestamp: str):
+        """Borra las entradas cuyo resultado podría incluir una transcripción nueva de `canal` en `start_timestamp`."""
+        inicio = normalizar_fecha(start_timestamp)
+
+        def afectada(clave):
+            _, filtro_canal, desde, hasta, _, _ = clave
+            if filtro_canal is not None and filtro_canal != canal:
+                return False
+            if inicio is not None and ((desde is not None and inicio < desde) or (hasta is not None and inicio > hasta)):
+                return False
+            return True
+
+        for clave in [c for c in self._entradas if afectada(c)]:
+            del self._entradas[clave]
+            self.invalidadas += 1
+        for clave in [c for c in self._en_vuelo if afectada(c)]:
+            del self._en_vuelo[clave]
+
+    def vaciar(self):
+        self._entradas.clear()
+        self._en_vuelo.clear()
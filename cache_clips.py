@@ -0,0 +1,170 @@
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from estado_workers import proceso_vivo
+
+# Cache de clips direccionado por contenido.
+# El nombre del clip sale de un hash del canal, la lista ordenada de segmentos y
+# sus mtimes/tamaños: si alguien ya exportó exactamente lo mismo se devuelve ese
+# archivo. Los pedidos idénticos que llegan mientras el ffmpeg corre se cuelgan
+# del mismo trabajo (single-flight) y la carpeta se mantiene bajo un presupuesto
+# de bytes desalojando los clips usados hace más tiempo (LRU).
+# La cuenta sale de la carpeta y no de memoria, así vale para todos los workers de
+# servidor.py: cada uso de un clip le actualiza el atime (el mtime, del que sale el
+# ETag, no se toca), el desalojo ordena por atime, y registrar/desalojar/reservar van
+# bajo un flock sobre clips/.cache.lock. Quién está generando cada clip queda en
+# clips/en_curso_<clave>.json, para que otro worker espere ese trabajo en vez de
+# correr el mismo ffmpeg.
+
+PREFIJO_CLIP = "clip_"
+PREFIJO_RESERVA = "en_curso_"
+ARCHIVO_LOCK = ".cache.lock"
+
+logger = logging.getLogger(__name__)
+
+
+class CacheClips:
+    def __init__(self, directorio: str, presupuesto_bytes: int, extension: str = ".mp4"):
+        self.directorio = directorio
+        self.presupuesto_bytes = presupuesto_bytes
+        self.extension = extension
+        # clave -> Trabajo en curso en este worker (o el Future mientras se arma, ver main.encolar_con_cache)
+        self.en_vuelo = {}
+        self.aciertos = 0
+        self.fallos = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directorio, exist_ok=True)
+        # Lo que ocupaba clips/ la última vez que se contó
+        self._total_bytes = sum(tamanio for _, _, tamanio in self._clips())
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    @contextmanager
+    def _bloqueo(self):
+        # threading.Lock para los threads de este worker, flock para los demás workers
+        with self._lock, open(os.path.join(self.directorio, ARCHIVO_LOCK), "a") as archivo:
+            try:
+                import fcntl
+            except ImportError:
+                # Sin fcntl no hay fork ni varios workers (ver servidor.py)
+                yield
+                return
+            fcntl.flock(archivo, fcntl.LOCK_EX)
+            yield
+
+    def _clips(self) -> list:
+        """[(atime, nombre, tamaño)] de los clips en disco, del usado hace más tiempo al más reciente."""
+        clips = []
+        with os.scandir(self.directorio) as it:
+            for entrada in it:
+                if entrada.name.startswith(PREFIJO_CLIP) and entrada.name.endswith(self.extension):
+                    try:
+                        st = entrada.stat()
+                    except FileNotFoundError:
+                        continue
+                    clips.append((st.st_atime, entrada.name, st.st_size))
+        return sorted(clips)
+
+    def clave(self, canal: str, rutas: list[str], extra: str = "") -> str:
+        """
+        Hash de canal + segmentos en orden + mtime y tamaño de cada uno.
+        `extra` distingue clips hechos de los mismos segmentos (p. ej. los cortes de un recorte).
+        """
+        h = hashlib.sha256(canal.encode())
+        if extra:
+            h.update(f"\0{extra}".encode())
+        for ruta in rutas:
+            st = os.stat(ruta)
+            h.update(f"\0{os.path.basename(ruta)}\0{st.st_mtime_ns}\0{st.st_size}".encode())
+        return h.hexdigest()[:32]
+
+    def nombre_clip(self, clave: str) -> str:
+        return f"{PREFIJO_CLIP}{clave}{self.extension}"
+
+    def buscar(self, clave: str):
+        """Devuelve el nombre del clip si ya está generado (y lo marca como usado)."""
+        nombre = self.nombre_clip(clave)
+        if self.tocar(nombre):
+            self.aciertos += 1
+            return nombre
+        self.fallos += 1
+        return None
+
+    def tocar(self, nombre: str) -> bool:
+        """Marca el clip como recién usado. Returns: False si no existe."""
+        ruta = os.path.join(self.directorio, nombre)
+        try:
+            st = os.stat(ruta)
+            os.utime(ruta, ns=(time.time_ns(), st.st_mtime_ns))
+        except FileNotFoundError:
+            return False
+        return True
+
+    def registrar(self, nombre: str):
+        """Suma un clip recién generado y desaloja lo necesario para volver al presupuesto."""
+        self.tocar(nombre)
+        self.desalojar(protegido=nombre)
+
+    def desalojar(self, protegido: str = None):
+        with self._bloqueo():
+            clips = self._clips()
+            total = sum(tamanio for _, _, tamanio in clips)
+            for _, nombre, tamanio in clips:
+                if total <= self.presupuesto_bytes:
+                    break
+                if nombre == protegido:
+                    continue
+                # Si alguien lo está descargando en este momento, el fd abierto sigue siendo válido
+                logger.info("Desalojando clip por presupuesto de disco", extra={"clip": nombre})
+                try:
+                    os.remove(os.path.join(self.directorio, nombre))
+                except FileNotFoundError:
+                    pass
+                total -= tamanio
+            self._total_bytes = total
+
+    def _ruta_reserva(self, clave: str) -> str:
+        return os.path.join(self.directorio, f"{PREFIJO_RESERVA}{clave}.json")
+
+    def reservar(self, clave: str, trabajo_id: str, al_reservar=None):
+        """
+        Anota que este worker genera el clip `clave` con el trabajo `trabajo_id`.
+        `al_reservar` se llama con el lock tomado si quedó reservado: lo que haga (p. ej. guardar el
+        estado del trabajo) ya está hecho cuando otro worker ve la reserva.
+        Returns:
+            None si quedó reservado, o el id del trabajo de otro worker (vivo) que ya lo está generando
+        """
+        ruta = self._ruta_reserva(clave)
+        with self._bloqueo():
+            try:
+                with open(ruta, encoding="utf-8") as f:
+                    actual = json.load(f)
+            except (FileNotFoundError, ValueError):
+                actual = None
+            # Una reserva de este mismo pid es de una corrida anterior (pid reciclado)
+            if actual and actual["pid"] != os.getpid() and proceso_vivo(actual["pid"]):
+                return actual["trabajo"]
+            with open(ruta, "w", encoding="utf-8") as f:
+                json.dump({"pid": os.getpid(), "trabajo": trabajo_id}, f)
+            if al_reservar is not None:
+                al_reservar()
+        return None
+
+    def liberar(self, clave: str, trabajo_id: str):
+        """Borra la reserva de `clave` si sigue siendo la de `trabajo_id`."""
+        ruta = self._ruta_reserva(clave)
+        with self._bloqueo():
+            try:
+                with open(ruta, encoding="utf-8") as f:
+                    if json.load(f)["trabajo"] != trabajo_id:
+                        return
+                os.remove(ruta)
+            except (FileNotFoundError, ValueError):
+                pass
@@ -0,0 +1,347 @@
+import asyncio
+import calendar
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+
+from metricas import medir, refresco_catalogo
+
+# Catálogo en memoria de los segmentos .ts de cada canal.
+# Nombre de ejemplo: "a24_20250905_234106_20250905_234236.ts"
+# (canal, timestamp inicial, timestamp final). El nombre se parsea una sola vez
+# a epochs numéricos y los vecinos se buscan con bisect en vez de listdir + sort + index.
+# Un canal puede estar repartido en varias raíces (ver almacenamiento_segmentos.py):
+# cada Segmento sabe en qué archivo está, así nadie arma la ruta a mano.
+# Con CatalogoSegmentos.vigilar corriendo, los refrescos (stat y scandir de las
+# carpetas) se hacen en un thread en segundo plano y los requests solo leen la
+# lista en memoria, sin tocar el disco desde el loop.
+
+EXTENSION_SEGMENTO = ".ts"
+
+logger = logging.getLogger(__name__)
+
+
+def canal_valido(canal: str) -> bool:
+    """Un nombre de carpeta dentro de la raíz (ni vacío, ni "..", ni con separadores)."""
+    return (bool(canal) and os.path.basename(canal) == canal and canal not in (".", "..")
+            and (os.altsep is None or os.altsep not in canal))
+
+
+def parsear_fecha_archivo(fecha: str, hora: str) -> int:
+    """'20250905', '234106' -> epoch UTC (los timestamps de las transcripciones vienen en Z)."""
+    return calendar.timegm((
+        int(fecha[0:4]), int(fecha[4:6]), int(fecha[6:8]),
+        int(hora[0:2]), int(hora[2:4]), int(hora[4:6]), 0, 0, 0,
+    ))
+
+
+def iso_a_epoch(ts: str) -> int:
+    """'2025-09-12T12:07:30Z' -> epoch UTC."""
+    return calendar.timegm(time.strptime(ts, "%Y-%m-%dT%H:%M:%SZ"))
+
+
+def epoch_a_iso(epoch: int) -> str:
+    """epoch UTC -> '2025-09-12T12:07:30Z'"""
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(epoch))
+
+
+class Segmento:
+    __slots__ = ("nombre", "inicio", "fin", "ruta")
+
+    def __init__(self, nombre, inicio, fin, ruta=None):
+        self.nombre = nombre
+        self.inicio = inicio
+        self.fin = fin
+        # Archivo del segmento (cambia si se mueve de raíz)
+        self.ruta = ruta
+
+    @property
+    def duracion(self):
+        return self.fin - self.inicio
+
+    @classmethod
+    def desde_nombre(cls, nombre: str, directorio: str = None):
+        """Devuelve None si el archivo no respeta el formato canal_inicio_fin.ts"""
+        if not nombre.endswith(EXTENSION_SEGMENTO):
+            return None
+        # El canal puede tener "_" o "+", por eso se parte desde la derecha
+        partes = nombre[:-len(EXTENSION_SEGMENTO)].rsplit("_", 4)
+        if len(partes) != 5:
+            return None
+        try:
+            inicio = parsear_fecha_archivo(partes[1], partes[2])
+            fin = parsear_fecha_archivo(partes[3], partes[4])
+        except ValueError:
+            return None
+        return cls(nombre, inicio, fin, os.path.join(directorio, nombre) if directorio is not None else None)
+
+
+def contar_cortes(segmentos: list) -> list:
+    """Por cada segmento, cuántos cortes de grabación (un segmento que no empieza donde termina el anterior) hay hasta él."""
+    cortes, total = [], 0
+    for i, seg in enumerate(segmentos):
+        if i and seg.inicio != segmentos[i - 1].fin:
+            total += 1
+        cortes.append(total)
+    return cortes
+
+
+def _mtime_ns(directorio: str):
+    try:
+        return os.stat(directorio).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+
+class CatalogoCanal:
+    """
+    Segmentos de un canal ordenados por inicio. Se refresca por polling del mtime
+    de las carpetas: si no cambió ninguna no se lista nada, y si cambió alguna solo
+    se parsean los archivos nuevos.
+    """
+
+    def __init__(self, directorios, intervalo_refresco: float = 2.0):
+        """
+        Args:
+            directorios: La carpeta del canal, o una por raíz de almacenamiento (de la más nueva a la de archivo)
+        """
+        self.directorios = [directorios] if isinstance(directorios, str) else list(directorios)
+        self.intervalo_refresco = intervalo_refresco
+        self.segmentos = []
+        self._inicios = []
+        self._por_nombre = {}
+        # Número de secuencia HLS de segmentos[0] y, por segmento, cuántos cortes de grabación hay
+        # hasta él desde el principio de la numeración (ver secuencias)
+        self._base = 0
+        self._base_cortes = 0
+        self._cortes = []
+        self._mtime = None
+        self._ultimo_chequeo = 0.0
+        self._lock = threading.Lock()
+        # True si un vigilante refresca el catálogo (ver CatalogoSegmentos.vigilar)
+        self.en_segundo_plano = False
+
+    def refrescar(self, forzar: bool = False):
+        ahora = time.monotonic()
+        if not forzar:
+            # Con el vigilante, quien consulta solo lee las carpetas la primera vez
+            if self.en_segundo_plano and self._ultimo_chequeo:
+                return
+            if ahora - self._ultimo_chequeo < self.intervalo_refresco:
+                return
+        with self._lock:
+            try:
+                mtime = tuple(_mtime_ns(d) for d in self.directorios)
+                if all(m is None for m in mtime):
+                    self._reemplazar([])
+                    self._mtime = None
+                    return
+                if mtime == self._mtime:
+                    return
+                self._mtime = mtime
+                with medir("catalogo", refresco_catalogo):
+                    self._releer()
+            finally:
+                # Recién después de leer: quien llega mientras otro refresca espera el lock en vez de ver la lista vacía
+                self._ultimo_chequeo = ahora
+
+    def _releer(self):
+        # Se llama con el lock tomado
+        # nombre -> carpeta; si un archivo está en dos raíces (se está moviendo) gana la última,
+        # que es adonde va, así las lecturas nuevas ya no usan la copia que se va a borrar
+        nombres = {}
+        for directorio in self.directorios:
+            try:
+                with os.scandir(directorio) as it:
+                    for entrada in it:
+                        nombres[entrada.name] = directorio
+            except FileNotFoundError:
+                continue
+        nuevos = []
+        for nombre, directorio in nombres.items():
+            seg = self._por_nombre.get(nombre)
+            if seg is None:
+                seg = Segmento.desde_nombre(nombre, directorio)
+                if seg is not None:
+                    nuevos.append(seg)
+            elif os.path.dirname(seg.ruta) != directorio:
+                seg.ruta = os.path.join(directorio, nombre)
+
+        if any(n not in nombres for n in self._por_nombre):
+            # Se borraron (o movieron) archivos: se rearma la lista
+            vigentes = [s for s in self.segmentos if s.nombre in nombres]
+            self._reemplazar(sorted(vigentes + nuevos, key=lambda s: s.inicio))
+            return
+
+        nuevos.sort(key=lambda s: s.inicio)
+        if nuevos and self.segmentos and nuevos[0].inicio < self.segmentos[-1].inicio:
+            # Llegó algo fuera de orden (backfill), reordenamos todo
+            self._reemplazar(sorted(self.segmentos + nuevos, key=lambda s: s.inicio))
+        else:
+            # Caso típico: el grabador agrega segmentos al final
+            for seg in nuevos:
+                corte = bool(self.segmentos) and seg.inicio != self.segmentos[-1].fin
+                self._cortes.append(self._cortes[-1] + corte if self._cortes else 0)
+                self.segmentos.append(seg)
+                self._inicios.append(seg.inicio)
+                self._por_nombre[seg.nombre] = seg
+
+    def _reemplazar(self, segmentos):
+        cortes = contar_cortes(segmentos)
+        base = base_cortes = 0
+        # El primer segmento que sigue en la lista conserva su número: al borrarse los viejos la
+        # numeración sigue corriendo en vez de volver a empezar
+        posiciones = {s.nombre: j for j, s in enumerate(segmentos)}
+        for i, seg in enumerate(self.segmentos):
+            j = posiciones.get(seg.nombre)
+            if j is not None:
+                base = max(0, self._base + i - j)
+                base_cortes = max(0, self._base_cortes + self._cortes[i] - cortes[j])
+                break
+        self._base, self._base_cortes, self._cortes = base, base_cortes, cortes
+        self.segmentos = segmentos
+        self._inicios = [s.inicio for s in segmentos]
+        self._por_nombre = {s.nombre: s for s in segmentos}
+
+    def _secuencias(self, indice: int) -> tuple:
+        """
+        (EXT-X-MEDIA-SEQUENCE, EXT-X-DISCONTINUITY-SEQUENCE) de una playlist que arranca en segmentos[indice]:
+        el ordinal del segmento en el catálogo, que no cambia cuando se borran los anteriores, y los cortes
+        de grabación que quedaron atrás.
+        """
+        return self._base + indice, self._base_cortes + (self._cortes[indice] if indice < len(self._cortes) else 0)
+
+    def indice_de(self, instante: int):
+        """Índice del segmento que contiene el instante (o que arranca justo ahí), None si no hay."""
+        i = bisect_right(self._inicios, instante) - 1
+        if i < 0:
+            return None
+        if self.segmentos[i].inicio <= instante < self.segmentos[i].fin:
+            return i
+        return None
+
+    def ventana(self, inicio: int, fin: int, rango: int = 3):
+        """
+        Segmentos alrededor del que contiene [inicio, fin) y el nombre de ese segmento de referencia.
+        Si el inicio coincide exacto con un archivo se usa ese; si no, el que lo contiene.
+        """
+        self.refrescar()
+        return self._ventana(self.segmentos, self._inicios, inicio, fin, rango)
+
+    def ventanas(self, rangos: list, rango: int = 3) -> list:
+        """Como `ventana` para varios (inicio, fin) a la vez, refrescando y leyendo la lista una sola vez."""
+        self.refrescar()
+        segmentos, inicios = self.segmentos, self._inicios
+        return [self._ventana(segmentos, inicios, inicio, fin, rango) for inicio, fin in rangos]
+
+    def _ventana(self, segmentos, inicios, inicio: int, fin: int, rango: int):
+        i = bisect_left(inicios, inicio)
+        if not (i < len(segmentos) and segmentos[i].inicio == inicio and segmentos[i].fin == fin):
+            # Igual que indice_de, pero sobre la misma lista que el resto de la ventana
+            i = bisect_right(inicios, inicio) - 1
+            if i < 0 or not segmentos[i].inicio <= inicio < segmentos[i].fin:
+                return [], None
+        desde = max(0, i - rango)
+        hasta = min(len(segmentos), i + rango + 1)
+        return [s.nombre for s in segmentos[desde:hasta]], segmentos[i].nombre
+
+    def vecinos(self, inicio: int, fin: int, rango: int = 3) -> list[str]:
+        return self.ventana(inicio, fin, rango)[0]
+
+    def tramo(self, inicio: int, fin: int):
+        """Segmentos que se solapan con [inicio, fin) y los números de secuencia de la playlist (ver _secuencias)."""
+        self.refrescar()
+        segmentos = self.segmentos
+        desde = max(0, bisect_right(self._inicios, inicio) - 1)
+        if desde < len(segmentos) and segmentos[desde].fin <= inicio:
+            desde += 1
+        hasta = bisect_left(self._inicios, fin)
+        return segmentos[desde:hasta], self._secuencias(desde)
+
+    def rango(self, inicio: int, fin: int) -> list:
+        """Segmentos que se solapan con [inicio, fin)."""
+        return self.tramo(inicio, fin)[0]
+
+    def ultimos(self, cantidad: int):
+        """Los `cantidad` segmentos más nuevos y los números de secuencia de la playlist (ver _secuencias)."""
+        self.refrescar()
+        desde = max(0, len(self.segmentos) - cantidad)
+        return self.segmentos[desde:], self._secuencias(desde)
+
+    def obtener(self, nombre: str):
+        self.refrescar()
+        return self._por_nombre.get(nombre)
+
+    def ruta(self, nombre: str):
+        """Archivo del segmento `nombre`, en la raíz en la que esté, o None si el canal no lo tiene."""
+        seg = self.obtener(nombre)
+        return None if seg is None else seg.ruta
+
+
+class CatalogoSegmentos:
+    """Un CatalogoCanal por canal: la carpeta <raíz>/<canal> de cada raíz (por defecto solo canales/<canal>)."""
+
+    def __init__(self, base_dir="canales", intervalo_refresco: float = 2.0):
+        """
+        Args:
+            base_dir: Una raíz o una lista de raíces, de la más nueva a la de archivo
+        """
+        self.raices = [base_dir] if isinstance(base_dir, str) else list(base_dir)
+        self.intervalo_refresco = intervalo_refresco
+        self._canales = {}
+        self._lock = threading.Lock()
+        self.en_segundo_plano = False
+
+    def canal(self, canal: str) -> CatalogoCanal:
+        """
+        El catálogo del canal. Solo se guardan (y refresca el vigilante) los que tienen carpeta:
+        para un nombre inválido o un canal que no existe se devuelve uno vacío que no queda registrado.
+        """
+        catalogo = self._canales.get(canal)
+        if catalogo is None:
+            if not canal_valido(canal):
+                return CatalogoCanal([], self.intervalo_refresco)
+            directorios = [os.path.join(r, canal) for r in self.raices]
+            if not any(os.path.isdir(d) for d in directorios):
+                return CatalogoCanal(directorios, self.intervalo_refresco)
+            with self._lock:
+                catalogo = self._canales.get(canal)
+                if catalogo is None:
+                    catalogo = CatalogoCanal(directorios, self.intervalo_refresco)
+                    catalogo.en_segundo_plano = self.en_segundo_plano
+                    self._canales[canal] = catalogo
+        return catalogo
+
+    def canales(self) -> list:
+        """Canales con carpeta en alguna de las raíces."""
+        nombres = set()
+        for raiz in self.raices:
+            try:
+                with os.scandir(raiz) as it:
+                    nombres.update(e.name for e in it if e.is_dir())
+            except FileNotFoundError:
+                continue
+        return sorted(nombres)
+
+    def refrescar_todos(self):
+        """Refresca los canales con carpeta en alguna raíz y los que ya se consultaron."""
+        for canal in sorted(set(self.canales()) | set(self._canales)):
+            self.canal(canal).refrescar(forzar=True)
+
+    async def vigilar(self, intervalo: float):
+        """
+        Refresca todos los canales en un thread cada `intervalo` segundos. Desde la primera
+        vuelta los requests dejan de mirar las carpetas y leen lo que dejó el vigilante.
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self.refrescar_todos)
+                if not self.en_segundo_plano:
+                    self.en_segundo_plano = True
+                    for catalogo in list(self._canales.values()):
+                        catalogo.en_segundo_plano = True
+            except Exception:
+                logger.exception("Error refrescando el catálogo de segmentos")
+            await asyncio.sleep(intervalo)
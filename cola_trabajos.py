@@ -0,0 +1,331 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+import uuid
+from collections import deque
+
+from metricas import duracion_ffmpeg, procesos_ffmpeg
+
+# Cola de trabajos de ffmpeg.
+# Los requests no corren ffmpeg directamente: envían un Trabajo y un pool de
+# workers asyncio lo ejecuta con create_subprocess_exec, con un límite de
+# concurrencia, prioridades (menor número = más urgente) y cancelación.
+# El progreso sale de "-progress pipe:1" de ffmpeg.
+
+PENDIENTE = "pendiente"
+EN_CURSO = "en_curso"
+TERMINADO = "terminado"
+ERROR = "error"
+CANCELADO = "cancelado"
+
+ESTADOS_FINALES = (TERMINADO, ERROR, CANCELADO)
+
+logger = logging.getLogger(__name__)
+
+
+class Trabajo:
+    def __init__(self, cmd, salida=None, duracion_total=None, temporales=None, prioridad=0, al_terminar=None, previos=None,
+                 validar_previos=None):
+        """
+        Args:
+            cmd (list): Comando de ffmpeg (sin los flags de progreso, se agregan acá)
+            salida (str): Archivo que tiene que existir y no estar vacío al terminar
+            duracion_total (float): Segundos del resultado, para calcular el porcentaje
+            temporales (list): Archivos a borrar cuando el trabajo termina (pase lo que pase)
+            prioridad (int): Menor número = se atiende antes
+            al_terminar (callable): Se llama (en un thread) con el trabajo si ffmpeg terminó bien (p. ej. para renombrar la salida)
+            previos (list): Comandos que se corren en paralelo antes de `cmd` (p. ej. recodificar las puntas
+                de un recorte); si alguno falla, `cmd` no se corre
+            validar_previos (callable): Se llama (en un thread) cuando los previos terminaron bien; si devuelve
+                un texto, el trabajo falla con ese error y `cmd` no se corre
+        """
+        self.id = uuid.uuid4().hex
+        self.cmd = cmd
+        self.salida = salida
+        self.duracion_total = duracion_total
+        self.temporales = temporales or []
+        self.prioridad = prioridad
+        self.al_terminar = al_terminar
+        self.previos = previos or []
+        self.validar_previos = validar_previos
+        # Requests esperando este trabajo; se cancela solo si se van todos
+        self.interesados = 0
+        # Alguien lo sigue por /trabajos/{id}: ya no se cancela porque se corte un request, solo con DELETE
+        self.conservar = False
+        self.estado = PENDIENTE
+        self.progreso = 0.0
+        self.error = None
+        self.codigo_salida = None
+        self.creado = time.time()
+        self.iniciado = None
+        self.finalizado = None
+        self._proceso = None
+        self._procesos_previos = []
+        self._stderr = deque(maxlen=50)
+        self._terminado = asyncio.Event()
+        # RegistroTrabajos de la cola (con varios workers), y cuándo se le mandó el último progreso
+        self._registro = None
+        self._guardado = 0.0
+
+    @property
+    def archivo(self):
+        if self.estado == TERMINADO and self.salida:
+            return os.path.basename(self.salida)
+        return None
+
+    def a_dict(self):
+        return {
+            "trabajo": self.id,
+            "estado": self.estado,
+            "progreso": round(self.progreso, 3),
+            "prioridad": self.prioridad,
+            "archivo": self.archivo,
+            "error": self.error,
+        }
+
+    async def esperar(self):
+        await self._terminado.wait()
+        return self
+
+    def _guardar(self):
+        if self._registro is not None:
+            self._guardado = time.monotonic()
+            self._registro.guardar(self)
+
+    def _finalizar(self, estado, error=None):
+        self.estado = estado
+        self.error = error
+        self.finalizado = time.time()
+        if estado == TERMINADO:
+            self.progreso = 1.0
+        for temporal in self.temporales:
+            if os.path.exists(temporal):
+                logger.debug("Eliminando archivo temporal", extra={"archivo": temporal})
+                os.remove(temporal)
+        self._guardar()
+        self._terminado.set()
+
+
+def registrar_ffmpeg(segundos: float, codigo: int):
+    duracion_ffmpeg.observar(segundos, resultado="ok" if codigo == 0 else "error")
+    procesos_ffmpeg.inc(codigo=codigo)
+
+
+class ColaTrabajos:
+    def __init__(self, concurrencia: int = 2, retencion_segundos: float = 3600, niceness: int = 0, registro=None):
+        self.concurrencia = concurrencia
+        # Prioridad de CPU de los procesos (nice); >0 para trabajos de fondo que no deben frenar al resto
+        self.niceness = niceness
+        # Cuánto tiempo se recuerda un trabajo terminado para poder consultar su estado
+        self.retencion_segundos = retencion_segundos
+        # RegistroTrabajos (estado_workers.py) para que los otros workers vean y cancelen estos trabajos
+        self.registro = registro
+        self._atencion_registro = None
+        self._cola = None
+        self._workers = []
+        self._trabajos = {}
+        self._secuencia = itertools.count()
+
+    @property
+    def en_espera(self):
+        return sum(1 for t in self._trabajos.values() if t.estado == PENDIENTE)
+
+    @property
+    def en_curso(self):
+        return sum(1 for t in self._trabajos.values() if t.estado == EN_CURSO)
+
+    def _asegurar_workers(self):
+        # Los workers se crean la primera vez que se usa la cola, dentro del loop de uvicorn
+        if self._cola is None:
+            self._cola = asyncio.PriorityQueue()
+        if not self._workers:
+            self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrencia)]
+        if self.registro is not None and self._atencion_registro is None:
+            self._atencion_registro = asyncio.create_task(self._atender_registro())
+
+    def enviar(self, trabajo: Trabajo) -> Trabajo:
+        self._asegurar_workers()
+        self._purgar_viejos()
+        self._trabajos[trabajo.id] = trabajo
+        trabajo._registro = self.registro
+        trabajo._guardar()
+        self._cola.put_nowait((trabajo.prioridad, next(self._secuencia), trabajo))
+        return trabajo
+
+    def obtener(self, trabajo_id: str):
+        return self._trabajos.get(trabajo_id)
+
+    def cancelar(self, trabajo_id: str) -> bool:
+        trabajo = self._trabajos.get(trabajo_id)
+        if trabajo is None or trabajo.estado in ESTADOS_FINALES:
+            return False
+        if trabajo.estado == PENDIENTE:
+            # Queda en la cola pero el worker lo descarta al sacarlo
+            trabajo._finalizar(CANCELADO)
+        else:
+            # Si el ffmpeg todavía no arrancó (o está arrancando), _ejecutar ve el estado y no lo lanza o lo corta
+            trabajo.estado = CANCELADO
+            for proceso in [trabajo._proceso, *trabajo._procesos_previos]:
+                if proceso is not None and proceso.returncode is None:
+                    proceso.terminate()
+        return True
+
+    async def detener(self):
+        for trabajo in list(self._trabajos.values()):
+            self.cancelar(trabajo.id)
+        tareas = [*self._workers, *([self._atencion_registro] if self._atencion_registro else [])]
+        for tarea in tareas:
+            tarea.cancel()
+        await asyncio.gather(*tareas, return_exceptions=True)
+        self._workers = []
+        self._atencion_registro = None
+
+    def _purgar_viejos(self):
+        limite = time.time() - self.retencion_segundos
+        viejos = [i for i, t in self._trabajos.items() if t.finalizado and t.finalizado < limite]
+        for trabajo_id in viejos:
+            del self._trabajos[trabajo_id]
+
+    async def _atender_registro(self, intervalo: float = 1.0):
+        """Cancela los trabajos que se pidieron cancelar desde otro worker y purga los estados viejos."""
+        purgado = 0.0
+        while True:
+            await asyncio.sleep(intervalo)
+            try:
+                activos = [i for i, t in self._trabajos.items() if t.estado not in ESTADOS_FINALES]
+                if activos:
+                    for trabajo_id in await asyncio.to_thread(self.registro.cancelaciones, activos):
+                        logger.info("Trabajo cancelado desde otro worker", extra={"trabajo": trabajo_id})
+                        self.cancelar(trabajo_id)
+                if time.monotonic() - purgado > 60:
+                    purgado = time.monotonic()
+                    await asyncio.to_thread(self.registro.purgar, self.retencion_segundos)
+            except Exception:
+                logger.exception("Error atendiendo el registro de trabajos")
+
+    async def _worker(self):
+        while True:
+            _, _, trabajo = await self._cola.get()
+            try:
+                if trabajo.estado == PENDIENTE:
+                    await self._ejecutar(trabajo)
+            except Exception as e:
+                logger.exception("Error inesperado en el trabajo", extra={"trabajo": trabajo.id})
+                if trabajo.estado not in ESTADOS_FINALES:
+                    trabajo._finalizar(ERROR, f"Error inesperado: {e}")
+            finally:
+                self._cola.task_done()
+
+    def _comando(self, cmd: list) -> list:
+        # Con `nice` adelante y no con preexec_fn, que no es seguro con threads corriendo en el proceso
+        if self.niceness:
+            return ["nice", "-n", str(self.niceness), *cmd]
+        return list(cmd)
+
+    async def _correr_previos(self, trabajo: Trabajo) -> bool:
+        async def correr(cmd):
+            if trabajo.estado == CANCELADO:
+                return None
+            logger.info("Ejecutando ffmpeg", extra={"trabajo": trabajo.id, "comando": " ".join(cmd)})
+            inicio = time.monotonic()
+            proceso = await asyncio.create_subprocess_exec(
+                *self._comando(cmd), stdout=asyncio.subprocess.DEVNULL, stderr=asyncio.subprocess.PIPE,
+            )
+            trabajo._procesos_previos.append(proceso)
+            if trabajo.estado == CANCELADO:
+                # Se canceló mientras arrancaba: cancelar no lo llegó a ver
+                proceso.terminate()
+            # Solo interesan las últimas líneas, y solo si falla: no se junta todo en memoria
+            stderr = deque(maxlen=20)
+            async for linea in proceso.stderr:
+                stderr.append(linea.decode(errors="replace").rstrip())
+            await proceso.wait()
+            registrar_ffmpeg(time.monotonic() - inicio, proceso.returncode)
+            if proceso.returncode != 0:
+                trabajo._stderr.extend(stderr)
+            return proceso.returncode
+
+        codigos = await asyncio.gather(*(correr(cmd) for cmd in trabajo.previos))
+        fallidos = [c for c in codigos if c != 0]
+        if trabajo.estado == CANCELADO:
+            trabajo._finalizar(CANCELADO)
+            return False
+        if fallidos:
+            stderr = "\n".join(trabajo._stderr)
+            logger.error("FFmpeg falló", extra={"trabajo": trabajo.id, "codigo": fallidos[0], "stderr": stderr})
+            trabajo.codigo_salida = fallidos[0]
+            trabajo._finalizar(ERROR, f"FFmpeg falló: {stderr}")
+            return False
+        if trabajo.validar_previos is not None:
+            problema = await asyncio.to_thread(trabajo.validar_previos)
+            if problema:
+                logger.error("El resultado de los previos no sirve", extra={"trabajo": trabajo.id, "problema": problema})
+                trabajo._finalizar(ERROR, problema)
+                return False
+        return True
+
+    async def _ejecutar(self, trabajo: Trabajo):
+        trabajo.estado = EN_CURSO
+        trabajo.iniciado = time.time()
+        trabajo._guardar()
+        if trabajo.previos and not await self._correr_previos(trabajo):
+            return
+        cmd = list(trabajo.cmd)
+        # -progress va antes del nombre de salida (último argumento)
+        cmd[-1:-1] = ["-progress", "pipe:1", "-nostats"]
+        logger.info("Ejecutando ffmpeg", extra={"trabajo": trabajo.id, "comando": " ".join(cmd)})
+
+        if trabajo.estado == CANCELADO:
+            trabajo._finalizar(CANCELADO)
+            return
+        inicio = time.monotonic()
+        trabajo._proceso = await asyncio.create_subprocess_exec(
+            *self._comando(cmd),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        if trabajo.estado == CANCELADO:
+            # Se canceló mientras arrancaba: cancelar no lo llegó a ver
+            trabajo._proceso.terminate()
+        await asyncio.gather(
+            self._leer_progreso(trabajo),
+            self._leer_stderr(trabajo),
+        )
+        trabajo.codigo_salida = await trabajo._proceso.wait()
+        registrar_ffmpeg(time.monotonic() - inicio, trabajo.codigo_salida)
+
+        if trabajo.estado == CANCELADO:
+            if trabajo.salida and os.path.exists(trabajo.salida):
+                os.remove(trabajo.salida)
+            trabajo._finalizar(CANCELADO)
+        elif trabajo.codigo_salida != 0:
+            stderr = "\n".join(trabajo._stderr)
+            logger.error("FFmpeg falló", extra={"trabajo": trabajo.id, "codigo": trabajo.codigo_salida, "stderr": stderr})
+            trabajo._finalizar(ERROR, f"FFmpeg falló: {stderr}")
+        elif trabajo.salida and (not os.path.exists(trabajo.salida) or os.path.getsize(trabajo.salida) == 0):
+            logger.error("El archivo de salida no se creó correctamente", extra={"trabajo": trabajo.id, "archivo": trabajo.salida})
+            trabajo._finalizar(ERROR, "El archivo de salida no se generó correctamente")
+        else:
+            logger.info("Trabajo terminado", extra={"trabajo": trabajo.id, "segundos": round(time.time() - trabajo.iniciado, 3)})
+            if trabajo.al_terminar is not None:
+                await asyncio.to_thread(trabajo.al_terminar, trabajo)
+            trabajo._finalizar(TERMINADO)
+
+    async def _leer_progreso(self, trabajo: Trabajo):
+        # ffmpeg escribe bloques "clave=valor" y cierra cada uno con "progress=continue|end"
+        async for linea in trabajo._proceso.stdout:
+            clave, _, valor = linea.decode(errors="replace").strip().partition("=")
+            if clave == "out_time_us" and trabajo.duracion_total:
+                try:
+                    segundos = int(valor) / 1_000_000
+                except ValueError:
+                    continue
+                trabajo.progreso = max(0.0, min(0.99, segundos / trabajo.duracion_total))
+                if trabajo._registro is not None and time.monotonic() - trabajo._guardado >= 1:
+                    trabajo._guardar()
+
+    async def _leer_stderr(self, trabajo: Trabajo):
+        async for linea in trabajo._proceso.stderr:
+            trabajo._stderr.append(linea.decode(errors="replace").rstrip())
@@ -0,0 +1,134 @@
+"""
+Stand-in HTTP de Elasticsearch para desarrollo y pruebas locales, sin Docker.
+
+Implementa lo que usan ingesta_bulk.py y BackendElasticsearch: _bulk,
+_settings (refresh_interval), _refresh, _search y _msearch, guardando los documentos en un
+ElasticsearchFalso. Con --fallar-cada N devuelve 429 en uno de cada N documentos
+del _bulk, para ver que la ingesta reintente solo esos.
+
+    python elastic_falso_http.py --puerto 9200
+    python ingesta_bulk.py transcripciones.jsonl --url http://localhost:9200
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+from backends_busqueda import ElasticsearchFalso
+
+
+class ServidorElasticFalso(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, direccion, falso: ElasticsearchFalso = None, fallar_cada: int = 0):
+        super().__init__(direccion, ManejadorElasticFalso)
+        self.falso = falso or ElasticsearchFalso()
+        self.fallar_cada = fallar_cada
+        self.refresh_interval = {}
+        self.requests_bulk = 0
+        self._contador = itertools.count(1)
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def iniciar_en_thread(self):
+        hilo = threading.Thread(target=self.serve_forever, daemon=True)
+        hilo.start()
+        return hilo
+
+
+class ManejadorElasticFalso(BaseHTTPRequestHandler):
+    def log_message(self, formato, *args):
+        pass
+
+    def _responder(self, estado: int, cuerpo: dict):
+        datos = json.dumps(cuerpo).encode()
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _leer_cuerpo(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        partes = urlparse(self.path).path.strip("/").split("/")
+        if len(partes) >= 2 and partes[1] == "_settings":
+            indice = partes[0]
+            valor = self.server.refresh_interval.get(indice)
+            settings = {"settings": {"index": {"refresh_interval": valor}}} if valor else {
+                "settings": {}, "defaults": {"index": {"refresh_interval": "1s"}}}
+            return self._responder(200, {indice: settings})
+        if partes == [""]:
+            return self._responder(200, {"version": {"number": "falso"}, "tagline": "You Know, for Search"})
+        self._responder(404, {"error": "no soportado"})
+
+    def do_PUT(self):
+        partes = urlparse(self.path).path.strip("/").split("/")
+        if len(partes) == 2 and partes[1] == "_settings":
+            cuerpo = json.loads(self._leer_cuerpo() or b"{}")
+            self.server.refresh_interval[partes[0]] = cuerpo.get("index", {}).get("refresh_interval")
+            return self._responder(200, {"acknowledged": True})
+        self._responder(404, {"error": "no soportado"})
+
+    def do_POST(self):
+        partes = urlparse(self.path).path.strip("/").split("/")
+        if partes == ["_bulk"]:
+            return self._bulk()
+        if len(partes) == 2 and partes[1] == "_refresh":
+            return self._responder(200, {"_shards": {"failed": 0}})
+        if len(partes) == 2 and partes[1] == "_search":
+            cuerpo = json.loads(self._leer_cuerpo() or b"{}")
+            respuesta = asyncio.run(self.server.falso.search(
+                index=partes[0], query=cuerpo.get("query"), sort=cuerpo.get("sort"),
+                size=cuerpo.get("size", 10), source=cuerpo.get("_source"),
+            ))
+            return self._responder(200, respuesta)
+        if partes[-1] == "_msearch" and len(partes) <= 2:
+            # NDJSON: encabezado y cuerpo por búsqueda; el índice de la URL vale para los encabezados sin índice
+            lineas = [json.loads(l) for l in self._leer_cuerpo().decode("utf-8").split("\n") if l.strip()]
+            respuesta = asyncio.run(self.server.falso.msearch(
+                searches=lineas, index=partes[0] if len(partes) == 2 else None,
+            ))
+            return self._responder(200, respuesta)
+        self._responder(404, {"error": "no soportado"})
+
+    def _bulk(self):
+        lineas = [l for l in self._leer_cuerpo().decode("utf-8").split("\n") if l.strip()]
+        items = []
+        with self.server._lock:
+            self.server.requests_bulk += 1
+            for accion_json, doc_json in zip(lineas[0::2], lineas[1::2]):
+                accion = json.loads(accion_json)["index"]
+                numero = next(self.server._contador)
+                if self.server.fallar_cada and numero % self.server.fallar_cada == 0:
+                    items.append({"index": {"_id": accion["_id"], "status": 429,
+                                            "error": {"type": "es_rejected_execution_exception"}}})
+                    continue
+                asyncio.run(self.server.falso.index(index=accion["_index"], id=accion["_id"],
+                                                    document=json.loads(doc_json)))
+                items.append({"index": {"_id": accion["_id"], "status": 201, "result": "created"}})
+        errores = any(i["index"]["status"] >= 300 for i in items)
+        self._responder(200, {"took": 1, "errors": errores, "items": items})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in HTTP de Elasticsearch")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=9200)
+    parser.add_argument("--fallar-cada", type=int, default=0, help="Devuelve 429 en uno de cada N documentos")
+    args = parser.parse_args(argv)
+    servidor = ServidorElasticFalso((args.host, args.puerto), fallar_cada=args.fallar_cada)
+    print(f"Elasticsearch falso escuchando en {servidor.url}")
+    servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
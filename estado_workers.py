@@ -0,0 +1,302 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cola_trabajos import ESTADOS_FINALES, ERROR
+from metricas import combinar_exposiciones
+from transcripciones_mock import Transcripcion
+
+# Estado compartido entre los workers de servidor.py.
+# Cada worker es un proceso aparte y un request puede caer en cualquiera, así que
+# lo que tiene que verse igual desde todos pasa por una carpeta (ESTADO_WORKERS):
+#   trabajos/<id>.json       estado de cada trabajo de la cola de clips, lo escribe el worker que lo corre
+#   trabajos/<id>.cancelar   pedido de cancelación hecho desde otro worker
+#   trabajos/<id>.conservar  alguien lo sigue por /trabajos/{id} desde otro worker (no se cancela si se corta un request)
+#   metricas/<pid>.prom      la última exposición de métricas de cada worker
+#   transcripciones.jsonl    transcripciones que entraron por POST /transcripciones en cualquier worker
+# Con un solo proceso no se usa nada de esto.
+
+logger = logging.getLogger(__name__)
+
+ARCHIVO_TRANSCRIPCIONES = "transcripciones.jsonl"
+
+
+def proceso_vivo(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def escribir_atomico(ruta: str, contenido: str):
+    """Escribe a un temporal y renombra: quien lee nunca ve el archivo a medias."""
+    temporal = f"{ruta}.{uuid.uuid4().hex}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
+
+
+def preparar(directorio: str):
+    """Lo llama el proceso principal antes del fork: crea la carpeta y descarta lo de una corrida anterior."""
+    for sub in ("trabajos", "metricas"):
+        os.makedirs(os.path.join(directorio, sub), exist_ok=True)
+    with os.scandir(os.path.join(directorio, "metricas")) as it:
+        for entrada in it:
+            os.remove(entrada.path)
+    open(os.path.join(directorio, ARCHIVO_TRANSCRIPCIONES), "w").close()
+
+
+class TrabajoRemoto:
+    """Un trabajo que corre en otro worker, visto a través de su archivo de estado."""
+
+    def __init__(self, registro, datos: dict):
+        self.registro = registro
+        self.id = datos["trabajo"]
+        self.interesados = 0
+        self.conservar = False
+        self._actualizar(datos)
+
+    def _actualizar(self, datos: dict):
+        self._datos = datos
+        self.estado = datos["estado"]
+        self.archivo = datos.get("archivo")
+        self.error = datos.get("error")
+
+    def a_dict(self):
+        return {k: v for k, v in self._datos.items() if k not in ("pid", "actualizado")}
+
+    async def esperar(self, intervalo: float = 0.5):
+        while self.estado not in ESTADOS_FINALES:
+            await asyncio.sleep(intervalo)
+            datos = await asyncio.to_thread(self.registro.leer, self.id)
+            if datos is None:
+                # Se purgó sin que lo viéramos terminar
+                datos = {**self._datos, "estado": ERROR, "error": "Se perdió el estado del trabajo"}
+            self._actualizar(datos)
+        return self
+
+
+class RegistroTrabajos:
+    """
+    Estado de los trabajos de una ColaTrabajos en trabajos/<id>.json, para que
+    /trabajos/{id} responda en cualquier worker. Las escrituras van en orden por un
+    solo thread, así el loop no espera al disco y un progreso viejo nunca pisa el final.
+    """
+
+    def __init__(self, directorio: str):
+        self.directorio = os.path.join(directorio, "trabajos")
+        os.makedirs(self.directorio, exist_ok=True)
+        self._escritor = None
+
+    def _ruta(self, trabajo_id: str, extension: str = ".json") -> str:
+        # Los ids son hex de uuid4; cualquier otra cosa no puede ser un trabajo
+        if not trabajo_id.isalnum():
+            raise ValueError(f"id de trabajo inválido: {trabajo_id!r}")
+        return os.path.join(self.directorio, trabajo_id + extension)
+
+    def guardar(self, trabajo, sincronico: bool = False):
+        datos = {**trabajo.a_dict(), "pid": os.getpid(), "actualizado": time.time()}
+        if sincronico:
+            self._escribir(trabajo.id, datos)
+            return
+        if self._escritor is None:
+            # Se crea en el worker (los threads no sobreviven al fork)
+            self._escritor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="registro-trabajos")
+        self._escritor.submit(self._escribir, trabajo.id, datos)
+
+    def _escribir(self, trabajo_id: str, datos: dict):
+        try:
+            escribir_atomico(self._ruta(trabajo_id), json.dumps(datos))
+            if datos["estado"] in ESTADOS_FINALES:
+                self._borrar(self._ruta(trabajo_id, ".cancelar"))
+                self._borrar(self._ruta(trabajo_id, ".conservar"))
+        except OSError:
+            logger.exception("No se pudo guardar el estado del trabajo", extra={"trabajo": trabajo_id})
+
+    def leer(self, trabajo_id: str):
+        """El estado guardado, o None si no existe. Si el worker que lo corría murió, queda como error."""
+        try:
+            with open(self._ruta(trabajo_id), encoding="utf-8") as f:
+                datos = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if datos["estado"] not in ESTADOS_FINALES and not proceso_vivo(datos["pid"]):
+            datos.update(estado=ERROR, error="Se reinició el worker que corría el trabajo")
+        return datos
+
+    def remoto(self, trabajo_id: str):
+        datos = self.leer(trabajo_id)
+        return None if datos is None else TrabajoRemoto(self, datos)
+
+    def pedir_cancelacion(self, trabajo_id: str):
+        """
+        Deja el pedido para el worker que corre el trabajo (lo ve en un segundo, ver ColaTrabajos).
+        Returns:
+            TrabajoRemoto, o None si no existe o ya terminó
+        """
+        trabajo = self.remoto(trabajo_id)
+        if trabajo is None or trabajo.estado in ESTADOS_FINALES:
+            return None
+        open(self._ruta(trabajo_id, ".cancelar"), "w").close()
+        return trabajo
+
+    def conservar(self, trabajo_id: str):
+        """Marca que el trabajo (de otro worker) lo sigue alguien: solo se cancela con un pedido explícito."""
+        open(self._ruta(trabajo_id, ".conservar"), "w").close()
+
+    def se_conserva(self, trabajo_id: str) -> bool:
+        return os.path.exists(self._ruta(trabajo_id, ".conservar"))
+
+    def cancelaciones(self, trabajo_ids: list) -> list:
+        """Cuáles de estos trabajos tienen un pedido de cancelación (y lo consume)."""
+        pedidos = []
+        for trabajo_id in trabajo_ids:
+            ruta = self._ruta(trabajo_id, ".cancelar")
+            if os.path.exists(ruta):
+                self._borrar(ruta)
+                pedidos.append(trabajo_id)
+        return pedidos
+
+    def purgar(self, retencion_segundos: float):
+        """Borra los estados que no cambian hace más de `retencion_segundos` (de cualquier worker)."""
+        limite = time.time() - retencion_segundos
+        with os.scandir(self.directorio) as it:
+            for entrada in it:
+                try:
+                    if entrada.stat().st_mtime < limite:
+                        os.remove(entrada.path)
+                except FileNotFoundError:
+                    pass
+
+    @staticmethod
+    def _borrar(ruta: str):
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+
+
+class MetricasWorkers:
+    """Cada worker publica su exposición en metricas/<pid>.prom; /metrics las junta con la etiqueta worker."""
+
+    def __init__(self, directorio: str):
+        self.directorio = os.path.join(directorio, "metricas")
+        os.makedirs(self.directorio, exist_ok=True)
+
+    def publicar(self, texto: str):
+        escribir_atomico(os.path.join(self.directorio, f"{os.getpid()}.prom"), texto)
+
+    def combinar(self, propia: str) -> str:
+        """Publica la exposición de este worker y devuelve la de todos los vivos."""
+        self.publicar(propia)
+        exposiciones = {}
+        with os.scandir(self.directorio) as it:
+            for entrada in it:
+                pid, extension = os.path.splitext(entrada.name)
+                if extension != ".prom" or not pid.isdigit():
+                    continue
+                if not proceso_vivo(int(pid)):
+                    RegistroTrabajos._borrar(entrada.path)
+                    continue
+                try:
+                    with open(entrada.path, encoding="utf-8") as f:
+                        exposiciones[pid] = f.read()
+                except FileNotFoundError:
+                    pass
+        return combinar_exposiciones(exposiciones)
+
+    async def vigilar(self, exponer, intervalo: float = 5):
+        """Republica cada `intervalo` segundos, así el /metrics que atiende otro worker ve valores recientes."""
+        while True:
+            try:
+                texto = exponer()
+                await asyncio.to_thread(self.publicar, texto)
+            except Exception:
+                logger.exception("No se pudieron publicar las métricas del worker")
+            await asyncio.sleep(intervalo)
+
+
+class BusTranscripciones:
+    """
+    Las transcripciones que entran en un worker se anotan en transcripciones.jsonl y
+    los demás las van leyendo y aplicando (índice en memoria, cache de búsquedas y
+    suscripciones). Un worker que arranca tarde (p. ej. el reemplazo de uno que se cayó)
+    lee el archivo desde el principio, así su índice no queda atrás. Con `maximo_bytes`
+    el archivo se rota: sirve cuando el índice es compartido (Elasticsearch) y no hace
+    falta reaplicar lo viejo.
+    """
+
+    def __init__(self, directorio: str, maximo_bytes: int = None):
+        self.ruta = os.path.join(directorio, ARCHIVO_TRANSCRIPCIONES)
+        self.maximo_bytes = maximo_bytes
+
+    def publicar(self, transcripcion: Transcripcion, nueva: bool = True):
+        """`nueva` en False: reemplaza a una que ya estaba y no se avisa a las suscripciones."""
+        import fcntl
+
+        linea = json.dumps({
+            "pid": os.getpid(), "nueva": nueva, "id": transcripcion.id, "canal": transcripcion.canal, "texto": transcripcion.texto,
+            "start_timestamp": transcripcion.start_timestamp, "end_timestamp": transcripcion.end_timestamp,
+        }, ensure_ascii=False) + "\n"
+        while True:
+            with open(self.ruta, "ab") as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    rotado = os.fstat(f.fileno()).st_ino != os.stat(self.ruta).st_ino
+                except FileNotFoundError:
+                    rotado = True
+                if rotado:
+                    # Otro worker lo rotó mientras esperábamos el lock
+                    continue
+                if self.maximo_bytes and f.tell() > self.maximo_bytes:
+                    os.replace(self.ruta, self.ruta + ".1")
+                    continue
+                f.write(linea.encode())
+                return
+
+    def _leer(self, archivo) -> tuple:
+        """Las líneas completas nuevas y si el archivo se rotó (hay que pasar al nuevo)."""
+        datos = archivo.read()
+        try:
+            rotado = os.stat(self.ruta).st_ino != os.fstat(archivo.fileno()).st_ino
+        except FileNotFoundError:
+            rotado = True
+        if rotado:
+            # Lo que se escribió en el viejo justo antes de rotarlo
+            datos += archivo.read()
+        completas, _, resto = datos.rpartition(b"\n")
+        if resto and not rotado:
+            archivo.seek(-len(resto), os.SEEK_CUR)
+        return completas.splitlines(), rotado
+
+    async def seguir(self, aplicar, intervalo: float = 0.5):
+        """Llama a `aplicar(transcripcion, nueva)` (async) con cada transcripción que agregó otro worker."""
+        propio = os.getpid()
+        archivo = None
+        while True:
+            try:
+                if archivo is None:
+                    archivo = await asyncio.to_thread(open, self.ruta, "rb")
+                lineas, rotado = await asyncio.to_thread(self._leer, archivo)
+                if rotado:
+                    archivo.close()
+                    archivo = None
+                for linea in lineas:
+                    datos = json.loads(linea)
+                    nueva = datos.pop("nueva", True)
+                    if datos.pop("pid") != propio:
+                        await aplicar(Transcripcion(**datos), nueva)
+                if rotado:
+                    continue
+            except FileNotFoundError:
+                pass
+            except Exception:
+                logger.exception("Error leyendo las transcripciones de los otros workers")
+            await asyncio.sleep(intervalo)
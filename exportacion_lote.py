@@ -0,0 +1,77 @@
+import os
+import time
+import zipfile
+
+# Exportación de muchos resultados de búsqueda en un solo request.
+# Los hits (canal + rango + margen) se agrupan por canal y las ventanas que se
+# pisan se fusionan, así un segmento que aparece en varios hits se lee una sola
+# vez. Cada ventana resultante es un trabajo de la cola de ffmpeg, que ya limita
+# cuántos procesos corren a la vez.
+
+FORMATO_NOMBRE = "%Y%m%d_%H%M%S"
+
+
+class Ventana:
+    """Rango [inicio, fin) de un canal y los índices de los hits que cubre."""
+
+    __slots__ = ("canal", "inicio", "fin", "hits")
+
+    def __init__(self, canal, inicio, fin, hits):
+        self.canal = canal
+        self.inicio = inicio
+        self.fin = fin
+        self.hits = hits
+
+    @property
+    def nombre(self):
+        """'a24_20250905_234106_20250905_234536.mp4', como los de /exportar"""
+        desde = time.strftime(FORMATO_NOMBRE, time.gmtime(self.inicio))
+        hasta = time.strftime(FORMATO_NOMBRE, time.gmtime(self.fin))
+        return f"{self.canal}_{desde}_{hasta}.mp4"
+
+
+def agrupar_hits(hits: list, margen: int, catalogo=None) -> list:
+    """
+    Args:
+        hits (list): (canal, inicio, fin) en epochs
+        margen (int): Segundos que se agregan antes y después de cada hit
+        catalogo (CatalogoSegmentos): Si se pasa, cada ventana se extiende a los bordes de
+            sus segmentos antes de fusionar (exportando segmentos enteros, dos hits que
+            caen en el mismo segmento comparten ese segmento aunque sus rangos no se toquen)
+    Returns:
+        list: Ventanas fusionadas, ordenadas por canal e inicio. Los hits sin segmentos quedan afuera.
+    """
+    por_canal = {}
+    for i, (canal, inicio, fin) in enumerate(hits):
+        inicio, fin = inicio - margen, fin + margen
+        if catalogo is not None:
+            segmentos = catalogo.canal(canal).rango(inicio, fin)
+            if not segmentos:
+                continue
+            inicio, fin = segmentos[0].inicio, segmentos[-1].fin
+        por_canal.setdefault(canal, []).append((inicio, fin, i))
+
+    ventanas = []
+    for canal in sorted(por_canal):
+        actual = None
+        for inicio, fin, i in sorted(por_canal[canal]):
+            if actual is not None and inicio < actual.fin:
+                actual.fin = max(actual.fin, fin)
+                actual.hits.append(i)
+            else:
+                actual = Ventana(canal, inicio, fin, [i])
+                ventanas.append(actual)
+    return ventanas
+
+
+def armar_zip(destino: str, archivos: list):
+    """
+    Junta los clips en un .zip sin comprimir (los mp4 ya vienen comprimidos,
+    recomprimirlos solo gasta CPU).
+    Args:
+        archivos (list): (ruta, nombre dentro del zip)
+    """
+    with zipfile.ZipFile(destino, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+        for ruta, nombre in archivos:
+            zf.write(ruta, arcname=nombre)
+    return os.path.getsize(destino)
@@ -0,0 +1,127 @@
+import json
+import os
+import statistics
+import subprocess
+
+from metadatos_segmentos import comando_streams, parsear_streams, validar_concatenacion
+
+# Exportación con precisión de segundos (no de segmentos enteros).
+# Los [inicio, fin] pedidos se mapean a segmentos con los timestamps del nombre:
+# los segmentos cubiertos completos se copian tal cual (-c copy) y solo el
+# primero y el último, que quedan cortados, se recodifican. ffmpeg busca el
+# keyframe anterior al punto de corte (-ss antes de -i) y decodifica desde ahí,
+# así que el costo de CPU es a lo sumo dos pedazos de segmento, sin importar lo
+# largo que sea el clip.
+
+#
+# Para poder pegar las puntas con -c copy tienen que salir con los mismos parámetros
+# que los segmentos copiados: perfil, pix_fmt, fps, GOP y frecuencia y canales del
+# audio se sacan de los metadatos de ffprobe (metadatos_segmentos.py). Si no se pueden
+# reproducir (segmento sin analizar, codec sin encoder acá) se recodifica el clip entero
+# con CODEC_VIDEO/CODEC_AUDIO, y antes del concat se revisa con ffprobe que las puntas
+# hayan salido compatibles.
+
+# Calidad de lo que se recodifica
+CODEC_VIDEO = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "20"]
+CODEC_AUDIO = ["-c:a", "aac", "-b:a", "128k"]
+# Nombre del perfil según ffprobe -> -profile:v de libx264
+PERFILES_X264 = {
+    "Constrained Baseline": "baseline", "Baseline": "baseline", "Main": "main", "High": "high",
+    "High 10": "high10", "High 4:2:2": "high422", "High 4:4:4 Predictive": "high444",
+}
+
+
+class Tramo:
+    """Un pedazo del clip: un segmento entero (recodificar=False) o una parte de uno."""
+
+    __slots__ = ("segmento", "ruta", "desde", "hasta", "recodificar")
+
+    def __init__(self, segmento, ruta, desde, hasta):
+        """desde/hasta son segundos relativos al inicio del segmento."""
+        self.segmento = segmento
+        self.ruta = ruta
+        self.desde = desde
+        self.hasta = hasta
+        self.recodificar = desde > 0 or hasta < segmento.duracion
+
+    @property
+    def duracion(self):
+        return self.hasta - self.desde
+
+
+def planificar_recorte(catalogo_canal, inicio: int, fin: int) -> list:
+    """
+    Tramos que cubren [inicio, fin) (epochs), en orden.
+    Devuelve [] si no hay segmentos en ese rango.
+    """
+    tramos = []
+    for seg in catalogo_canal.rango(inicio, fin):
+        desde = max(inicio, seg.inicio) - seg.inicio
+        hasta = min(fin, seg.fin) - seg.inicio
+        if hasta > desde:
+            tramos.append(Tramo(seg, seg.ruta, desde, hasta))
+    return tramos
+
+
+def parametros_codificacion(detalle: dict):
+    """
+    Flags de ffmpeg para que lo recodificado se pueda pegar con -c copy al segmento de `detalle`
+    (MetadatosSegmentos.detalle: resumen más keyframes).
+    Returns:
+        list, o None si con esos metadatos no se sabe reproducir la codificación
+    """
+    if not detalle or detalle.get("error"):
+        return None
+    video, audio = detalle.get("video"), detalle.get("audio")
+    if (video is None or video.get("codec") != "h264" or video.get("perfil") not in PERFILES_X264
+            or not video.get("pix_fmt") or not video.get("fps")):
+        return None
+    flags = [*CODEC_VIDEO, "-profile:v", PERFILES_X264[video["perfil"]], "-pix_fmt", video["pix_fmt"], "-r", video["fps"]]
+    # GOP: la distancia típica entre keyframes del original, en cuadros
+    tiempos = [t for t, _ in detalle.get("keyframes") or []]
+    if len(tiempos) > 1:
+        numerador, _, denominador = video["fps"].partition("/")
+        fps = float(numerador) / float(denominador or 1)
+        gop = round(statistics.median(b - a for a, b in zip(tiempos, tiempos[1:])) * fps)
+        if gop > 0:
+            flags += ["-g", str(gop), "-keyint_min", str(gop), "-sc_threshold", "0"]
+    if audio is None:
+        return flags + ["-an"]
+    if audio.get("codec") != "aac" or not audio.get("frecuencia") or not audio.get("canales"):
+        return None
+    return flags + [*CODEC_AUDIO, "-ar", str(audio["frecuencia"]), "-ac", str(audio["canales"])]
+
+
+def comando_recodificar(ffmpeg_bin: str, tramo: Tramo, salida: str, codificacion: list = None) -> list:
+    """
+    Recorta y recodifica un tramo a MPEG-TS (arrancando desde el keyframe anterior a `desde`).
+    `codificacion` sale de parametros_codificacion; sin ella se usan CODEC_VIDEO y CODEC_AUDIO.
+    """
+    return [
+        ffmpeg_bin, "-y",
+        "-ss", f"{tramo.desde:.3f}", "-i", os.path.abspath(tramo.ruta),
+        "-t", f"{tramo.duracion:.3f}",
+        *(codificacion or [*CODEC_VIDEO, *CODEC_AUDIO]),
+        "-f", "mpegts", salida,
+    ]
+
+
+def validar_puntas(referencia: tuple, puntas: list, ffprobe_bin: str = "ffprobe"):
+    """
+    Revisa con ffprobe que las puntas recodificadas se puedan pegar con el segmento de referencia.
+    Args:
+        referencia (tuple): (nombre, resumen) de un segmento que se copia tal cual
+        puntas (list): rutas de las puntas ya generadas
+    Returns:
+        str: el problema, o None si están bien
+    """
+    metadatos = [referencia]
+    for punta in puntas:
+        proceso = subprocess.run(comando_streams(punta, ffprobe_bin), capture_output=True, text=True)
+        if proceso.returncode != 0:
+            return f"ffprobe no pudo leer la punta recodificada: {proceso.stderr.strip()}"
+        try:
+            metadatos.append((os.path.basename(punta), parsear_streams(json.loads(proceso.stdout))))
+        except ValueError as e:
+            return f"ffprobe no pudo leer la punta recodificada: {e}"
+    return validar_concatenacion(metadatos)
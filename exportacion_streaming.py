@@ -0,0 +1,67 @@
+from starlette.responses import Response
+
+from servir_archivos import abrir, enviar_archivo
+
+# Exportación sin transcodificar: los segmentos son MPEG-TS, que se pueden
+# concatenar byte a byte. En vez de pasar por ffmpeg y escribir un MP4 a disco,
+# se mandan los .ts uno detrás de otro directo en la respuesta HTTP.
+
+
+def nombre_exportacion(videos: list[str]) -> str:
+    """Canal + inicio del primer segmento + fin del último: 'a24_20250905_234106_20250905_234536.ts'"""
+    primero = videos[0][:-3].rsplit("_", 4)
+    ultimo = videos[-1][:-3].rsplit("_", 4)
+    if len(primero) != 5 or len(ultimo) != 5:
+        return "clip.ts"
+    return f"{primero[0]}_{primero[1]}_{primero[2]}_{ultimo[3]}_{ultimo[4]}.ts"
+
+
+class RespuestaSegmentosTS(Response):
+    """
+    Respuesta que concatena archivos .ts al vuelo.
+    El Content-Length se calcula de entrada con los tamaños de los archivos,
+    así el navegador muestra el progreso real de la descarga. Los archivos se abren
+    al armarla: uno que se borra o se rota después se sigue leyendo igual.
+    Raises:
+        FileNotFoundError: si falta alguno (todavía no se mandó nada, se puede responder 404)
+    """
+
+    media_type = "video/mp2t"
+
+    def __init__(self, rutas: list[str], filename: str, headers: dict = None):
+        self.archivos, self.tamanios = [], []
+        try:
+            for ruta in rutas:
+                archivo, st = abrir(ruta)
+                self.archivos.append(archivo)
+                self.tamanios.append(st.st_size)
+        except BaseException:
+            self._cerrar()
+            raise
+        self.status_code = 200
+        self.background = None
+        self.init_headers({
+            "Content-Length": str(sum(self.tamanios)),
+            "Content-Disposition": f"attachment; filename={filename}",
+            **(headers or {}),
+        })
+
+    def _cerrar(self):
+        for archivo in self.archivos:
+            archivo.close()
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            if scope["method"] == "HEAD":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+
+            for i, (archivo, tamanio) in enumerate(zip(self.archivos, self.tamanios)):
+                await enviar_archivo(scope, send, archivo, 0, tamanio, ultimo=i == len(self.archivos) - 1)
+        finally:
+            self._cerrar()
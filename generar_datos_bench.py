@@ -0,0 +1,172 @@
+"""
+Genera datos sintéticos para benchmark.py: N canales × M días de segmentos .ts
+con el nombre correcto (canal_inicio_fin.ts) y una transcripción por segmento.
+
+Todo sale de una semilla, así dos corridas con los mismos parámetros generan
+exactamente los mismos nombres y textos y los resultados son comparables entre commits.
+
+Modos de los segmentos:
+    disperso  archivos sparse de --tamanio-segmento bytes (no ocupan disco; sirven
+              para /videos, /buscar, /descargar y /segmentos pero ffmpeg no los puede leer)
+    clips     un clip MPEG-TS real diminuto generado una vez con ffmpeg (lavfi, sin red)
+              y enlazado (hardlink) como cada segmento; necesario para /concatenar
+
+    python generar_datos_bench.py /tmp/bench --canales 4 --dias 2 --modo clips
+    cd /tmp/bench && TRANSCRIPCIONES_JSONL=transcripciones.jsonl uvicorn main:app
+"""
+import argparse
+import calendar
+import itertools
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import time
+
+ARCHIVO_MANIFIESTO = "manifiesto.json"
+ARCHIVO_TRANSCRIPCIONES = "transcripciones.jsonl"
+FORMATO_NOMBRE = "%Y%m%d_%H%M%S"
+FORMATO_ISO = "%Y-%m-%dT%H:%M:%SZ"
+
+# Vocabulario de relleno; las primeras palabras salen mucho más seguido (tipo Zipf)
+VOCABULARIO = (
+    "el la de que y en los se del las un por con no una su para es al lo como más pero sus le ya o este "
+    "sí porque esta entre cuando muy sin sobre también me hasta hay donde quien desde todo nos durante "
+    "todos uno les ni contra otros ese eso ante ellos esto mí antes algunos qué unos yo otro otras otra "
+    "gobierno país presidente ministro economía inflación dólar elecciones congreso senado diputados "
+    "provincia ciudad justicia fiscal juez causa tribunal policía seguridad salud hospital escuela "
+    "docentes paro sindicato trabajadores salarios jubilados impuestos tarifas energía transporte tren "
+    "colectivo ruta clima lluvia temperatura tormenta alerta fútbol partido equipo gol campeonato torneo "
+    "selección entrenador jugador estadio hinchas mercado acciones bonos riesgo reservas banco central "
+    "exportaciones campo cosecha soja trigo ganadería industria empleo desempleo pobreza consumo ventas "
+    "precios supermercado combustible nafta gas petróleo minería litio vaca muerta inversión deuda fondo "
+    "monetario acuerdo negociación reunión anuncio conferencia entrevista declaraciones oposición oficialismo "
+    "campaña candidato encuesta votos boletas escrutinio resultado municipio intendente gobernador"
+).split()
+# Pesos 1/rango: pocas palabras muy comunes y una cola larga de raras
+PESOS_ACUMULADOS = list(itertools.accumulate(1 / (i + 1) for i in range(len(VOCABULARIO))))
+
+# Consultas que usa benchmark.py: palabras frecuentes, raras, prefijos y frases
+CONSULTAS = [
+    "gobierno", "inflación", "elecciones", "dólar", "ministro", "jubilados", "litio", "escrutinio",
+    "econ", "presid", "tribun", "banco central", "vaca muerta", "fondo monetario",
+]
+
+
+def iso(epoch: int) -> str:
+    return time.strftime(FORMATO_ISO, time.gmtime(epoch))
+
+
+def nombre_segmento(canal: str, inicio: int, fin: int) -> str:
+    return f"{canal}_{time.strftime(FORMATO_NOMBRE, time.gmtime(inicio))}_{time.strftime(FORMATO_NOMBRE, time.gmtime(fin))}.ts"
+
+
+def segmentos_de(manifiesto: dict, canal: str):
+    """Genera (nombre, inicio, fin) de cada segmento de `canal` según el manifiesto."""
+    inicio = manifiesto["inicio_epoch"]
+    duracion = manifiesto["duracion_segmento"]
+    for i in range(manifiesto["segmentos_por_canal"]):
+        desde = inicio + i * duracion
+        yield nombre_segmento(canal, desde, desde + duracion), desde, desde + duracion
+
+
+def generar_clip_base(ruta: str, duracion: int, ffmpeg_bin: str = "ffmpeg"):
+    """Clip MPEG-TS H.264/AAC diminuto (64x36, 5 fps) generado sin fuentes externas."""
+    cmd = [
+        ffmpeg_bin, "-y", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc=size=64x36:rate=5:duration={duracion}",
+        "-f", "lavfi", "-i", f"sine=frequency=440:duration={duracion}",
+        "-c:v", "libx264", "-preset", "ultrafast", "-g", "10",
+        "-c:a", "aac", "-b:a", "32k",
+        "-f", "mpegts", ruta,
+    ]
+    subprocess.run(cmd, check=True)
+
+
+def texto_aleatorio(rng: random.Random, palabras: int) -> str:
+    return " ".join(rng.choices(VOCABULARIO, cum_weights=PESOS_ACUMULADOS, k=palabras)).capitalize() + "."
+
+
+def generar(destino: str, canales: int = 4, dias: int = 1, duracion_segmento: int = 90, modo: str = "disperso",
+            tamanio_segmento: int = 2 * 1024 * 1024, palabras_por_transcripcion: int = 60, semilla: int = 42,
+            inicio: str = "2025-09-01T00:00:00Z") -> dict:
+    """
+    Returns:
+        dict: el manifiesto (también se guarda en destino/manifiesto.json)
+    """
+    rng = random.Random(semilla)
+    inicio_epoch = calendar.timegm(time.strptime(inicio, FORMATO_ISO))
+    manifiesto = {
+        "semilla": semilla,
+        "canales": [f"canal{i:02d}" for i in range(canales)],
+        "dias": dias,
+        "inicio": inicio,
+        "inicio_epoch": inicio_epoch,
+        "duracion_segmento": duracion_segmento,
+        "segmentos_por_canal": dias * 86400 // duracion_segmento,
+        "modo": modo,
+        "tamanio_segmento": tamanio_segmento,
+        "palabras_por_transcripcion": palabras_por_transcripcion,
+        "consultas": CONSULTAS,
+    }
+
+    base_canales = os.path.join(destino, "canales")
+    os.makedirs(base_canales, exist_ok=True)
+    clip_base = None
+    if modo == "clips":
+        if shutil.which("ffmpeg") is None:
+            raise RuntimeError("El modo clips necesita ffmpeg en el PATH")
+        clip_base = os.path.join(destino, "clip_base.ts")
+        generar_clip_base(clip_base, duracion_segmento)
+        manifiesto["tamanio_segmento"] = os.path.getsize(clip_base)
+
+    ruta_transcripciones = os.path.join(destino, ARCHIVO_TRANSCRIPCIONES)
+    with open(ruta_transcripciones, "w", encoding="utf-8") as salida:
+        for canal in manifiesto["canales"]:
+            carpeta = os.path.join(base_canales, canal)
+            os.makedirs(carpeta, exist_ok=True)
+            for nombre, desde, hasta in segmentos_de(manifiesto, canal):
+                ruta = os.path.join(carpeta, nombre)
+                if not os.path.exists(ruta):
+                    if clip_base is not None:
+                        os.link(clip_base, ruta)
+                    else:
+                        with open(ruta, "wb") as f:
+                            f.truncate(tamanio_segmento)
+                registro = {
+                    "canal": canal,
+                    "texto": texto_aleatorio(rng, palabras_por_transcripcion),
+                    "start_timestamp": iso(desde),
+                    "end_timestamp": iso(hasta),
+                }
+                salida.write(json.dumps(registro, ensure_ascii=False) + "\n")
+
+    manifiesto["transcripciones"] = canales * manifiesto["segmentos_por_canal"]
+    with open(os.path.join(destino, ARCHIVO_MANIFIESTO), "w", encoding="utf-8") as f:
+        json.dump(manifiesto, f, indent=2, ensure_ascii=False)
+    return manifiesto
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Datos sintéticos (segmentos + transcripciones) para benchmark.py")
+    parser.add_argument("destino")
+    parser.add_argument("--canales", type=int, default=4)
+    parser.add_argument("--dias", type=int, default=1)
+    parser.add_argument("--duracion-segmento", type=int, default=90)
+    parser.add_argument("--modo", choices=["disperso", "clips"], default="disperso")
+    parser.add_argument("--tamanio-segmento", type=int, default=2 * 1024 * 1024, help="Bytes de cada segmento disperso")
+    parser.add_argument("--palabras", type=int, default=60, help="Palabras por transcripción")
+    parser.add_argument("--semilla", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    manifiesto = generar(args.destino, args.canales, args.dias, args.duracion_segmento, args.modo,
+                         args.tamanio_segmento, args.palabras, args.semilla)
+    print(f"{len(manifiesto['canales'])} canales, {manifiesto['segmentos_por_canal']} segmentos por canal, "
+          f"{manifiesto['transcripciones']} transcripciones en {args.destino}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+import math
+from datetime import datetime, timezone
+from urllib.parse import quote
+
+# Playlists HLS (.m3u8) generadas al vuelo sobre el catálogo de segmentos.
+# Los .ts que ya graba el canal sirven tal cual como segmentos HLS, solo hay que
+# listarlos con su duración (sale del nombre del archivo). Así el reproductor
+# arranca con el primer segmento y pasa de uno a otro sin recargar el <video>.
+
+MEDIA_TYPE_M3U8 = "application/vnd.apple.mpegurl"
+
+
+def _fecha_programa(epoch: int) -> str:
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+
+
+def armar_playlist(canal: str, segmentos: list, primera_secuencia: int = 0, discontinuidades: int = 0, vivo: bool = False,
+                   prefijo_url: str = "/segmentos", calidades: list = None, duraciones: list = None) -> str:
+    """
+    Args:
+        segmentos (list): Segmento del catálogo, ordenados por inicio
+        primera_secuencia (int): Ordinal del primer segmento en el catálogo (EXT-X-MEDIA-SEQUENCE); los demás siguen de a uno
+        discontinuidades (int): Cortes de grabación anteriores al primer segmento (EXT-X-DISCONTINUITY-SEQUENCE)
+        vivo (bool): Sin EXT-X-ENDLIST, el reproductor vuelve a pedir la playlist
+        prefijo_url (str): Endpoint que sirve los segmentos (con Range y cache)
+        calidades (list): "proxy" u "original" para cada segmento (se agrega ?calidad= a la URL);
+            donde cambia la calidad hay una discontinuidad, porque cambian resolución y codificación
+        duraciones (list): Duración real de cada segmento (None donde no se sabe: se usa la del nombre)
+    """
+    duraciones = [d or s.duracion for d, s in zip(duraciones, segmentos)] if duraciones else [s.duracion for s in segmentos]
+    duracion_maxima = max(duraciones, default=0)
+    lineas = [
+        "#EXTM3U",
+        "#EXT-X-VERSION:3",
+        f"#EXT-X-TARGETDURATION:{max(1, math.ceil(duracion_maxima))}",
+        f"#EXT-X-MEDIA-SEQUENCE:{primera_secuencia}",
+        f"#EXT-X-DISCONTINUITY-SEQUENCE:{discontinuidades}",
+    ]
+    if not vivo:
+        lineas.append("#EXT-X-PLAYLIST-TYPE:VOD")
+
+    anterior = None
+    for i, seg in enumerate(segmentos):
+        # Si falta un pedazo de grabación entre dos segmentos, el reproductor tiene que saberlo
+        if anterior is not None and (seg.inicio != anterior.fin or (calidades and calidades[i] != calidades[i - 1])):
+            lineas.append("#EXT-X-DISCONTINUITY")
+        lineas.append(f"#EXT-X-PROGRAM-DATE-TIME:{_fecha_programa(seg.inicio)}")
+        lineas.append(f"#EXTINF:{duraciones[i]:.3f},")
+        url = f"{prefijo_url}/{quote(canal)}/{quote(seg.nombre)}"
+        lineas.append(f"{url}?calidad={calidades[i]}" if calidades else url)
+        anterior = seg
+
+    if not vivo:
+        lineas.append("#EXT-X-ENDLIST")
+    return "\n".join(lineas) + "\n"
@@ -0,0 +1,183 @@
+import html
+import re
+import unicodedata
+from bisect import bisect_left
+
+# Índice invertido en memoria para las transcripciones.
+# La idea es imitar lo que hace el "spanish_analyzer" de mapping_elastic.py:
+# minúsculas, sacar tildes (asciifolding) y, opcionalmente, un stemming liviano.
+# Así /buscar no tiene que recorrer todo el corpus en cada request.
+
+PATRON_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+
+def plegar_acentos(texto: str) -> str:
+    """Pasa a minúsculas y saca tildes/diéresis (á -> a, ñ -> n, ü -> u)."""
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def stem_liviano(token: str) -> str:
+    """
+    Port del "light_spanish" stemmer de Lucene (el que usa Elasticsearch).
+    Solo saca plurales y terminaciones de género, nada agresivo.
+    """
+    n = len(token)
+    if n < 5:
+        return token
+    ultima = token[-1]
+    if ultima in "oae":
+        return token[:-1]
+    if ultima == "s":
+        if token.endswith("eses"):
+            return token[:-2]
+        if token.endswith("ces"):
+            return token[:-3] + "z"
+        if token[-2] in "oae":
+            return token[:-2]
+    return token
+
+
+def tokenizar(texto: str, stemming: bool = False) -> list[str]:
+    """Normaliza un texto y lo parte en tokens, en el orden en que aparecen."""
+    tokens = PATRON_TOKEN.findall(plegar_acentos(texto))
+    if stemming:
+        tokens = [stem_liviano(t) for t in tokens]
+    return tokens
+
+
+class IndiceInvertido:
+    """
+    Posting lists con posiciones: termino -> {doc_id: [posiciones]}.
+    Soporta búsqueda por prefijo (un término) y por frase (varios términos,
+    el último se toma como prefijo para que se pueda buscar mientras se tipea).
+    """
+
+    def __init__(self, stemming: bool = False):
+        self.stemming = stemming
+        self._postings = {}
+        # Vocabulario ordenado para resolver prefijos con bisect.
+        # Se reordena de forma perezosa cuando entran términos nuevos.
+        self._vocabulario = []
+        self._vocabulario_sucio = False
+
+    def __len__(self):
+        return len(self._postings)
+
+    def agregar(self, doc_id: int, texto: str):
+        """Indexa (o agrega incrementalmente) un documento."""
+        for posicion, token in enumerate(tokenizar(texto, self.stemming)):
+            docs = self._postings.get(token)
+            if docs is None:
+                docs = self._postings[token] = {}
+                self._vocabulario_sucio = True
+            docs.setdefault(doc_id, []).append(posicion)
+
+    def quitar(self, doc_id: int, texto: str):
+        """Saca un documento indexado con `texto` (p. ej. para reindexarlo con otro)."""
+        for token in set(tokenizar(texto, self.stemming)):
+            docs = self._postings.get(token)
+            if docs is None:
+                continue
+            docs.pop(doc_id, None)
+            if not docs:
+                del self._postings[token]
+                self._vocabulario_sucio = True
+
+    def _terminos_con_prefijo(self, prefijo: str) -> list[str]:
+        if self._vocabulario_sucio:
+            self._vocabulario = sorted(self._postings)
+            self._vocabulario_sucio = False
+        terminos = []
+        i = bisect_left(self._vocabulario, prefijo)
+        while i < len(self._vocabulario) and self._vocabulario[i].startswith(prefijo):
+            terminos.append(self._vocabulario[i])
+            i += 1
+        return terminos
+
+    def buscar_prefijo(self, prefijo: str) -> dict:
+        """Devuelve {doc_id: [posiciones]} de todos los términos que empiezan con el prefijo."""
+        terminos = self._terminos_con_prefijo(prefijo)
+        if len(terminos) == 1:
+            return self._postings[terminos[0]]
+        resultado = {}
+        for termino in terminos:
+            for doc_id, posiciones in self._postings[termino].items():
+                resultado.setdefault(doc_id, []).extend(posiciones)
+        return resultado
+
+    def buscar_frase(self, tokens: list[str]) -> set:
+        """
+        Documentos donde los tokens aparecen consecutivos.
+        Los primeros tokens tienen que coincidir exacto, el último por prefijo.
+        """
+        if not tokens:
+            return set()
+        listas = [self._postings.get(t, {}) for t in tokens[:-1]]
+        listas.append(self.buscar_prefijo(tokens[-1]))
+        # Arrancamos por la posting list más corta para cortar rápido
+        candidatos = set(min(listas, key=len))
+        for lista in listas:
+            candidatos.intersection_update(lista)
+            if not candidatos:
+                return set()
+        if len(tokens) == 1:
+            return candidatos
+
+        encontrados = set()
+        for doc_id in candidatos:
+            inicios = set(listas[0][doc_id])
+            for desplazamiento, lista in enumerate(listas[1:], start=1):
+                posiciones = set(lista[doc_id])
+                inicios = {p for p in inicios if p + desplazamiento in posiciones}
+                if not inicios:
+                    break
+            if inicios:
+                encontrados.add(doc_id)
+        return encontrados
+
+    def buscar(self, consulta: str) -> set:
+        """Normaliza la consulta igual que los documentos y resuelve la frase."""
+        return self.buscar_frase(tokenizar(consulta, self.stemming))
+
+
+def resaltar(texto: str, consulta: str, ancho: int = 160, stemming: bool = False) -> str:
+    """
+    Fragmento de ~`ancho` caracteres alrededor de la primera aparición de la consulta,
+    con el match entre <em></em> (el resto del texto va escapado como HTML).
+    Si no se encuentra el match se devuelve el principio del texto.
+    """
+    buscados = tokenizar(consulta, stemming)
+    palabras = list(PATRON_TOKEN.finditer(texto))
+    normalizadas = tokenizar(" ".join(m.group() for m in palabras), stemming)
+
+    inicio_match = fin_match = None
+    n = len(buscados)
+    if n and len(normalizadas) == len(palabras):
+        for i in range(len(normalizadas) - n + 1):
+            if normalizadas[i:i + n - 1] == buscados[:-1] and normalizadas[i + n - 1].startswith(buscados[-1]):
+                inicio_match, fin_match = palabras[i].start(), palabras[i + n - 1].end()
+                break
+
+    if inicio_match is None:
+        recorte = texto[:ancho]
+        return html.escape(recorte) + ("…" if len(texto) > ancho else "")
+
+    # Centramos la ventana en el match y la cortamos en bordes de palabra
+    margen = max(0, (ancho - (fin_match - inicio_match)) // 2)
+    desde = max(0, inicio_match - margen)
+    hasta = min(len(texto), fin_match + margen)
+    if desde > 0:
+        espacio = texto.find(" ", desde, inicio_match)
+        desde = espacio + 1 if espacio != -1 else desde
+    if hasta < len(texto):
+        espacio = texto.rfind(" ", fin_match, hasta)
+        hasta = espacio if espacio != -1 else hasta
+
+    return "".join((
+        "…" if desde > 0 else "",
+        html.escape(texto[desde:inicio_match]),
+        "<em>", html.escape(texto[inicio_match:fin_match]), "</em>",
+        html.escape(texto[fin_match:hasta]),
+        "…" if hasta < len(texto) else "",
+    ))
@@ -0,0 +1,252 @@
+"""
+Ingesta masiva de transcripciones al índice streaming_tv usando la API _bulk.
+
+Lee registros JSONL (de archivos o de stdin) y los manda en lotes en paralelo,
+con un tope de lotes en vuelo para no llenar la memoria si Elasticsearch va más
+lento que la lectura. Solo se reintentan los documentos que fallaron (429/5xx),
+y el _id es determinístico, así que volver a correr la misma ingesta no duplica nada.
+
+Ejemplos:
+    python ingesta_bulk.py transcripciones.jsonl
+    cat *.jsonl | python ingesta_bulk.py - --paralelismo 8 --backfill
+"""
+import argparse
+import hashlib
+import json
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from backends_busqueda import INDICE_ES, CAMPO_CANAL, CAMPO_TEXTO, CAMPO_INICIO, CAMPO_FIN, CAMPO_ID, documento_a_transcripcion
+
+# Códigos por los que vale la pena reintentar un documento
+ESTADOS_REINTENTABLES = {429, 502, 503, 504}
+
+
+def leer_registros(rutas: list[str]):
+    """Genera un dict por línea JSON. "-" es stdin."""
+    for ruta in rutas:
+        archivo = sys.stdin if ruta == "-" else open(ruta, encoding="utf-8")
+        try:
+            for numero, linea in enumerate(archivo, start=1):
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    yield json.loads(linea)
+                except json.JSONDecodeError as e:
+                    print(f"Línea inválida en {ruta}:{numero}: {e}", file=sys.stderr)
+        finally:
+            if archivo is not sys.stdin:
+                archivo.close()
+
+
+def registro_a_documento(registro: dict) -> dict:
+    """
+    Acepta tanto registros con los nombres de Transcripcion (canal, texto, start_timestamp...)
+    como con los del mapping (channel, text, datetime...). El resto de los campos pasa tal cual.
+    """
+    doc = dict(registro)
+    for origen, destino in (("canal", CAMPO_CANAL), ("texto", CAMPO_TEXTO),
+                            ("start_timestamp", CAMPO_INICIO), ("end_timestamp", CAMPO_FIN)):
+        if origen in doc:
+            doc.setdefault(destino, doc.pop(origen))
+    doc.pop("id", None)
+    return doc
+
+
+def leer_transcripciones(rutas: list[str]):
+    """Los mismos registros como Transcripcion, para cargarlos en BackendMemoria sin pasar por Elasticsearch."""
+    for i, registro in enumerate(leer_registros(rutas)):
+        yield documento_a_transcripcion(i, registro_a_documento(registro))
+
+
+def id_documento(doc: dict) -> str:
+    """Mismo canal + mismo inicio + mismo fin = mismo documento, aunque se reingeste."""
+    clave = f"{doc.get(CAMPO_CANAL)}|{doc.get(CAMPO_INICIO)}|{doc.get(CAMPO_FIN)}"
+    return hashlib.sha1(clave.encode()).hexdigest()
+
+
+def armar_cuerpo_bulk(indice: str, documentos: list) -> bytes:
+    lineas = []
+    for doc_id, doc in documentos:
+        lineas.append(json.dumps({"index": {"_index": indice, "_id": doc_id}}))
+        lineas.append(json.dumps(doc, ensure_ascii=False))
+    return ("\n".join(lineas) + "\n").encode("utf-8")
+
+
+class IngestaBulk:
+    def __init__(self, url: str, indice: str = INDICE_ES, tamanio_lote: int = 500, paralelismo: int = 4,
+                 reintentos: int = 3, timeout: float = 30.0):
+        """
+        Args:
+            tamanio_lote (int): Documentos por request _bulk
+            paralelismo (int): Requests _bulk simultáneos
+            reintentos (int): Veces que se reintenta un documento que falló con 429/5xx
+        """
+        self.url = url.rstrip("/")
+        self.indice = indice
+        self.tamanio_lote = tamanio_lote
+        self.paralelismo = paralelismo
+        self.reintentos = reintentos
+        self.timeout = timeout
+        self.indexados = 0
+        self.fallidos = 0
+        self.reintentados = 0
+        self._lock = threading.Lock()
+
+    def _request(self, metodo: str, ruta: str, cuerpo: bytes = None, content_type: str = "application/json"):
+        req = urllib.request.Request(f"{self.url}{ruta}", data=cuerpo, method=metodo)
+        if cuerpo is not None:
+            req.add_header("Content-Type", content_type)
+        with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+            return json.loads(resp.read() or b"{}")
+
+    def refresh_interval(self):
+        respuesta = self._request("GET", f"/{self.indice}/_settings/index.refresh_interval?include_defaults=true")
+        settings = respuesta.get(self.indice, {})
+        for seccion in ("settings", "defaults"):
+            valor = settings.get(seccion, {}).get("index", {}).get("refresh_interval")
+            if valor:
+                return valor
+        return "1s"
+
+    def set_refresh_interval(self, valor):
+        cuerpo = json.dumps({"index": {"refresh_interval": valor}}).encode()
+        self._request("PUT", f"/{self.indice}/_settings", cuerpo)
+
+    def refrescar(self):
+        self._request("POST", f"/{self.indice}/_refresh")
+
+    def _enviar_lote(self, documentos: list):
+        """Manda un lote y reintenta con backoff solo los documentos que fallaron por carga."""
+        pendientes = documentos
+        for intento in range(self.reintentos + 1):
+            try:
+                respuesta = self._request("POST", "/_bulk", armar_cuerpo_bulk(self.indice, pendientes),
+                                          content_type="application/x-ndjson")
+            except urllib.error.HTTPError as e:
+                # El request entero falló (p. ej. 429 del nodo): se reintenta todo el lote
+                if e.code not in ESTADOS_REINTENTABLES or intento == self.reintentos:
+                    self._sumar(fallidos=len(pendientes))
+                    print(f"Lote de {len(pendientes)} documentos rechazado: HTTP {e.code}", file=sys.stderr)
+                    return
+                self._sumar(reintentados=len(pendientes))
+                time.sleep(min(30, 0.5 * 2 ** intento))
+                continue
+            except (urllib.error.URLError, TimeoutError) as e:
+                if intento == self.reintentos:
+                    self._sumar(fallidos=len(pendientes))
+                    print(f"Lote de {len(pendientes)} documentos perdido: {e}", file=sys.stderr)
+                    return
+                self._sumar(reintentados=len(pendientes))
+                time.sleep(min(30, 0.5 * 2 ** intento))
+                continue
+
+            reintentar = []
+            ok = 0
+            for (doc_id, doc), item in zip(pendientes, respuesta.get("items", [])):
+                resultado = next(iter(item.values()))
+                estado = resultado.get("status", 500)
+                if estado < 300:
+                    ok += 1
+                elif estado in ESTADOS_REINTENTABLES and intento < self.reintentos:
+                    reintentar.append((doc_id, doc))
+                else:
+                    self._sumar(fallidos=1)
+                    print(f"Documento {doc_id} rechazado ({estado}): {resultado.get('error')}", file=sys.stderr)
+            self._sumar(indexados=ok, reintentados=len(reintentar))
+            if not reintentar:
+                return
+            pendientes = reintentar
+            time.sleep(min(30, 0.5 * 2 ** intento))
+
+    def _sumar(self, indexados=0, fallidos=0, reintentados=0):
+        with self._lock:
+            self.indexados += indexados
+            self.fallidos += fallidos
+            self.reintentados += reintentados
+
+    def ingestar(self, registros, backfill: bool = False, intervalo_reporte: float = 5.0) -> dict:
+        """
+        Args:
+            registros: Iterable de dicts (p. ej. leer_registros(...))
+            backfill (bool): Desactiva el refresh del índice mientras dura la carga y lo restaura al final
+        Returns:
+            dict: indexados, fallidos, reintentados, segundos y docs_por_segundo
+        """
+        refresh_original = None
+        if backfill:
+            refresh_original = self.refresh_interval()
+            self.set_refresh_interval("-1")
+
+        inicio = time.monotonic()
+        ultimo_reporte = inicio
+        # Tope de lotes en vuelo: si Elasticsearch no da abasto la lectura se frena acá
+        en_vuelo = threading.BoundedSemaphore(self.paralelismo * 2)
+
+        def enviar(lote):
+            try:
+                self._enviar_lote(lote)
+            except Exception as e:
+                self._sumar(fallidos=len(lote))
+                print(f"Error inesperado mandando un lote: {e}", file=sys.stderr)
+            finally:
+                en_vuelo.release()
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.paralelismo) as pool:
+                lote = []
+                for registro in registros:
+                    doc = registro_a_documento(registro)
+                    doc[CAMPO_ID] = id_documento(doc)
+                    lote.append((doc[CAMPO_ID], doc))
+                    if len(lote) >= self.tamanio_lote:
+                        en_vuelo.acquire()
+                        pool.submit(enviar, lote)
+                        lote = []
+                    ahora = time.monotonic()
+                    if ahora - ultimo_reporte >= intervalo_reporte:
+                        ultimo_reporte = ahora
+                        print(f"{self.indexados} documentos ({self.indexados / (ahora - inicio):.0f} docs/s)", file=sys.stderr)
+                if lote:
+                    en_vuelo.acquire()
+                    pool.submit(enviar, lote)
+        finally:
+            if backfill:
+                self.set_refresh_interval(refresh_original)
+                self.refrescar()
+
+        segundos = time.monotonic() - inicio
+        return {
+            "indexados": self.indexados,
+            "fallidos": self.fallidos,
+            "reintentados": self.reintentados,
+            "segundos": round(segundos, 3),
+            "docs_por_segundo": round(self.indexados / segundos, 1) if segundos else 0.0,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingesta masiva de transcripciones a Elasticsearch (_bulk)")
+    parser.add_argument("archivos", nargs="+", help="Archivos JSONL, o - para leer de stdin")
+    parser.add_argument("--url", default="http://localhost:9200")
+    parser.add_argument("--indice", default=INDICE_ES)
+    parser.add_argument("--tamanio-lote", type=int, default=500)
+    parser.add_argument("--paralelismo", type=int, default=4)
+    parser.add_argument("--reintentos", type=int, default=3)
+    parser.add_argument("--backfill", action="store_true",
+                        help="Desactiva refresh_interval durante la carga (para cargas históricas grandes)")
+    args = parser.parse_args(argv)
+
+    ingesta = IngestaBulk(args.url, args.indice, args.tamanio_lote, args.paralelismo, args.reintentos)
+    resumen = ingesta.ingestar(leer_registros(args.archivos), backfill=args.backfill)
+    print(json.dumps(resumen))
+    return 0 if resumen["fallidos"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,26 @@
-const BASE = "http://127.0.0.1:8000";
+export const BASE = "http://127.0.0.1:8000";
 
-export async function buscarCoincidenciasElastic(palabra) {
-  const res = await fetch(`${BASE}/buscar?palabra=${encodeURIComponent(palabra)}`);
+// Una página de resultados; cursor es el "siguiente" de la página anterior
+export async function buscarCoincidenciasElastic(palabra, cursor = null) {
+  let url = `${BASE}/buscar?palabra=${encodeURIComponent(palabra)}`;
+  if (cursor) url += `&cursor=${encodeURIComponent(cursor)}`;
+  const res = await fetch(url);
   if (!res.ok) throw new Error(`HTTP ${res.status}`);
-  return res.json(); // {resultados: [...]}
+  return res.json(); // {resultados: [...], siguiente: "..." | null}
+}
+
+// /buscar devuelve solo un fragmento; el texto completo se pide al abrir el resultado
+export async function obtenerTranscripcion(canal, start_timestamp) {
+  const res = await fetch(`${BASE}/transcripcion?canal=${encodeURIComponent(canal)}&start_timestamp=${encodeURIComponent(start_timestamp)}`);
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  return res.json();
 }
   
+// Poster del segmento que contiene el instante (unos KB; el servidor redirige a la imagen cacheada)
+export function urlMiniatura(canal, start_timestamp) {
+  return `${BASE}/miniaturas/${encodeURIComponent(canal)}?instante=${encodeURIComponent(start_timestamp)}`;
+}
+
 export async function obtenerListaVideos(canal, start_timestamp, end_timestamp) {
   const res = await fetch(`${BASE}/videos?canal=${encodeURIComponent(canal)}&timestamp_start=${encodeURIComponent(start_timestamp)}&timestamp_end=${encodeURIComponent(end_timestamp)}`);
   if (!res.ok) throw new Error(`HTTP ${res.status}`);
@@ -13,6 +28,34 @@ export async function obtenerListaVideos(canal, start_timestamp, end_timestamp)
   return Array.isArray(data.videos) ? data.videos : [];
 }
 
+// Igual que obtenerListaVideos pero también devuelve el segmento de referencia
+// (el que contiene start_timestamp aunque no coincida exacto con el nombre del archivo)
+export async function obtenerVentanaVideos(canal, start_timestamp, end_timestamp) {
+  const res = await fetch(`${BASE}/videos?canal=${encodeURIComponent(canal)}&timestamp_start=${encodeURIComponent(start_timestamp)}&timestamp_end=${encodeURIComponent(end_timestamp)}`);
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  const data = await res.json();
+  return {
+    videos: Array.isArray(data.videos) ? data.videos : [],
+    referencia: data.referencia || null,
+  };
+}
+
+// Las ventanas de muchos hits en un solo request (todos los de una página de /buscar).
+// Devuelve un array en el mismo orden: {videos, referencia, texto} o {error}
+export async function obtenerVentanasLote(hits) {
+  const res = await fetch(`${BASE}/videos/lote`, {
+    method: "POST",
+    headers: {"Content-Type": "application/json"},
+    body: JSON.stringify({
+      ventanas: hits.map((h) => ({ canal: h.canal, timestamp_start: h.start_timestamp, timestamp_end: h.end_timestamp })),
+      incluir_transcripcion: true,
+    }),
+  });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  const data = await res.json();
+  return Array.isArray(data.ventanas) ? data.ventanas : [];
+}
+
 export function descargarArchivoSinRecarga(url) {
   const a = document.createElement('a');
   a.href = url;
@@ -22,23 +65,40 @@ export function descargarArchivoSinRecarga(url) {
   document.body.removeChild(a);
 }
 
-export async function concatenarYDescargar(videos, canal) {
+// Encola la concatenación y consulta el trabajo hasta que termina.
+// onProgreso(fraccion) se llama en cada consulta (0..1).
+export async function concatenarYDescargar(videos, canal, onProgreso = () => {}) {
   console.log("Concatenando videos:", videos, "canal:", canal);
-  const resp = await fetch(`${BASE}/concatenar`, {
+  const resp = await fetch(`${BASE}/trabajos/concatenar`, {
     method: "POST",
     headers: {"Content-Type": "application/json"},
     body: JSON.stringify({ videos, canal }),
   });
 
-  const data = await resp.json();
-  console.log("Respuesta de /concatenar:", data);
+  let data = await resp.json();
+  console.log("Respuesta de /trabajos/concatenar:", data);
+  // Si el clip ya estaba en cache viene terminado y sin trabajo que consultar
+  const enCache = data.estado === "terminado" && data.archivo;
+  if (!resp.ok || (!enCache && !data.trabajo)) {
+    alert("No se pudo generar el archivo. Respuesta del servidor: " + JSON.stringify(data));
+    return false;
+  }
+
+  const idTrabajo = data.trabajo;
+  while (data.estado === "pendiente" || data.estado === "en_curso") {
+    await new Promise((r) => setTimeout(r, 1000));
+    const res = await fetch(`${BASE}/trabajos/${idTrabajo}`);
+    data = await res.json();
+    onProgreso(data.progreso || 0);
+  }
 
   const nombreArchivo = data.archivo;
   if (!nombreArchivo) {
     alert("No se pudo generar el archivo. Respuesta del servidor: " + JSON.stringify(data));
-    return;
+    return false;
   }
 
   console.log("Descargando archivo:", nombreArchivo);
   descargarArchivoSinRecarga(`${BASE}/descargar?clip=${encodeURIComponent(nombreArchivo)}`);
+  return true;
 }
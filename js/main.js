@@ -1,24 +1,36 @@
-import { buscarCoincidenciasElastic } from "./api.js";
-import { state } from "./state.js";
+import { buscarCoincidenciasElastic, obtenerVentanasLote } from "./api.js";
+import { state, claveVentana } from "./state.js";
 import { mostrarCargando, mostrarPopup, } from "./utils.js";
 import { initDOMRefs, ocultarReproductor, renderResultados, } from "./ui.js";
 import { mostrarVideo, ajustarClip, expandir, descargarConcatenado } from "./player.js";
 
 // === BÚSQUEDA ===
+// Resultados acumulados de la búsqueda actual (se suman páginas con "Cargar más")
+let busquedaActual = { palabra: null, resultados: [], siguiente: null };
+
 async function buscar() {
   const palabra = document.getElementById("busqueda").value.trim();
   if (!palabra) {
     mostrarPopup("Por favor introduce una palabra para buscar");
     return;
   }
+  busquedaActual = { palabra, resultados: [], siguiente: null };
+  state.ventanas.clear();
+  await cargarPagina();
+}
 
+async function cargarPagina() {
   try {
     mostrarCargando(true);
-    const data = await buscarCoincidenciasElastic(palabra);
+    const data = await buscarCoincidenciasElastic(busquedaActual.palabra, busquedaActual.siguiente);
     mostrarCargando(false);
+    busquedaActual.resultados = busquedaActual.resultados.concat(data.resultados || []);
+    busquedaActual.siguiente = data.siguiente;
+    precargarVentanas(data.resultados || []); // sin await: la página se muestra igual
     ocultarReproductor(); // data.resultados = transcripciones que matchean con las palabras
-    renderResultados(data.resultados, mostrarVideo); // onClick -> mostrarVideo
-    mostrarPopup(`Se encontraron ${data.resultados?.length || 0} resultados`);
+    renderResultados(busquedaActual.resultados, mostrarVideo); // onClick -> mostrarVideo
+    renderCargarMas();
+    mostrarPopup(`Se encontraron ${busquedaActual.resultados.length}${busquedaActual.siguiente ? "+" : ""} resultados`);
   } catch (e) {
     mostrarCargando(false);
     console.error("Error al buscar:", e);
@@ -26,6 +38,32 @@ async function buscar() {
   }
 }
 
+// Resuelve en un solo request las ventanas (y el texto completo) de todos los hits de la página,
+// así abrir un resultado no necesita ir al servidor. Si falla, mostrarVideo las pide de a una.
+async function precargarVentanas(resultados) {
+  if (!resultados.length) return;
+  try {
+    const ventanas = await obtenerVentanasLote(resultados);
+    resultados.forEach((r, i) => {
+      const v = ventanas[i];
+      if (!v || v.error) return;
+      state.ventanas.set(claveVentana(r.canal, r.start_timestamp, r.end_timestamp), { videos: v.videos, referencia: v.referencia });
+      if (typeof v.texto === "string") r.texto = v.texto;
+    });
+  } catch (e) {
+    console.error("Error al obtener las ventanas en lote:", e);
+  }
+}
+
+function renderCargarMas() {
+  if (!busquedaActual.siguiente) return;
+  const btn = document.createElement("button");
+  btn.className = "btn-secondary";
+  btn.textContent = "Cargar más resultados";
+  btn.addEventListener("click", cargarPagina);
+  document.getElementById("resultados").appendChild(btn);
+}
+
 // === INIT ===
 document.addEventListener("DOMContentLoaded", () => {
   // DOM refs
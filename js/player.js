@@ -1,5 +1,5 @@
-import { state, setVideoActual, setListaVideos , resetSeleccion, indiceActual, setCanalActual, setFecha } from "./state.js";
-import { obtenerListaVideos, concatenarYDescargar } from "./api.js";
+import { state, setVideoActual, setListaVideos , resetSeleccion, indiceActual, setCanalActual, setFecha, claveVentana } from "./state.js";
+import { BASE, obtenerListaVideos, obtenerVentanaVideos, concatenarYDescargar } from "./api.js";
 import { mostrarCargando, mostrarPopup, formatTime, } from "./utils.js";
 import { getRefs, mostrarControles, ocultarReproductor, scrollToPlayer, renderTranscripcionSeleccionadaVideo, actualizarContador,
   actualizarEstadoDescarga, deshabilitarBotonDescarga, setTituloPlayer } from "./ui.js";
@@ -16,7 +16,8 @@ async function ensureVideosCargados() {
 // Configurar el reproductor con el video seleccionado
 function configurarReproductor(nombreArchivo) {
   const { videoElement, videoSrc } = getRefs();
-  videoSrc.src = `./canales/${state.canalActual}/${nombreArchivo}`;
+  // El backend sirve los segmentos con Range y cache, así el seek no vuelve a bajar el archivo entero
+  videoSrc.src = `${BASE}/segmentos/${encodeURIComponent(state.canalActual)}/${encodeURIComponent(nombreArchivo)}`;
   videoElement.load();
 
   videoElement.onloadedmetadata = () => {
@@ -33,12 +34,15 @@ export async function mostrarVideo(transcripcion_resultado) {
   const canal = transcripcion_resultado.canal;
   const timestamp_start = transcripcion_resultado.start_timestamp;
   const timestamp_end = transcripcion_resultado.end_timestamp;
-  const videos = await obtenerListaVideos(canal, timestamp_start, timestamp_end);
+  // La ventana suele estar resuelta desde que se cargó la página (ver precargarVentanas en main.js)
+  const { videos, referencia } = state.ventanas.get(claveVentana(canal, timestamp_start, timestamp_end))
+    || await obtenerVentanaVideos(canal, timestamp_start, timestamp_end);
 
 
   console.log("Videos obtenidos del servidor:", videos);
   // Estado
   setVideoActual(canal, timestamp_start, timestamp_end);
+  if (referencia) state.videoActual = referencia; // el timestamp puede caer dentro de un segmento
   setCanalActual(canal);
   setFecha(timestamp_start);
   setListaVideos(videos);
@@ -149,31 +153,19 @@ export async function descargarConcatenado() {
   const textoOriginal = btn.textContent;
 
   try {
-    const res = await concatenarYDescargar(seleccion, state.canalActual);
+    const ok = await concatenarYDescargar(seleccion, state.canalActual, (progreso) => {
+      actualizarEstadoDescarga(`Concatenando videos... ${Math.round(progreso * 100)}%`, "normal");
+    });
 
     mostrarCargando(false);
     deshabilitarBotonDescarga(false, textoOriginal);
 
-    if (!res.ok) {
+    if (!ok) {
       actualizarEstadoDescarga("Error en la concatenación", "error");
-      mostrarPopup(`Error al generar clip: ${res.status} ${res.statusText}`);
+      mostrarPopup("Error al generar clip");
       return;
     }
 
-    actualizarEstadoDescarga("Descargando archivo...", "normal");
-
-    // Descargar
-    const blob = await res.blob();
-    const url = URL.createObjectURL(blob);
-    const a = document.createElement("a");
-    a.style.display = "none";
-    a.href = url;
-    a.download = "clip_concatenado.mp4";
-    document.body.appendChild(a);
-    a.click();
-    document.body.removeChild(a);
-    URL.revokeObjectURL(url);
-
     mostrarPopup("Descarga iniciada");
     actualizarEstadoDescarga("Descarga completada", "success");
     setTimeout(() => {
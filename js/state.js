@@ -6,8 +6,14 @@ export const state = {
   fecha: null,            // fecha del video seleccionado
   acumuladosAtras: 0,
   acumuladosAdelante: 0,
+  ventanas: new Map(),     // clave de hit -> {videos, referencia}, resueltas en lote por página
 };
 
+// Clave de un hit para state.ventanas
+export function claveVentana(canal, start_timestamp, end_timestamp) {
+  return `${canal}|${start_timestamp}|${end_timestamp}`;
+}
+
 // Helpers
 export function resetSeleccion() {
   state.acumuladosAtras = 0;
@@ -1,4 +1,5 @@
 import { state } from "./state.js";
+import { obtenerTranscripcion, urlMiniatura } from "./api.js";
 import { formatTime, formatTs, extraerInfoVideo, recortarTexto } from "./utils.js";
 
 // Referencias globales (DOM) — las inicializamos una vez
@@ -62,9 +63,19 @@ export function renderResultados(resultados, onClickVideo) {
       const box = document.createElement("div");
       box.className = "transcription-box";
 
+      // Poster del segmento: alcanza para descartar un resultado sin cargar el video
+      const img = document.createElement("img");
+      img.className = "transcription-thumb";
+      img.loading = "lazy";
+      img.alt = "";
+      img.src = urlMiniatura(r.canal, r.start_timestamp);
+      img.addEventListener("error", () => img.remove());
+      box.appendChild(img);
+
       const txt = document.createElement("div");
       txt.className = "transcription-text";
-      txt.textContent = recortarTexto(r.texto, 45);
+      // El fragmento viene escapado del servidor, con el match entre <em>
+      txt.innerHTML = r.fragmento ?? recortarTexto(r.texto, 45);
       box.appendChild(txt);
 
       //mostramos la transcripcion completa si se selecciona
@@ -79,7 +90,16 @@ export function renderResultados(resultados, onClickVideo) {
 }
 
 // ventana con la transcripcion completa seleccionada
-export function mostrarTranscripcionSeleccionadaCompleta(transcripcion, mostrarVideo) {
+export async function mostrarTranscripcionSeleccionadaCompleta(transcripcion, mostrarVideo) {
+  if (transcripcion.texto === undefined) {
+    try {
+      transcripcion = await obtenerTranscripcion(transcripcion.canal, transcripcion.start_timestamp);
+    } catch (e) {
+      console.error("Error al obtener la transcripción:", e);
+      return;
+    }
+  }
+
   // Elimina cualquier modal anterior
   const prev = document.getElementById("modal-transcripcion");
   if (prev) prev.remove();
@@ -0,0 +1,54 @@
+import json
+import logging
+import sys
+import time
+
+# Logging estructurado: cada mensaje lleva sus datos en `extra` en lugar de
+# interpolarlos en el texto, para poder filtrarlos (trabajo=..., canal=...).
+# LOG_FORMATO=json escribe una línea JSON por evento; "texto" los agrega como clave=valor.
+
+# Atributos que trae todo LogRecord; lo demás vino en `extra`
+_ATRIBUTOS_RECORD = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def _extras(record) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _ATRIBUTOS_RECORD}
+
+
+class FormatoJSON(logging.Formatter):
+    def format(self, record):
+        evento = {
+            "ts": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            "nivel": record.levelname,
+            "logger": record.name,
+            "mensaje": record.getMessage(),
+            **_extras(record),
+        }
+        if record.exc_info:
+            evento["excepcion"] = self.formatException(record.exc_info)
+        return json.dumps(evento, ensure_ascii=False, default=str)
+
+
+class FormatoTexto(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+    def format(self, record):
+        texto = super().format(record)
+        extras = _extras(record)
+        if extras:
+            texto += " " + " ".join(f"{k}={v}" for k, v in extras.items())
+        return texto
+
+
+def configurar_logging(nivel: str = "INFO", formato: str = "texto"):
+    """
+    Args:
+        nivel (str): DEBUG, INFO, WARNING, ERROR
+        formato (str): "texto" o "json"
+    """
+    handler = logging.StreamHandler(sys.stderr)
+    handler.setFormatter(FormatoJSON() if formato == "json" else FormatoTexto())
+    raiz = logging.getLogger()
+    raiz.handlers[:] = [handler]
+    raiz.setLevel(nivel.upper())
@@ -1,21 +1,283 @@
-from fastapi import FastAPI, Query, Body
+from fastapi import FastAPI, Query, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-import subprocess
+from fastapi.responses import JSONResponse, Response, FileResponse, RedirectResponse, StreamingResponse
+from starlette.background import BackgroundTask
+import asyncio
+import base64
+import binascii
+import json
+import logging
 import os
 import uuid
+from urllib.parse import quote
+from contextlib import asynccontextmanager
 import ffmpeg  # Biblioteca ffmpeg instalada con pip
 
 from transcripciones_handler import TranscripcionesHandler
-
-app = FastAPI()
-
-transcripciones_handler = TranscripcionesHandler()
+from transcripciones_mock import Transcripcion
+from backends_busqueda import BackendElasticsearch, BackendMemoria, transcripcion_a_documento
+from ingesta_bulk import leer_transcripciones, id_documento
+from almacen_transcripciones import AlmacenTranscripciones, BackendAlmacen
+from cola_trabajos import ColaTrabajos, Trabajo, TERMINADO, ERROR, CANCELADO
+from cache_clips import CacheClips
+from estado_workers import RegistroTrabajos, MetricasWorkers, BusTranscripciones, TrabajoRemoto
+from cache_busquedas import CacheBusquedas
+from suscripciones import Suscripciones
+from precarga import Precarga
+from metadatos_segmentos import MetadatosSegmentos, validar_concatenacion
+from servir_archivos import respuesta_archivo, CACHE_INMUTABLE
+from catalogo_segmentos import iso_a_epoch, epoch_a_iso, canal_valido
+from almacenamiento_segmentos import AlmacenamientoSegmentos, MigradorSegmentos, parsear_raices
+from hls import armar_playlist, MEDIA_TYPE_M3U8
+from exportacion_streaming import RespuestaSegmentosTS, nombre_exportacion
+from respuesta_json import respuesta_json
+from exportacion_precisa import planificar_recorte, comando_recodificar, parametros_codificacion, validar_puntas
+from exportacion_lote import agrupar_hits, armar_zip
+from miniaturas import Miniaturas, ARCHIVOS, ARCHIVO_POSTER
+from proxies import Proxies, CALIDAD_PROXY, CALIDAD_ORIGINAL
+from procesamiento_segmentos import PRIORIDAD_PEDIDO
+from logs import configurar_logging
+from metricas import REGISTRO, CONTENT_TYPE_PROMETHEUS, Funcion, MiddlewareMetricas, medir
 
 # === Configuración ===
-VIDEO_DIR = "canales"
+# Nivel (DEBUG, INFO, WARNING, ERROR) y formato ("texto" o "json") de los logs
+LOG_NIVEL = os.environ.get("LOG_NIVEL", "INFO")
+LOG_FORMATO = os.environ.get("LOG_FORMATO", "texto")
+configurar_logging(LOG_NIVEL, LOG_FORMATO)
+logger = logging.getLogger("main")
+
+# Raíces de los segmentos, de la más nueva a la de archivo: "ruta=días,ruta,ruta"
+# (ver almacenamiento_segmentos.py). El grabador escribe en la primera
+RAICES_SEGMENTOS = os.environ.get("RAICES_SEGMENTOS", "canales")
+# Cada cuántos segundos se mueven a su raíz los segmentos que envejecieron (0 lo desactiva) y cuántos
+# segundos se conserva el original después de copiarlo, para los trabajos que ya lo estaban leyendo
+MIGRACION_INTERVALO = float(os.environ.get("MIGRACION_INTERVALO", "300"))
+MIGRACION_GRACIA = float(os.environ.get("MIGRACION_GRACIA", "3600"))
+# Cada cuántos segundos se refresca en segundo plano el catálogo de segmentos; los requests solo leen
+# lo que hay en memoria (0 = lo refresca el request que lo consulta, como mucho cada 2 segundos por canal)
+CATALOGO_INTERVALO = float(os.environ.get("CATALOGO_INTERVALO", "2"))
+# Con varios workers (servidor.py) los vigilantes corren en uno solo, el que toma este lock;
+# los demás reintentan cada VIGILANTES_REINTENTO segundos por si ese worker se cae
+VIGILANTES_LOCK = os.environ.get("VIGILANTES_LOCK", "vigilantes.lock")
+VIGILANTES_REINTENTO = 30
+# Carpeta del estado que comparten los workers (ver estado_workers.py): la define servidor.py cuando
+# arranca más de uno. Sin ella cada proceso tiene los trabajos, las métricas y las transcripciones en memoria
+ESTADO_WORKERS = os.environ.get("ESTADO_WORKERS")
 OUTPUT_DIR = "clips"
 os.makedirs(OUTPUT_DIR, exist_ok=True)
+# Cuántos ffmpeg pueden correr a la vez; el resto espera en la cola
+MAX_FFMPEG_CONCURRENTES = int(os.environ.get("MAX_FFMPEG_CONCURRENTES", "2"))
+
+# Tope de espacio en disco para clips/; por encima se borran los menos usados
+PRESUPUESTO_CLIPS_BYTES = int(os.environ.get("PRESUPUESTO_CLIPS_BYTES", str(10 * 1024**3)))
+
+# "memoria" (índice invertido sobre el mock) o "elasticsearch"
+BACKEND_BUSQUEDA = os.environ.get("BACKEND_BUSQUEDA", "memoria")
+ELASTICSEARCH_URL = os.environ.get("ELASTICSEARCH_URL", "http://localhost:9200")
+ELASTICSEARCH_TIMEOUT = float(os.environ.get("ELASTICSEARCH_TIMEOUT", "5"))
+
+# Resultados por página de /buscar
+TAMANIO_PAGINA = int(os.environ.get("TAMANIO_PAGINA", "50"))
+TAMANIO_PAGINA_MAXIMO = 500
+
+# Miniaturas (poster, sprite y pista VTT) de cada segmento, generadas en segundo plano
+MINIATURAS_DIR = "miniaturas"
+# ffmpeg de miniaturas a la vez; van en una cola aparte de la de clips
+MAX_MINIATURAS_CONCURRENTES = int(os.environ.get("MAX_MINIATURAS_CONCURRENTES", "1"))
+# Cada cuántos segundos se buscan segmentos nuevos; 0 desactiva el vigilante (se generan solo al pedirlas)
+MINIATURAS_INTERVALO = float(os.environ.get("MINIATURAS_INTERVALO", "10"))
+# Segundos hacia atrás que mira el vigilante (0 = todo el archivo); lo anterior se genera solo al pedirlo
+MINIATURAS_VENTANA = float(os.environ.get("MINIATURAS_VENTANA", "86400"))
+
+# Cache de páginas de /buscar: entradas como máximo (0 lo desactiva) y segundos que vale cada una.
+# Lo que se agrega por agregar_transcripcion invalida al instante; lo que se indexa directo en Elasticsearch
+# (ingesta_bulk.py) aparece como mucho a los CACHE_BUSQUEDAS_TTL segundos
+CACHE_BUSQUEDAS_ENTRADAS = int(os.environ.get("CACHE_BUSQUEDAS_ENTRADAS", "1000"))
+CACHE_BUSQUEDAS_TTL = float(os.environ.get("CACHE_BUSQUEDAS_TTL", "30"))
+
+# Suscripciones a transcripciones nuevas (/suscripciones): activas como máximo, eventos sin leer por cliente
+# (por encima se descartan los más viejos) y cada cuántos segundos se manda un keepalive si no hay eventos
+MAX_SUSCRIPCIONES = int(os.environ.get("MAX_SUSCRIPCIONES", "1000"))
+SUSCRIPCIONES_COLA = int(os.environ.get("SUSCRIPCIONES_COLA", "100"))
+SUSCRIPCIONES_KEEPALIVE = float(os.environ.get("SUSCRIPCIONES_KEEPALIVE", "15"))
+
+# Proxies (versiones livianas para la vista previa) que genera un transcodificador de fondo.
+# Cada cuántos segundos se buscan segmentos nuevos; 0 lo desactiva y la vista previa usa los originales
+PROXIES_INTERVALO = float(os.environ.get("PROXIES_INTERVALO", "5"))
+# Segundos hacia atrás que mira el transcodificador (0 = todo el archivo); lo anterior se sirve en calidad original
+PROXIES_VENTANA = float(os.environ.get("PROXIES_VENTANA", "86400"))
+# Presupuesto de CPU: procesos a la vez x hilos por proceso, con nice para no competir con los requests
+MAX_PROXIES_CONCURRENTES = int(os.environ.get("MAX_PROXIES_CONCURRENTES", "1"))
+PROXIES_HILOS_FFMPEG = int(os.environ.get("PROXIES_HILOS_FFMPEG", "1"))
+PROXIES_NICE = int(os.environ.get("PROXIES_NICE", "10"))
+PROXY_ALTURA = int(os.environ.get("PROXY_ALTURA", "360"))
+PROXY_BITRATE = os.environ.get("PROXY_BITRATE", "400k")
+
+# Metadatos reales de los segmentos (ffprobe en segundo plano, guardados en SQLite).
+# Cada cuántos segundos se buscan segmentos nuevos (0 desactiva el análisis) y cuántos ffprobe a la vez
+METADATOS_DB = os.environ.get("METADATOS_DB", "metadatos_segmentos.sqlite")
+METADATOS_INTERVALO = float(os.environ.get("METADATOS_INTERVALO", "5"))
+METADATOS_CONCURRENCIA = int(os.environ.get("METADATOS_CONCURRENCIA", "2"))
+
+# Precarga en el page cache de los segmentos de cada ventana de /videos: segmentos en espera como máximo
+# (0 desactiva la precarga) y segundos en los que un segmento precargado no se vuelve a pedir
+PRECARGA_CAPACIDAD = int(os.environ.get("PRECARGA_CAPACIDAD", "64"))
+PRECARGA_VIGENCIA = float(os.environ.get("PRECARGA_VIGENCIA", "120"))
+
+# Tope de hits por pedido de /exportar/lote y de ventanas por pedido de /videos/lote
+MAX_HITS_LOTE = int(os.environ.get("MAX_HITS_LOTE", "100"))
+
+# Fracción de requests que se perfilan sin pedirlo (header Server-Timing); con "X-Perfil: 1" se perfila siempre
+TASA_MUESTREO_PERFIL = float(os.environ.get("TASA_MUESTREO_PERFIL", "0"))
+
+# JSONL de transcripciones para el backend en memoria en lugar del mock (p. ej. el de generar_datos_bench.py)
+TRANSCRIPCIONES_JSONL = os.environ.get("TRANSCRIPCIONES_JSONL")
+# Archivo de almacen_transcripciones.py: el backend en memoria lo mapea en vez de cargar todo (arranque en milisegundos)
+ALMACEN_TRANSCRIPCIONES = os.environ.get("ALMACEN_TRANSCRIPCIONES")
+
+almacenamiento = AlmacenamientoSegmentos(parsear_raices(RAICES_SEGMENTOS))
+VIDEO_DIR = almacenamiento.principal
+if ALMACEN_TRANSCRIPCIONES:
+    transcripciones_handler = TranscripcionesHandler(base_dir=almacenamiento.directorios,
+                                                     backend=BackendAlmacen(AlmacenTranscripciones(ALMACEN_TRANSCRIPCIONES)))
+elif TRANSCRIPCIONES_JSONL:
+    transcripciones_handler = TranscripcionesHandler(base_dir=almacenamiento.directorios,
+                                                     backend=BackendMemoria(leer_transcripciones([TRANSCRIPCIONES_JSONL])))
+else:
+    transcripciones_handler = TranscripcionesHandler(base_dir=almacenamiento.directorios)
+cache_busquedas = CacheBusquedas(CACHE_BUSQUEDAS_ENTRADAS, CACHE_BUSQUEDAS_TTL)
+if CACHE_BUSQUEDAS_ENTRADAS > 0:
+    transcripciones_handler.cache = cache_busquedas
+suscripciones = Suscripciones(SUSCRIPCIONES_COLA, MAX_SUSCRIPCIONES)
+transcripciones_handler.suscripciones = suscripciones
+registro_trabajos = RegistroTrabajos(ESTADO_WORKERS) if ESTADO_WORKERS else None
+metricas_workers = MetricasWorkers(ESTADO_WORKERS) if ESTADO_WORKERS else None
+if ESTADO_WORKERS:
+    # Con Elasticsearch el índice es uno solo y no hace falta guardar lo viejo para un worker que arranca tarde
+    transcripciones_handler.bus = BusTranscripciones(
+        ESTADO_WORKERS, maximo_bytes=64 * 1024**2 if BACKEND_BUSQUEDA == "elasticsearch" else None)
+cola_trabajos = ColaTrabajos(concurrencia=MAX_FFMPEG_CONCURRENTES, registro=registro_trabajos)
+cache_clips = CacheClips(OUTPUT_DIR, PRESUPUESTO_CLIPS_BYTES)
+precarga = Precarga(PRECARGA_CAPACIDAD, PRECARGA_VIGENCIA) if PRECARGA_CAPACIDAD > 0 else None
+metadatos = MetadatosSegmentos(METADATOS_DB, transcripciones_handler.catalogo, concurrencia=METADATOS_CONCURRENCIA)
+migrador = MigradorSegmentos(almacenamiento, transcripciones_handler.catalogo, gracia=MIGRACION_GRACIA,
+                             al_mover=[metadatos.mover])
+cola_proxies = ColaTrabajos(concurrencia=MAX_PROXIES_CONCURRENTES, niceness=PROXIES_NICE)
+proxies = Proxies(VIDEO_DIR, transcripciones_handler.catalogo, cola_proxies, altura=PROXY_ALTURA,
+                  bitrate_video=PROXY_BITRATE, hilos=PROXIES_HILOS_FFMPEG) if PROXIES_INTERVALO > 0 else None
+cola_miniaturas = ColaTrabajos(concurrencia=MAX_MINIATURAS_CONCURRENTES)
+miniaturas = Miniaturas(MINIATURAS_DIR, VIDEO_DIR, transcripciones_handler.catalogo, cola_miniaturas)
+
+REGISTRO.registrar(Funcion("clips_cola_en_espera", "Trabajos de ffmpeg esperando en la cola", lambda: cola_trabajos.en_espera))
+REGISTRO.registrar(Funcion("clips_cola_en_curso", "Trabajos de ffmpeg corriendo", lambda: cola_trabajos.en_curso))
+REGISTRO.registrar(Funcion("clips_cache_aciertos_total", "Clips pedidos que ya estaban generados",
+                           lambda: cache_clips.aciertos, tipo="counter"))
+REGISTRO.registrar(Funcion("clips_cache_fallos_total", "Clips pedidos que hubo que generar",
+                           lambda: cache_clips.fallos, tipo="counter"))
+REGISTRO.registrar(Funcion("clips_cache_bytes", "Espacio ocupado por clips/", lambda: cache_clips.total_bytes))
+REGISTRO.registrar(Funcion("clips_busquedas_cache_aciertos_total", "Búsquedas respondidas desde el cache (o esperando una idéntica en curso)",
+                           lambda: cache_busquedas.aciertos, tipo="counter"))
+REGISTRO.registrar(Funcion("clips_busquedas_cache_fallos_total", "Búsquedas que fueron al backend",
+                           lambda: cache_busquedas.fallos, tipo="counter"))
+REGISTRO.registrar(Funcion("clips_busquedas_cache_invalidadas_total", "Entradas borradas por transcripciones nuevas",
+                           lambda: cache_busquedas.invalidadas, tipo="counter"))
+REGISTRO.registrar(Funcion("clips_proxies_pendientes", "Segmentos de PROXIES_VENTANA sin proxy (en cola o sin encolar)",
+                           lambda: proxies.atraso[0] if proxies is not None else 0))
+REGISTRO.registrar(Funcion("clips_proxies_pendientes_segundos", "Segundos de video sin proxy; si crece, el transcodificador no da abasto",
+                           lambda: proxies.atraso[1] if proxies is not None else 0))
+REGISTRO.registrar(Funcion("clips_metadatos_segmentos", "Segmentos con metadatos de ffprobe guardados", lambda: len(metadatos)))
+REGISTRO.registrar(Funcion("clips_metadatos_analizados_total", "Segmentos analizados con ffprobe",
+                           lambda: metadatos.analizados, tipo="counter"))
+REGISTRO.registrar(Funcion("clips_metadatos_ilegibles_total", "Segmentos que ffprobe no pudo leer",
+                           lambda: metadatos.fallidos, tipo="counter"))
+REGISTRO.registrar(Funcion("clips_precarga_en_espera", "Segmentos esperando para precargarse",
+                           lambda: precarga.en_espera if precarga is not None else 0))
+REGISTRO.registrar(Funcion("clips_busquedas_cache_entradas", "Páginas de /buscar en el cache", lambda: len(cache_busquedas)))
+REGISTRO.registrar(Funcion("clips_suscripciones_activas", "Clientes suscriptos a transcripciones nuevas", lambda: len(suscripciones)))
+
+
+def tomar_lock_vigilantes():
+    """
+    Lock de archivo que marca al proceso que corre los vigilantes.
+    Returns:
+        El archivo del lock (abierto mientras se tenga el lock), o None si ya lo tiene otro worker
+    """
+    archivo = open(VIGILANTES_LOCK, "a")
+    try:
+        import fcntl
+    except ImportError:
+        # Sin fcntl no hay fork ni varios workers (ver servidor.py): este proceso es el único
+        return archivo
+    try:
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        archivo.close()
+        return None
+    return archivo
+
+
+def arrancar_vigilantes() -> list:
+    """Tareas de fondo que generan o mueven archivos (miniaturas, metadatos, migración y proxies)."""
+    vigilantes = []
+    if MINIATURAS_INTERVALO > 0:
+        vigilantes.append(asyncio.create_task(miniaturas.vigilar(MINIATURAS_INTERVALO, ventana=MINIATURAS_VENTANA)))
+    if METADATOS_INTERVALO > 0:
+        vigilantes.append(asyncio.create_task(metadatos.vigilar(METADATOS_INTERVALO)))
+    if MIGRACION_INTERVALO > 0 and len(almacenamiento.niveles) > 1:
+        vigilantes.append(asyncio.create_task(migrador.vigilar(MIGRACION_INTERVALO)))
+    if proxies is not None:
+        # Hasta dos trabajos por proceso del pool en la cola, para que nunca quede un núcleo ocioso
+        vigilantes.append(asyncio.create_task(proxies.vigilar(PROXIES_INTERVALO, por_vuelta=2 * MAX_PROXIES_CONCURRENTES,
+                                                              ventana=PROXIES_VENTANA)))
+    return vigilantes
+
+
+async def esperar_turno_vigilantes(vigilantes: list, locks: list):
+    """Reintenta tomar el lock por si se cae el worker que corre los vigilantes."""
+    while True:
+        await asyncio.sleep(VIGILANTES_REINTENTO)
+        lock = tomar_lock_vigilantes()
+        if lock is not None:
+            logger.info("Este worker pasa a correr los vigilantes", extra={"pid": os.getpid()})
+            locks.append(lock)
+            vigilantes.extend(arrancar_vigilantes())
+            return
+
+
+@asynccontextmanager
+async def ciclo_de_vida(app):
+    # Un solo cliente de Elasticsearch (con su pool de conexiones) para toda la app
+    if BACKEND_BUSQUEDA == "elasticsearch":
+        transcripciones_handler.backend = BackendElasticsearch.crear(ELASTICSEARCH_URL, timeout=ELASTICSEARCH_TIMEOUT)
+    vigilantes = []
+    # Cada worker tiene su catálogo y lo refresca él; los demás vigilantes escriben en disco y van en uno solo
+    if CATALOGO_INTERVALO > 0:
+        vigilantes.append(asyncio.create_task(transcripciones_handler.catalogo.vigilar(CATALOGO_INTERVALO)))
+    if transcripciones_handler.bus is not None:
+        vigilantes.append(asyncio.create_task(transcripciones_handler.bus.seguir(transcripciones_handler.recibir_transcripcion)))
+    if metricas_workers is not None:
+        vigilantes.append(asyncio.create_task(metricas_workers.vigilar(REGISTRO.exponer)))
+    locks = [tomar_lock_vigilantes()]
+    if locks[0] is not None:
+        vigilantes.extend(arrancar_vigilantes())
+    else:
+        locks.clear()
+        vigilantes.append(asyncio.create_task(esperar_turno_vigilantes(vigilantes, locks)))
+    yield
+    for vigilante in vigilantes:
+        vigilante.cancel()
+    await cola_miniaturas.detener()
+    await cola_proxies.detener()
+    metadatos.cerrar()
+    if precarga is not None:
+        precarga.detener()
+    await cola_trabajos.detener()
+    await transcripciones_handler.backend.cerrar()
+    for lock in locks:
+        lock.close()
+
+
+app = FastAPI(lifespan=ciclo_de_vida)
 
 # Datos simulados como si vinieran de Elasticsearch
 
@@ -27,7 +289,9 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
+app.add_middleware(MiddlewareMetricas, tasa_muestreo=TASA_MUESTREO_PERFIL)
 
 # Definir ruta del ejecutable FFmpeg
 # Usamos directamente 'ffmpeg' ya que está en el PATH del sistema
@@ -35,123 +299,881 @@ FFMPEG_BIN = "ffmpeg"
 
 # === Endpoints ===
 @app.get("/buscar")
-def buscar_palabra(palabra: str = Query(..., min_length=1)):
+async def buscar_palabra(
+    request: Request,
+    palabra: str = Query(..., min_length=1),
+    canal: str = Query(None, description="Filtrar por canal"),
+    desde: str = Query(None, description="start_timestamp mínimo, ej: 2025-09-12T12:00:00Z"),
+    hasta: str = Query(None, description="start_timestamp máximo, ej: 2025-09-12T13:00:00Z"),
+    tamanio: int = Query(TAMANIO_PAGINA, ge=1, le=TAMANIO_PAGINA_MAXIMO),
+    cursor: str = Query(None, description="El 'siguiente' de la página anterior"),
+    completo: bool = Query(False, description="Incluir el texto completo además del fragmento"),
+):
     """
-    Busca transcripciones que contengan la palabra. -> Tengo que ver cómo se hace en Elasticsearch
+    Busca transcripciones que contengan la palabra, en el backend configurado (memoria o Elasticsearch).
+    Devuelve una página ordenada por start_timestamp con un fragmento resaltado de cada resultado
+    en vez del texto completo (que se pide con /transcripcion o con completo=true).
     """
-    # Acá iria una lógica para pegarle al Elasticsearch
-    resultados = transcripciones_handler.get_transcripciones(palabra)
-    return {"resultados": resultados}
+    try:
+        for fecha in (desde, hasta):
+            if fecha is not None:
+                iso_a_epoch(fecha)
+        despues_de = decodificar_cursor(cursor) if cursor else None
+    except ValueError:
+        return JSONResponse(content={"error": "Fecha o cursor inválido"}, status_code=400)
+
+    pagina = await transcripciones_handler.buscar(palabra, canal=canal, desde=desde, hasta=hasta,
+                                                  tamanio=tamanio, despues_de=despues_de)
+    resultados = []
+    for t, fragmento in zip(pagina.resultados, pagina.fragmentos):
+        r = {
+            "id": t.id,
+            "canal": t.canal,
+            "start_timestamp": t.start_timestamp,
+            "end_timestamp": t.end_timestamp,
+            "fragmento": fragmento,
+        }
+        if completo:
+            r["texto"] = t.texto
+        resultados.append(r)
+    siguiente = codificar_cursor(pagina.siguiente) if pagina.siguiente is not None else None
+    return respuesta_json(request, {"resultados": resultados, "siguiente": siguiente})
+
+
+@app.get("/transcripcion")
+async def obtener_transcripcion(request: Request, canal: str = Query(..., min_length=1),
+                                start_timestamp: str = Query(..., min_length=1)):
+    """Texto completo de una transcripción (el /buscar solo devuelve el fragmento)."""
+    t = await transcripciones_handler.obtener_transcripcion(canal, start_timestamp)
+    if t is None:
+        return JSONResponse(content={"error": "La transcripción no existe"}, status_code=404)
+    # Las transcripciones tienen __slots__ (sin __dict__), así que el dict se arma a mano como en /buscar
+    return respuesta_json(request, {
+        "id": t.id,
+        "canal": t.canal,
+        "texto": t.texto,
+        "start_timestamp": t.start_timestamp,
+        "end_timestamp": t.end_timestamp,
+    })
+
+
+@app.post("/transcripciones")
+async def agregar_transcripcion(canal: str = Body(..., embed=True, min_length=1), texto: str = Body(..., embed=True),
+                                start_timestamp: str = Body(..., embed=True), end_timestamp: str = Body(..., embed=True)):
+    """
+    Ingesta de una transcripción recién hecha: queda buscable, invalida las páginas de /buscar
+    que cambian y se publica a las suscripciones que la mencionan.
+    (Lo que se carga directo en Elasticsearch con ingesta_bulk.py no pasa por acá ni genera alertas.)
+    """
+    try:
+        if iso_a_epoch(end_timestamp) <= iso_a_epoch(start_timestamp):
+            return JSONResponse(content={"error": "end_timestamp tiene que ser posterior a start_timestamp"}, status_code=400)
+    except ValueError:
+        return JSONResponse(content={"error": "Formato de fecha inválido, se espera 2025-09-12T12:07:30Z"}, status_code=400)
+    transcripcion = Transcripcion(None, canal, texto, start_timestamp, end_timestamp)
+    # El mismo id que le da ingesta_bulk.py: reingestar la misma transcripción no la duplica en Elasticsearch.
+    # En memoria la clave es canal + inicio: la que llega de nuevo reemplaza a la anterior y no vuelve a alertar
+    transcripcion.id = id_documento(transcripcion_a_documento(transcripcion))
+    nueva = await transcripciones_handler.agregar_transcripcion(transcripcion)
+    return {"id": transcripcion.id, "nueva": nueva}
+
+
+@app.get("/suscripciones")
+async def suscribirse(request: Request, palabra: list[str] = Query(..., description="Una o más: ?palabra=dólar&palabra=inflación"),
+                      canal: list[str] = Query(None, description="Solo estos canales (por defecto todos)")):
+    """
+    Transcripciones nuevas que mencionan alguna de las palabras, como Server-Sent Events
+    (en el navegador: new EventSource(url)). Cada evento "transcripcion" trae canal, timestamps,
+    las palabras que aparecieron y el fragmento resaltado; si el cliente leyó más lento de lo que
+    llegaban, el evento trae "perdidas" con cuántas se descartaron.
+    """
+    try:
+        suscripcion = suscripciones.suscribir(palabra, canal)
+    except ValueError as e:
+        return JSONResponse(content={"error": str(e)}, status_code=400)
+
+    async def eventos():
+        try:
+            # Para que el cliente sepa que quedó suscripto antes de la primera transcripción
+            yield f"event: suscripto\ndata: {json.dumps({'suscripcion': suscripcion.numero})}\n\n"
+            numero = 0
+            while not await request.is_disconnected():
+                evento = await suscripcion.siguiente(timeout=SUSCRIPCIONES_KEEPALIVE)
+                if evento is None:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies y detecta clientes caídos
+                    yield ": keepalive\n\n"
+                    continue
+                numero += 1
+                yield f"id: {numero}\nevent: transcripcion\ndata: {json.dumps(evento, ensure_ascii=False)}\n\n"
+        finally:
+            suscripciones.desuscribir(suscripcion)
+
+    return StreamingResponse(eventos(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+def codificar_cursor(valores) -> str:
+    return base64.urlsafe_b64encode(json.dumps(valores).encode()).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> list:
+    try:
+        valores = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:
+        raise ValueError("cursor inválido") from e
+    if not isinstance(valores, list):
+        raise ValueError("cursor inválido")
+    # Que sea un `siguiente` de verdad: uno armado a mano no puede llegar a la búsqueda
+    transcripciones_handler.backend.validar_cursor(valores)
+    return valores
 
 
 @app.get("/videos")
-def obtener_lista_videos(canal: str = Query(..., min_length=1), timestamp_start: str = Query(..., min_length=1), timestamp_end: str = Query(..., min_length=1)):
-    # Debería probar si le puedo pegar una búsqueda múltiple al elastic search
-    videos = transcripciones_handler.obtener_lista_videos_vecinos(canal, timestamp_start, timestamp_end)
-    return {"videos": videos}
-
-@app.get("/descargar")
-def descargar_clip(clip: str = Query(...)):
-    output_path = os.path.join(OUTPUT_DIR, clip)
-    if not os.path.exists(output_path):
-        return JSONResponse(content={"error": "El archivo no existe"}, status_code=404)
-    return FileResponse(
-        output_path,
-        filename=clip,
-        media_type="video/mp4",
-        headers={"Content-Disposition": f"attachment; filename={clip}"}
-    )
+async def obtener_lista_videos(canal: str = Query(..., min_length=1), timestamp_start: str = Query(..., min_length=1), timestamp_end: str = Query(..., min_length=1)):
+    # Para todos los hits de una página de una vez está POST /videos/lote
+    # "referencia" es el segmento que contiene timestamp_start (puede no coincidir exacto con el nombre)
+    if not canal_valido(canal):
+        return JSONResponse(content={"error": "Canal inválido"}, status_code=400)
+    try:
+        ventana = transcripciones_handler.obtener_ventana_videos(canal, timestamp_start, timestamp_end)
+    except ValueError:
+        return JSONResponse(content={"error": "Formato de fecha inválido, se espera 2025-09-12T12:07:30Z"}, status_code=400)
+    if precarga is not None and ventana["videos"]:
+        pedir_precarga([(canal, v) for v in orden_precarga(ventana["videos"], ventana["referencia"])])
+    return ventana
 
-@app.post("/concatenar")
-def concatenar_videos(canal: str = Body(..., embed=True), videos: list[str] = Body(..., embed=True)):
+
+@app.post("/videos/lote")
+async def obtener_ventanas_videos(
+    request: Request,
+    ventanas: list[dict] = Body(..., embed=True),
+    rango: int = Body(3, embed=True, ge=0, le=50),
+    incluir_transcripcion: bool = Body(False, embed=True),
+):
     """
-    Concatena una lista de videos usando FFmpeg y devuelve el archivo resultante.
+    Las ventanas de /videos de muchos hits en un solo request (p. ej. todos los de una página de /buscar).
     Args:
-        videos (list): Lista de rutas de videos a concatenar
-        
+        ventanas (list): [{"canal": "a24", "timestamp_start": ISO, "timestamp_end": ISO}, ...]
+        rango (int): Segmentos antes y después del de referencia
+        incluir_transcripcion (bool): Sumar el texto completo de cada hit (con Elasticsearch, en un solo _msearch)
+    Returns:
+        dict: {"ventanas": [...]} en el mismo orden, cada una {"videos", "referencia"[, "texto"]} o {"error"}
+        o
+        JSONResponse: Error en caso de problemas
+    """
+    if not ventanas:
+        return JSONResponse(content={"error": "No se enviaron ventanas"}, status_code=400)
+    if len(ventanas) > MAX_HITS_LOTE:
+        return JSONResponse(content={"error": f"Como máximo {MAX_HITS_LOTE} ventanas por pedido"}, status_code=400)
+    pedidos = []
+    for v in ventanas:
+        canal = v.get("canal")
+        if not isinstance(canal, str) or not canal_valido(canal):
+            return JSONResponse(content={"error": f"Canal inválido en {v}"}, status_code=400)
+        pedidos.append((canal, v.get("timestamp_start"), v.get("timestamp_end")))
+
+    resultados = transcripciones_handler.obtener_ventanas_videos(pedidos, rango)
+    if incluir_transcripcion:
+        validos = [i for i, r in enumerate(resultados) if "error" not in r]
+        transcripciones = await transcripciones_handler.obtener_transcripciones(
+            [(pedidos[i][0], pedidos[i][1]) for i in validos])
+        for i, t in zip(validos, transcripciones):
+            resultados[i]["texto"] = None if t is None else t.texto
+
+    if precarga is not None:
+        # Solo el segmento de referencia de cada hit: de una página se abren pocos,
+        # y precargar todas las ventanas sacaría del cache lo que sí se está mirando
+        pedir_precarga([(canal, r["referencia"]) for (canal, _, _), r in zip(pedidos, resultados) if r.get("referencia")])
+    return respuesta_json(request, {"ventanas": resultados})
+
+
+def orden_precarga(videos: list, referencia: str) -> list:
+    """Primero el de referencia (el que se reproduce), después los siguientes y al final los anteriores."""
+    if referencia not in videos:
+        return videos
+    i = videos.index(referencia)
+    return videos[i:] + videos[:i][::-1]
+
+
+def rutas_precarga(canal: str, videos: list) -> list:
+    catalogo = transcripciones_handler.catalogo.canal(canal)
+    rutas = []
+    for v in videos:
+        # El reproductor va a pedir el proxy y un /concatenar el original
+        if proxies is not None and proxies.listo(canal, v):
+            rutas.append(proxies.ruta(canal, v))
+        ruta = catalogo.ruta(v)
+        if ruta is not None:
+            rutas.append(ruta)
+    return rutas
+
+
+def pedir_precarga(pares: list):
+    """
+    Encola en la precarga los segmentos (canal, video) sin que el request lo espere:
+    armar las rutas mira el disco (si el proxy ya está), así que va en un thread.
+    """
+    if pares:
+        asyncio.get_running_loop().run_in_executor(
+            None, lambda: precarga.pedir([ruta for canal, v in pares for ruta in rutas_precarga(canal, [v])]))
+
+@app.api_route("/descargar", methods=["GET", "HEAD"])
+async def descargar_clip(request: Request, clip: str = Query(...)):
+    if os.path.basename(clip) != clip:
+        return JSONResponse(content={"error": "El archivo no existe"}, status_code=404)
+    try:
+        # Los clips tienen nombre por contenido, así que se pueden cachear como inmutables
+        respuesta = await respuesta_archivo(request, os.path.join(OUTPUT_DIR, clip), "video/mp4", filename=clip)
+    except FileNotFoundError:
+        return JSONResponse(content={"error": "El archivo no existe"}, status_code=404)
+    await asyncio.to_thread(cache_clips.tocar, clip)
+    return respuesta
+
+
+@app.api_route("/segmentos/{canal}/{archivo}", methods=["GET", "HEAD"])
+async def servir_segmento(
+    request: Request,
+    canal: str,
+    archivo: str,
+    calidad: str = Query(CALIDAD_PROXY, pattern=f"^({CALIDAD_PROXY}|{CALIDAD_ORIGINAL})$"),
+):
+    """
+    Sirve un segmento .ts con soporte de Range, ETag/Last-Modified y Cache-Control inmutable,
+    para que el reproductor pueda hacer seek sin bajar el archivo entero.
+    Por defecto manda el proxy liviano si ya está; con calidad=original, el segmento tal cual se grabó.
+    """
+    rutas = await validar_videos(canal, [archivo])
+    if isinstance(rutas, JSONResponse):
+        rutas.status_code = 404
+        return rutas
+    ruta, cache_control = rutas[0], CACHE_INMUTABLE
+    if calidad == CALIDAD_PROXY and proxies is not None:
+        if (await proxies.listos(canal, [archivo]))[0]:
+            ruta = proxies.ruta(canal, archivo)
+        else:
+            # Todavía no hay proxy: va el original, pero sin cache inmutable porque esta URL después sirve el proxy
+            cache_control = "no-cache"
+    # Solo la primera lectura del archivo (el resto de los rangos ya vienen del cache)
+    if precarga is not None and request.headers.get("range", "bytes=0-").startswith("bytes=0-"):
+        precarga.registrar_uso([ruta], "segmento")
+    try:
+        return await respuesta_archivo(request, ruta, "video/mp2t", cache_control=cache_control)
+    except FileNotFoundError:
+        # Se borró o se movió de raíz después de validarlo
+        return JSONResponse(content={"error": f"{archivo} ya no existe"}, status_code=404)
+
+
+@app.get("/hls/{canal}.m3u8")
+async def playlist_hls(
+    canal: str,
+    desde: str = Query(None, description="Inicio del rango, ej: 2025-09-12T12:07:30Z"),
+    hasta: str = Query(None, description="Fin del rango, ej: 2025-09-12T12:18:00Z"),
+    vivo: bool = Query(False, description="Playlist deslizante con los segmentos más nuevos"),
+    cantidad: int = Query(6, ge=1, le=100, description="Segmentos en la playlist en vivo"),
+    calidad: str = Query(CALIDAD_PROXY, pattern=f"^({CALIDAD_PROXY}|{CALIDAD_ORIGINAL})$"),
+):
+    """
+    Playlist HLS armada con el catálogo de segmentos del canal.
+    Con desde/hasta es una playlist VOD de ese rango; con vivo=true una ventana deslizante de los últimos segmentos.
+    """
+    catalogo = transcripciones_handler.catalogo.canal(canal)
+    if vivo:
+        segmentos, (primera_secuencia, discontinuidades) = catalogo.ultimos(cantidad)
+    else:
+        if not desde or not hasta:
+            return JSONResponse(content={"error": "Faltan desde/hasta (o vivo=true)"}, status_code=400)
+        try:
+            segmentos, (primera_secuencia, discontinuidades) = catalogo.tramo(iso_a_epoch(desde), iso_a_epoch(hasta))
+        except ValueError:
+            return JSONResponse(content={"error": "Formato de fecha inválido, se espera 2025-09-12T12:07:30Z"}, status_code=400)
+    if not segmentos:
+        return JSONResponse(content={"error": "No hay segmentos en ese rango"}, status_code=404)
+
+    # Cada segmento apunta a la calidad que hay ahora, así la URL siempre sirve lo mismo y se puede cachear
+    calidades = None
+    if proxies is not None:
+        listos = await proxies.listos(canal, [s.nombre for s in segmentos]) if calidad == CALIDAD_PROXY else [False] * len(segmentos)
+        calidades = [CALIDAD_PROXY if listo else CALIDAD_ORIGINAL for listo in listos]
+    # Un stat por segmento: todos juntos en un thread
+    duraciones = await asyncio.to_thread(lambda: [duracion_real(canal, s) for s in segmentos])
+    playlist = armar_playlist(canal, segmentos, primera_secuencia, discontinuidades, vivo=vivo,
+                              calidades=calidades, duraciones=duraciones)
+    # La playlist en vivo cambia con cada segmento nuevo; la de un rango cerrado casi no cambia
+    cache_control = "no-cache" if vivo else "public, max-age=60"
+    return Response(content=playlist, media_type=MEDIA_TYPE_M3U8, headers={"Cache-Control": cache_control})
+
+
+@app.get("/miniaturas/{canal}")
+async def miniatura_de_instante(canal: str, instante: str = Query(..., description="ej: 2025-09-12T12:07:30Z")):
+    """Redirige al poster del segmento que contiene `instante` (lo usan las tarjetas de resultados)."""
+    try:
+        epoch = iso_a_epoch(instante)
+    except ValueError:
+        return JSONResponse(content={"error": "Formato de fecha inválido, se espera 2025-09-12T12:07:30Z"}, status_code=400)
+    catalogo = transcripciones_handler.catalogo.canal(canal)
+    catalogo.refrescar()
+    i = catalogo.indice_de(epoch)
+    if i is None:
+        return JSONResponse(content={"error": "No hay un segmento en ese instante"}, status_code=404)
+    url = f"/miniaturas/{quote(canal)}/{quote(catalogo.segmentos[i].nombre)}/{ARCHIVO_POSTER}"
+    return RedirectResponse(url, status_code=307, headers={"Cache-Control": "public, max-age=60"})
+
+
+@app.get("/miniaturas/{canal}/{segmento}/{archivo}")
+async def servir_miniatura(request: Request, canal: str, segmento: str, archivo: str):
+    """
+    Poster, sprite o pista VTT de un segmento (unos KB en lugar del .ts entero).
+    Si todavía no se generaron, se generan en el momento, adelante de las que encoló el vigilante.
+    """
+    if archivo not in ARCHIVOS:
+        return JSONResponse(content={"error": f"Se espera uno de {sorted(ARCHIVOS)}"}, status_code=404)
+    rutas = await validar_videos(canal, [segmento])
+    if isinstance(rutas, JSONResponse):
+        rutas.status_code = 404
+        return rutas
+    seg = transcripciones_handler.catalogo.canal(canal).obtener(segmento)
+    if seg is None:
+        return JSONResponse(content={"error": f"{segmento} no es un segmento del canal"}, status_code=404)
+
+    if not (await miniaturas.listos(canal, [segmento]))[0]:
+        trabajo = miniaturas.generar(canal, seg, prioridad=PRIORIDAD_PEDIDO)
+        with medir("ffmpeg"):
+            await trabajo.esperar()
+        if trabajo.estado != TERMINADO:
+            return JSONResponse(content={"error": trabajo.error or "No se pudieron generar las miniaturas"}, status_code=500)
+    ruta = os.path.join(miniaturas.carpeta(canal, segmento), archivo)
+    try:
+        return await respuesta_archivo(request, ruta, ARCHIVOS[archivo])
+    except FileNotFoundError:
+        return JSONResponse(content={"error": f"{archivo} ya no existe"}, status_code=404)
+
+
+def duracion_real(canal: str, segmento):
+    """Duración según ffprobe si el segmento ya se analizó; si no, la del nombre (hace un stat)."""
+    meta = metadatos.obtener(segmento.ruta)
+    return (meta or {}).get("duracion") or segmento.duracion
+
+
+@app.get("/metadatos/{canal}/{archivo}")
+async def metadatos_segmento(canal: str, archivo: str):
+    """Duración real, codecs, keyframes (segundos desde el inicio y byte) y tamaño de un segmento."""
+    rutas = await validar_videos(canal, [archivo])
+    if isinstance(rutas, JSONResponse):
+        rutas.status_code = 404
+        return rutas
+    detalle = await asyncio.to_thread(metadatos.detalle, rutas[0])
+    if detalle is None:
+        return JSONResponse(content={"error": "El segmento todavía no se analizó"}, status_code=404)
+    return detalle
+
+
+async def validar_videos(canal, videos):
+    """
+    Verifica que los videos sean segmentos del canal y existan, en la raíz en la que estén.
+    Los nombres se resuelven con el catálogo en memoria y los archivos se miran todos juntos en un thread.
     Returns:
-        FileResponse: Archivo de video concatenado para descarga
+        list: rutas de los videos, en el mismo orden
         o
         JSONResponse: Error en caso de problemas
     """
     if not videos:
         return JSONResponse(content={"error": "No se enviaron videos"}, status_code=400)
+    # Solo nombres de archivo, nada de "../" para salir de la carpeta del canal
+    if not canal_valido(canal):
+        return JSONResponse(content={"error": f"Canal inválido: {canal}"}, status_code=400)
 
-    # Crear archivo temporal con lista de inputs
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    # ffmpeg necesita leer de una lista de archivos, por lo que guardamos los nombres en un archivo temporal
-    list_file = os.path.join(OUTPUT_DIR, f"list_{uuid.uuid4().hex}.txt")
-    
-    # Verificar que los videos (su dir en memoria) existan
-    for v in videos:
-        video_path = os.path.join(VIDEO_DIR, canal, v)
-        if not os.path.exists(video_path):
+    catalogo = transcripciones_handler.catalogo.canal(canal)
+    validos = [os.path.basename(v) == v for v in videos]
+    rutas = [catalogo.ruta(v) if valido else None for v, valido in zip(videos, validos)]
+    if any(r is None and valido for r, valido in zip(rutas, validos)):
+        # Puede ser un segmento recién grabado que el catálogo todavía no vio
+        await asyncio.to_thread(catalogo.refrescar, True)
+        rutas = [catalogo.ruta(v) if valido else None for v, valido in zip(videos, validos)]
+    existen = await asyncio.to_thread(lambda: [r is not None and os.path.exists(r) for r in rutas])
+    for v, existe in zip(videos, existen):
+        if not existe:
             return JSONResponse(
-                content={"error": f"El archivo {v} no existe. Ruta buscada: {os.path.abspath(video_path)}"}, 
+                content={"error": f"El archivo {v} no existe en el canal {canal}"},
                 status_code=400
             )
-    
-    # Obtener paths absolutos para evitar problemas de rutas relativas
-    current_dir = os.path.abspath(os.getcwd())
-    
-    # Crear el archivo con las rutas absolutas
-    with open(list_file, "w", encoding="utf-8") as f:
-        for v in videos:
-            # Usamos normpath para manejar correctamente las barras según el sistema operativo
-            video_path = os.path.normpath(os.path.join(current_dir, VIDEO_DIR, canal, v))
-            f.write(f"file '{video_path}'\n")
-            print(f"Añadiendo video: {video_path}")
-
-    # Nombre de salida
-    output_file = os.path.join(OUTPUT_DIR, f"clip_{uuid.uuid4().hex}.mp4")
-
-    # Ejecutar FFmpeg usando la biblioteca ffmpeg de Python
-    try:
-        print("Concatenando videos con ffmpeg...")
-        
-        # Usamos el comando ffmpeg directamente desde el PATH con rutas absolutas
-        output_path = os.path.abspath(output_file)
+    return rutas
+
+
+async def resolver_concatenacion(canal, videos, prioridad=0):
+    """
+    Valida los videos y resuelve la concatenación contra el cache de clips.
+    Returns:
+        str: nombre del clip si ya estaba generado
+        o
+        Trabajo: el que está en curso para los mismos videos, o uno nuevo ya encolado
+        o
+        JSONResponse: Error en caso de problemas
+    """
+    rutas = await validar_videos(canal, videos)
+    if isinstance(rutas, JSONResponse):
+        return rutas
+
+    def preparar():
+        # Con los metadatos ya guardados se rechaza antes de encolar lo que ffmpeg no va a poder pegar con -c copy
+        problema = validar_concatenacion([(v, metadatos.obtener(r)) for v, r in zip(videos, rutas)])
+        # Mismo canal + mismos segmentos (y sin modificar) = mismo clip
+        return problema, None if problema else cache_clips.clave(canal, rutas)
+
+    try:
+        problema, clave = await asyncio.to_thread(preparar)
+    except FileNotFoundError:
+        return JSONResponse(content={"error": "Un segmento del rango ya no existe"}, status_code=404)
+    if problema:
+        return JSONResponse(content={"error": problema}, status_code=422)
+
+    def armar(output_path):
+        if precarga is not None:
+            precarga.registrar_uso(rutas, "concatenar")
+            # ffmpeg lee los segmentos de a uno; así los discos en los que están los van leyendo a la vez
+            precarga.pedir(rutas)
+        # ffmpeg necesita leer de una lista de archivos, por lo que guardamos los nombres en un archivo temporal
+        list_file = os.path.abspath(os.path.join(OUTPUT_DIR, f"list_{uuid.uuid4().hex}.txt"))
+
+        # Crear el archivo con las rutas absolutas (cada segmento en la raíz en la que esté)
+        with open(list_file, "w", encoding="utf-8") as f:
+            for ruta in rutas:
+                # Usamos normpath para manejar correctamente las barras según el sistema operativo
+                video_path = os.path.normpath(os.path.abspath(ruta))
+                f.write(f"file '{video_path}'\n")
+                logger.debug("Añadiendo video", extra={"video": video_path})
+
+        # Duración esperada según los nombres de los segmentos, para poder informar el progreso
+        catalogo = transcripciones_handler.catalogo.canal(canal)
+        segmentos = [catalogo.obtener(v) for v in videos]
+        duracion_total = sum(duracion_real(canal, s) for s in segmentos if s is not None) or None
 
-        list_path = os.path.abspath(list_file)
-        
         cmd = [
-            "ffmpeg", "-y", "-f", "concat", "-safe", "0",
-            "-i", list_path,
+            FFMPEG_BIN, "-y", "-f", "concat", "-safe", "0",
+            "-i", list_file,
             "-c", "copy", output_path
         ]
-        print(f"Ejecutando comando: {' '.join(cmd)}")
-        
-        # Ejecutar el comando desde el directorio raíz para evitar problemas con rutas
-        proceso = subprocess.run(
-            cmd, 
-            check=True, 
-            capture_output=True, 
-            text=True
+        return Trabajo(
+            cmd, salida=output_path, duracion_total=duracion_total, temporales=[list_file], prioridad=prioridad,
         )
+
+    return await encolar_con_cache(clave, armar)
+
+
+async def resolver_recorte(canal, start, end, prioridad=0):
+    """
+    Resuelve un recorte con precisión de segundos entre dos timestamps ISO.
+    Solo se recodifican los segmentos de las puntas; los del medio se copian.
+    Returns:
+        str | Trabajo | JSONResponse: Igual que resolver_concatenacion
+    """
+    if not canal_valido(canal):
+        return JSONResponse(content={"error": "Canal inválido"}, status_code=400)
+    try:
+        inicio, fin = iso_a_epoch(start), iso_a_epoch(end)
+    except ValueError:
+        return JSONResponse(content={"error": "Formato de fecha inválido, se espera 2025-09-12T12:07:30Z"}, status_code=400)
+    if fin <= inicio:
+        return JSONResponse(content={"error": "end tiene que ser posterior a start"}, status_code=400)
+
+    tramos = planificar_recorte(transcripciones_handler.catalogo.canal(canal), inicio, fin)
+    if not tramos:
+        return JSONResponse(content={"error": "No hay segmentos en ese rango"}, status_code=404)
+
+    def preparar():
+        problema = validar_concatenacion([(os.path.basename(t.ruta), metadatos.obtener(t.ruta)) for t in tramos])
+        if problema:
+            return problema, None, None, None
+        # Las puntas se recodifican como el primer segmento que se copia entero, para poder pegarlas
+        copiado = next((t for t in tramos if not t.recodificar), None)
+        referencia = codificacion = None
+        if copiado is not None and any(t.recodificar for t in tramos):
+            detalle = metadatos.detalle(copiado.ruta)
+            codificacion = parametros_codificacion(detalle)
+            if codificacion is None:
+                logger.info("No se puede reproducir la codificación de los segmentos, se recodifica el clip entero",
+                            extra={"canal": canal, "segmento": os.path.basename(copiado.ruta)})
+                for tramo in tramos:
+                    tramo.recodificar = True
+            else:
+                referencia = (os.path.basename(copiado.ruta), detalle)
+        # Los mismos segmentos con otros cortes son otro clip
+        return None, cache_clips.clave(canal, [t.ruta for t in tramos], extra=f"{inicio}-{fin}"), codificacion, referencia
+
+    try:
+        problema, clave, codificacion, referencia = await asyncio.to_thread(preparar)
+    except FileNotFoundError:
+        return JSONResponse(content={"error": "Un segmento del rango ya no existe"}, status_code=404)
+    if problema:
+        return JSONResponse(content={"error": problema}, status_code=422)
+
+    def armar(output_path):
+        previos, temporales, partes, puntas = [], [], [], []
+        for tramo in tramos:
+            if tramo.recodificar:
+                punta = os.path.abspath(os.path.join(OUTPUT_DIR, f"punta_{uuid.uuid4().hex}.ts"))
+                previos.append(comando_recodificar(FFMPEG_BIN, tramo, punta, codificacion))
+                temporales.append(punta)
+                partes.append(punta)
+                puntas.append(punta)
+            else:
+                partes.append(os.path.abspath(tramo.ruta))
+
+        list_file = os.path.abspath(os.path.join(OUTPUT_DIR, f"list_{uuid.uuid4().hex}.txt"))
+        with open(list_file, "w", encoding="utf-8") as f:
+            for parte in partes:
+                f.write(f"file '{os.path.normpath(parte)}'\n")
+        temporales.append(list_file)
+
+        cmd = [
+            FFMPEG_BIN, "-y", "-f", "concat", "-safe", "0",
+            "-i", list_file,
+            "-c", "copy", output_path
+        ]
+        # Si hay segmentos copiados, antes de pegar se confirma que las puntas salieron compatibles
+        validar = None if referencia is None else lambda: validar_puntas(referencia, puntas, metadatos.ffprobe_bin)
+        return Trabajo(
+            cmd, salida=output_path, duracion_total=fin - inicio, temporales=temporales,
+            prioridad=prioridad, previos=previos, validar_previos=validar,
+        )
+
+    return await encolar_con_cache(clave, armar)
+
+
+async def encolar_con_cache(clave, armar):
+    """
+    Devuelve el clip si ya está en cache, el trabajo en curso si ya se está generando (en este
+    worker o en otro), o arma uno nuevo con `armar(output_path)` y lo encola.
+    Returns:
+        str | Trabajo | TrabajoRemoto
+    """
+    en_vuelo = cache_clips.en_vuelo.get(clave)
+    if isinstance(en_vuelo, Trabajo):
+        logger.info("Ya hay un ffmpeg en curso para este clip, se reutiliza el trabajo", extra={"trabajo": en_vuelo.id})
+        return en_vuelo
+    if en_vuelo is None:
+        # Mientras se busca o se arma, los pedidos iguales esperan esta misma tarea. Va aparte del
+        # request (shield), así si el cliente que la empezó corta, a los demás no se les cancela
+        en_vuelo = cache_clips.en_vuelo[clave] = asyncio.ensure_future(_buscar_o_encolar(clave, armar))
+    return await asyncio.shield(en_vuelo)
+
+
+async def _buscar_o_encolar(clave, armar):
+    # ffmpeg escribe a un nombre temporal y recién al terminar bien se renombra al del cache,
+    # así nadie ve un clip a medio escribir
+    nombre_final = cache_clips.nombre_clip(clave)
+    output_path = os.path.abspath(os.path.join(OUTPUT_DIR, f"tmp_{uuid.uuid4().hex}.mp4"))
+
+    def buscar_o_armar():
+        # Buscar el clip, `armar` (que escribe la lista para ffmpeg) y la reserva tocan el disco: van en un thread
+        archivo = cache_clips.buscar(clave)
+        if archivo is not None:
+            return archivo
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        trabajo = armar(output_path)
+        otro = cache_clips.reservar(clave, trabajo.id, al_reservar=None if registro_trabajos is None else
+                                    lambda: registro_trabajos.guardar(trabajo, sincronico=True))
+        remoto = registro_trabajos.remoto(otro) if otro is not None and registro_trabajos is not None else None
+        if remoto is not None and remoto.estado not in (ERROR, CANCELADO):
+            for temporal in trabajo.temporales:
+                if os.path.exists(temporal):
+                    os.remove(temporal)
+            return remoto
+        return trabajo
+
+    try:
+        resultado = await asyncio.to_thread(buscar_o_armar)
+    except BaseException:
+        cache_clips.en_vuelo.pop(clave, None)
+        raise
+    if not isinstance(resultado, Trabajo):
+        cache_clips.en_vuelo.pop(clave, None)
+        if isinstance(resultado, str):
+            logger.info("Clip en cache", extra={"clip": resultado})
+        else:
+            logger.info("Otro worker ya está generando este clip, se espera ese trabajo", extra={"trabajo": resultado.id})
+        return resultado
+
+    def publicar_clip(trabajo):
+        final_path = os.path.join(os.path.dirname(trabajo.salida), nombre_final)
+        os.replace(trabajo.salida, final_path)
+        trabajo.salida = final_path
+        cache_clips.registrar(nombre_final)
+
+    trabajo = resultado
+    trabajo.al_terminar = publicar_clip
+    cache_clips.en_vuelo[clave] = trabajo
+    cola_trabajos.enviar(trabajo)
+    asyncio.create_task(_liberar_en_vuelo(clave, trabajo))
+    return trabajo
+
+
+async def _liberar_en_vuelo(clave, trabajo):
+    await trabajo.esperar()
+    if cache_clips.en_vuelo.get(clave) is trabajo:
+        del cache_clips.en_vuelo[clave]
+    await asyncio.to_thread(cache_clips.liberar, clave, trabajo.id)
+
+
+@app.post("/concatenar")
+async def concatenar_videos(canal: str = Body(..., embed=True), videos: list[str] = Body(..., embed=True)):
+    """
+    Concatena una lista de videos usando FFmpeg y devuelve el archivo resultante.
+    El ffmpeg corre en la cola de trabajos, así que el request espera sin ocupar un thread.
+    Args:
+        videos (list): Lista de rutas de videos a concatenar
         
-        print("FFmpeg ejecutado correctamente")
-        
-        # Verificar que el archivo de salida realmente se haya creado
-        if not os.path.exists(output_file) or os.path.getsize(output_file) == 0:
-            print(f"Error: El archivo de salida no se creó correctamente: {output_file}")
-            return JSONResponse(
-                content={"error": "El archivo de salida no se generó correctamente"}, 
-                status_code=500
-            )
-            
-        print(f"Archivo generado exitosamente: {output_file}, tamaño: {os.path.getsize(output_file)} bytes")
-    except subprocess.CalledProcessError as e:
-        print(f"Error al ejecutar FFmpeg: {e}")
-        print(f"Salida de error: {e.stderr}")
-        return JSONResponse(content={"error": f"FFmpeg falló: {e.stderr}"}, status_code=500)
-    except Exception as e:
-        print(f"Error inesperado: {e}")
-        return JSONResponse(content={"error": f"Error inesperado: {str(e)}"}, status_code=500)
-    finally:
-        # Limpiar archivos temporales
-        if os.path.exists(list_file):
-            print(f"Eliminando archivo temporal: {list_file}")
-            os.remove(list_file)
-
-
-    return {"archivo": os.path.basename(output_file)}
+    Returns:
+        dict: {"archivo": nombre del clip generado}
+        o
+        JSONResponse: Error en caso de problemas
+    """
+    logger.info("Concatenando videos", extra={"canal": canal, "videos": len(videos)})
+    return await esperar_clip(await resolver_concatenacion(canal, videos))
+
+
+def trabajo_conservado(trabajo) -> bool:
+    """Si alguien lo pidió por /trabajos/... (en este worker o en otro), ver conservar_trabajo."""
+    if trabajo.conservar:
+        return True
+    return registro_trabajos is not None and registro_trabajos.se_conserva(trabajo.id)
+
+
+async def conservar_trabajo(trabajo):
+    """
+    El trabajo lo sigue un cliente por /trabajos/{id}: que no lo cancele un /concatenar o /recortar
+    que quedó esperando el mismo clip y cortó la conexión. Solo DELETE /trabajos/{id} lo cancela.
+    """
+    if isinstance(trabajo, TrabajoRemoto):
+        await asyncio.to_thread(registro_trabajos.conservar, trabajo.id)
+    else:
+        trabajo.conservar = True
+
+
+async def esperar_clip(trabajo):
+    """
+    Espera a que termine el trabajo que genera un clip.
+    Args:
+        trabajo: Lo que devuelve resolver_concatenacion / resolver_recorte
+    Returns:
+        dict: {"archivo": nombre del clip generado}
+        o
+        JSONResponse: Error en caso de problemas
+    """
+    if isinstance(trabajo, JSONResponse):
+        return trabajo
+    if isinstance(trabajo, str):
+        return {"archivo": trabajo}
+
+    trabajo.interesados += 1
+    try:
+        with medir("ffmpeg"):
+            await trabajo.esperar()
+    except asyncio.CancelledError:
+        # El cliente cortó la conexión: si nadie más espera este clip no tiene sentido seguir
+        trabajo.interesados -= 1
+        if trabajo.interesados == 0 and not trabajo_conservado(trabajo):
+            cola_trabajos.cancelar(trabajo.id)
+        raise
+
+    if trabajo.estado != TERMINADO:
+        return JSONResponse(content={"error": trabajo.error or "El trabajo fue cancelado"}, status_code=500)
+    logger.info("Clip generado", extra={"clip": trabajo.archivo,
+                                        "bytes": await asyncio.to_thread(os.path.getsize, os.path.join(OUTPUT_DIR, trabajo.archivo))})
+    return {"archivo": trabajo.archivo}
+
+
+@app.get("/exportar")
+async def exportar_videos(request: Request, canal: str = Query(..., min_length=1), videos: list[str] = Query(...), formato: str = Query("ts", pattern="^(ts|mp4)$")):
+    """
+    Exporta los videos en un solo request, sin el ida y vuelta de /concatenar + /descargar.
+    Args:
+        videos (list): ?videos=a.ts&videos=b.ts, en orden
+        formato (str): "ts" manda los segmentos MPEG-TS uno detrás de otro directo en la respuesta
+            (sin ffmpeg ni archivos temporales); "mp4" hace el remux con ffmpeg como /concatenar
+
+    Returns:
+        Response: El video para descarga
+        o
+        JSONResponse: Error en caso de problemas
+    """
+    if formato == "ts":
+        rutas = await validar_videos(canal, videos)
+        if isinstance(rutas, JSONResponse):
+            return rutas
+
+        def preparar():
+            if precarga is not None:
+                # Se mandan de a uno, pero cada disco va leyendo por adelantado los suyos
+                precarga.pedir(rutas)
+            # La respuesta abre cada segmento y mira su tamaño para el Content-Length
+            return RespuestaSegmentosTS(rutas, filename=nombre_exportacion(videos))
+
+        try:
+            return await asyncio.to_thread(preparar)
+        except FileNotFoundError:
+            return JSONResponse(content={"error": "Un segmento del rango ya no existe"}, status_code=404)
+
+    resultado = await concatenar_videos(canal, videos)
+    if isinstance(resultado, JSONResponse):
+        return resultado
+    return await descargar_clip(request, resultado["archivo"])
+
+
+@app.post("/exportar/lote")
+async def exportar_lote(
+    request: Request,
+    hits: list[dict] = Body(..., embed=True),
+    margen: int = Body(0, embed=True, ge=0, le=3600),
+    exacto: bool = Body(False, embed=True),
+    formato: str = Body("manifiesto", embed=True, pattern="^(manifiesto|zip)$"),
+    prioridad: int = Body(0, embed=True, ge=0),
+):
+    """
+    Exporta varios resultados de búsqueda en un solo request.
+    Args:
+        hits (list): [{"canal": "a24", "start": ISO, "end": ISO}, ...]
+        margen (int): Segundos extra antes y después de cada hit
+        exacto (bool): Cortar justo en los timestamps (como /recortar) en vez de exportar segmentos enteros
+        formato (str): "manifiesto" devuelve la lista de clips (para bajarlos con /descargar);
+            "zip" devuelve todos los clips en un .zip
+
+    Los hits del mismo canal que se pisan se fusionan en un solo clip, y los clips se generan
+    en paralelo en la cola de ffmpeg (hasta MAX_FFMPEG_CONCURRENTES a la vez).
+    Returns:
+        dict: {"clips": [{"canal", "start", "end", "archivo", "hits"}], "errores": [{"hits", "error"}]}
+        o
+        FileResponse: el .zip
+        o
+        JSONResponse: Error en caso de problemas
+    """
+    if not hits:
+        return JSONResponse(content={"error": "No se enviaron hits"}, status_code=400)
+    if len(hits) > MAX_HITS_LOTE:
+        return JSONResponse(content={"error": f"Como máximo {MAX_HITS_LOTE} hits por pedido"}, status_code=400)
+    rangos = []
+    for hit in hits:
+        canal = hit.get("canal")
+        if not isinstance(canal, str) or not canal_valido(canal):
+            return JSONResponse(content={"error": f"Canal inválido en {hit}"}, status_code=400)
+        try:
+            inicio, fin = iso_a_epoch(hit.get("start", "")), iso_a_epoch(hit.get("end", ""))
+        except (TypeError, ValueError):
+            return JSONResponse(content={"error": "Formato de fecha inválido, se espera 2025-09-12T12:07:30Z"}, status_code=400)
+        if fin <= inicio:
+            return JSONResponse(content={"error": f"end tiene que ser posterior a start en {hit}"}, status_code=400)
+        rangos.append((canal, inicio, fin))
+
+    # Exportando segmentos enteros, las ventanas se fusionan por segmento y no solo por rango
+    ventanas = agrupar_hits(rangos, margen, catalogo=None if exacto else transcripciones_handler.catalogo)
+    if not ventanas:
+        return JSONResponse(content={"error": "No hay segmentos para ninguno de los hits"}, status_code=404)
+
+    async def resolver(ventana):
+        if exacto:
+            return await resolver_recorte(ventana.canal, epoch_a_iso(ventana.inicio), epoch_a_iso(ventana.fin), prioridad)
+        segmentos = transcripciones_handler.catalogo.canal(ventana.canal).rango(ventana.inicio, ventana.fin)
+        return await resolver_concatenacion(ventana.canal, [s.nombre for s in segmentos], prioridad)
+
+    # Se encola todo antes de esperar, así la cola los reparte entre los workers
+    logger.info("Exportación en lote", extra={"hits": len(hits), "clips": len(ventanas)})
+    trabajos = await asyncio.gather(*(resolver(v) for v in ventanas))
+    resultados = await asyncio.gather(*(esperar_clip(t) for t in trabajos))
+
+    clips, errores = [], []
+    cubiertos = {i for v in ventanas for i in v.hits}
+    sin_segmentos = [i for i in range(len(hits)) if i not in cubiertos]
+    if sin_segmentos:
+        errores.append({"hits": sin_segmentos, "error": "No hay segmentos en ese rango"})
+    for ventana, resultado in zip(ventanas, resultados):
+        if isinstance(resultado, JSONResponse):
+            errores.append({"hits": ventana.hits, "error": json.loads(resultado.body)["error"]})
+            continue
+        clips.append({
+            "canal": ventana.canal, "start": epoch_a_iso(ventana.inicio), "end": epoch_a_iso(ventana.fin),
+            "archivo": resultado["archivo"], "nombre": ventana.nombre, "hits": ventana.hits,
+        })
+
+    if formato == "manifiesto":
+        return {"clips": clips, "errores": errores}
+    if not clips:
+        return JSONResponse(content={"error": "No se pudo generar ningún clip", "errores": errores}, status_code=500)
+    zip_path = os.path.abspath(os.path.join(OUTPUT_DIR, f"lote_{uuid.uuid4().hex}.zip"))
+    archivos = [(os.path.join(OUTPUT_DIR, c["archivo"]), c["nombre"]) for c in clips]
+    await asyncio.to_thread(armar_zip, zip_path, archivos)
+    # El zip es solo para esta respuesta: se borra cuando termina de mandarse
+    return FileResponse(zip_path, media_type="application/zip", filename="clips.zip",
+                        background=BackgroundTask(os.remove, zip_path))
+
+
+@app.post("/trabajos/concatenar")
+async def encolar_concatenacion(canal: str = Body(..., embed=True), videos: list[str] = Body(..., embed=True), prioridad: int = Body(0, embed=True, ge=0)):
+    """
+    Encola la concatenación y devuelve enseguida el id del trabajo.
+    El estado y el progreso se consultan con GET /trabajos/{id}.
+    Si el clip ya estaba en cache se devuelve directamente como terminado.
+    """
+    trabajo = await resolver_concatenacion(canal, videos, prioridad)
+    if isinstance(trabajo, JSONResponse):
+        return trabajo
+    if isinstance(trabajo, str):
+        return {"trabajo": None, "estado": TERMINADO, "archivo": trabajo}
+    await conservar_trabajo(trabajo)
+    return {"trabajo": trabajo.id, "estado": trabajo.estado}
+
+
+@app.post("/recortar")
+async def recortar_clip(canal: str = Body(..., embed=True), start: str = Body(..., embed=True), end: str = Body(..., embed=True)):
+    """
+    Genera un clip exacto entre start y end (ISO, con precisión de segundos), sin
+    arrastrar los segmentos enteros de las puntas.
+    Returns:
+        dict: {"archivo": nombre del clip generado}
+        o
+        JSONResponse: Error en caso de problemas
+    """
+    logger.info("Recortando", extra={"canal": canal, "start": start, "end": end})
+    return await esperar_clip(await resolver_recorte(canal, start, end))
+
+
+@app.post("/trabajos/recortar")
+async def encolar_recorte(canal: str = Body(..., embed=True), start: str = Body(..., embed=True), end: str = Body(..., embed=True), prioridad: int = Body(0, embed=True, ge=0)):
+    """Como /trabajos/concatenar pero para un recorte exacto (ver /recortar)."""
+    trabajo = await resolver_recorte(canal, start, end, prioridad)
+    if isinstance(trabajo, JSONResponse):
+        return trabajo
+    if isinstance(trabajo, str):
+        return {"trabajo": None, "estado": TERMINADO, "archivo": trabajo}
+    await conservar_trabajo(trabajo)
+    return {"trabajo": trabajo.id, "estado": trabajo.estado}
+
+
+@app.get("/trabajos/{trabajo_id}")
+async def estado_trabajo(trabajo_id: str):
+    trabajo = cola_trabajos.obtener(trabajo_id)
+    if trabajo is None and registro_trabajos is not None and trabajo_id.isalnum():
+        # Lo corre otro worker
+        trabajo = await asyncio.to_thread(registro_trabajos.remoto, trabajo_id)
+    if trabajo is None:
+        return JSONResponse(content={"error": "El trabajo no existe"}, status_code=404)
+    return trabajo.a_dict()
+
+
+@app.delete("/trabajos/{trabajo_id}")
+async def cancelar_trabajo(trabajo_id: str):
+    if cola_trabajos.cancelar(trabajo_id):
+        return cola_trabajos.obtener(trabajo_id).a_dict()
+    if cola_trabajos.obtener(trabajo_id) is None and registro_trabajos is not None and trabajo_id.isalnum():
+        # Lo corre otro worker: se le deja el pedido y lo cancela él
+        trabajo = await asyncio.to_thread(registro_trabajos.pedir_cancelacion, trabajo_id)
+        if trabajo is not None:
+            return trabajo.a_dict()
+    return JSONResponse(content={"error": "El trabajo no existe o ya terminó"}, status_code=404)
+
+
+@app.get("/metrics")
+async def metricas():
+    """Métricas en formato de texto de Prometheus (con varios workers, las de todos con la etiqueta worker)."""
+    texto = REGISTRO.exponer()
+    if metricas_workers is not None:
+        texto = await asyncio.to_thread(metricas_workers.combinar, texto)
+    return Response(content=texto, media_type=CONTENT_TYPE_PROMETHEUS)
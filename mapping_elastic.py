@@ -44,6 +44,12 @@
         "datetime" : {
           "type" : "date"
         },
+        "doc_id" : {
+          "type" : "keyword"
+        },
+        "end_datetime" : {
+          "type" : "date"
+        },
         "filtered" : {
           "type" : "boolean"
         },
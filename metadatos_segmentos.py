@@ -0,0 +1,311 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from procesamiento_segmentos import roundrobin
+
+# Metadatos reales de cada segmento, sacados con ffprobe: duración, parámetros de
+# los codecs, keyframes (tiempo y byte) y tamaño. El nombre del archivo dice cuánto
+# debería durar el segmento, pero no si está truncado, dañado o grabado con otros
+# parámetros (lo que rompe un concat con -c copy).
+# ffprobe corre solo en segundo plano, nunca durante un request. Los resultados se
+# guardan en SQLite con clave ruta + mtime + tamaño (si el archivo cambia, el dato
+# deja de valer y se vuelve a analizar) y el resumen se mantiene en memoria, así que
+# consultarlo en un request es un stat y un acceso a un dict.
+# Con varios workers (servidor.py) el objeto se crea antes del fork y cada proceso
+# abre su propia conexión; solo uno corre el vigilante y los demás leen de la base
+# lo que no tienen en memoria.
+
+# Un segmento modificado hace menos de esto puede estar escribiéndose todavía
+ESPERA_ESCRITURA_SEGUNDOS = 10
+
+logger = logging.getLogger(__name__)
+
+
+def comando_streams(ruta: str, ffprobe_bin: str = "ffprobe") -> list:
+    return [ffprobe_bin, "-v", "error", "-of", "json", "-show_format", "-show_streams", ruta]
+
+
+def comando_keyframes(ruta: str, ffprobe_bin: str = "ffprobe") -> list:
+    """Paquetes del primer stream de video, sin decodificar: solo tiempo, posición y flags."""
+    return [ffprobe_bin, "-v", "error", "-select_streams", "v:0", "-show_packets",
+            "-show_entries", "packet=pts_time,pos,flags", "-of", "compact=p=0:nk=0", ruta]
+
+
+def _numero(valor, tipo=float):
+    try:
+        return tipo(valor)
+    except (TypeError, ValueError):
+        return None
+
+
+def parsear_streams(salida: dict) -> dict:
+    """JSON de -show_format -show_streams -> resumen del segmento."""
+    formato = salida.get("format", {})
+    video = next((s for s in salida.get("streams", []) if s.get("codec_type") == "video"), None)
+    audio = next((s for s in salida.get("streams", []) if s.get("codec_type") == "audio"), None)
+    meta = {
+        "duracion": _numero(formato.get("duration")),
+        "inicio_pts": _numero(formato.get("start_time")),
+        "bitrate": _numero(formato.get("bit_rate"), int),
+        "video": None,
+        "audio": None,
+    }
+    if video is not None:
+        meta["video"] = {
+            "codec": video.get("codec_name"),
+            "perfil": video.get("profile"),
+            "ancho": video.get("width"),
+            "alto": video.get("height"),
+            "pix_fmt": video.get("pix_fmt"),
+            "fps": video.get("r_frame_rate"),
+        }
+    if audio is not None:
+        meta["audio"] = {
+            "codec": audio.get("codec_name"),
+            "frecuencia": _numero(audio.get("sample_rate"), int),
+            "canales": audio.get("channels"),
+        }
+    return meta
+
+
+def parsear_keyframes(salida: str, inicio_pts: float = None) -> list:
+    """'pts_time=1.4|pos=564|flags=K__' por línea -> [[segundos desde el inicio del segmento, byte], ...]"""
+    keyframes = []
+    for linea in salida.splitlines():
+        campos = dict(c.split("=", 1) for c in linea.split("|") if "=" in c)
+        if "K" not in campos.get("flags", ""):
+            continue
+        pts, pos = _numero(campos.get("pts_time")), _numero(campos.get("pos"), int)
+        if pts is None:
+            continue
+        keyframes.append([round(pts - (inicio_pts or 0), 6), pos])
+    return keyframes
+
+
+def firma_copia(meta: dict) -> tuple:
+    """Lo que tiene que coincidir entre segmentos para poder pegarlos con -c copy."""
+    video, audio = meta.get("video") or {}, meta.get("audio") or {}
+    return (video.get("codec"), video.get("ancho"), video.get("alto"), video.get("pix_fmt"),
+            audio.get("codec"), audio.get("frecuencia"), audio.get("canales"))
+
+
+def validar_concatenacion(metadatos: list) -> str:
+    """
+    Args:
+        metadatos (list): (nombre, resumen) de cada segmento, en orden; resumen None si todavía no se analizó
+    Returns:
+        str: descripción del problema, o None si se pueden concatenar (los no analizados se dejan pasar)
+    """
+    referencia = None
+    for nombre, meta in metadatos:
+        if meta is None:
+            continue
+        if meta.get("error"):
+            return f"El segmento {nombre} está dañado: {meta['error']}"
+        if not meta.get("duracion") or meta.get("video") is None:
+            return f"El segmento {nombre} no tiene video legible"
+        if referencia is None:
+            referencia = (nombre, firma_copia(meta))
+        elif firma_copia(meta) != referencia[1]:
+            return (f"{nombre} tiene otros parámetros de codificación que {referencia[0]} "
+                    f"({firma_copia(meta)} vs {referencia[1]}), no se pueden concatenar sin recodificar")
+    return None
+
+
+class MetadatosSegmentos:
+    def __init__(self, ruta_db: str, catalogo, concurrencia: int = 2, niceness: int = 10,
+                 ffprobe_bin: str = "ffprobe"):
+        self.catalogo = catalogo
+        self.concurrencia = concurrencia
+        self.niceness = niceness
+        self.ffprobe_bin = ffprobe_bin
+        self.analizados = 0
+        self.fallidos = 0
+        self._lock = threading.Lock()
+        self._ruta_db = ruta_db
+        # Se abre en el proceso que la usa (una conexión de SQLite no sobrevive a un fork)
+        self._db = None
+        self._pid = None
+        # ruta -> (mtime_ns, tamanio, resumen)
+        self._memoria = {}
+        with closing(sqlite3.connect(ruta_db)) as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS metadatos ("
+                "ruta TEXT PRIMARY KEY, mtime_ns INTEGER, tamanio INTEGER, resumen TEXT, keyframes TEXT)"
+            )
+            db.commit()
+        self._cargar()
+        # Rutas cuyo dato guardado ya no coincide con el archivo (se vuelven a analizar)
+        self._vencidas = set()
+
+    def _cargar(self):
+        with closing(sqlite3.connect(self._ruta_db)) as db:
+            memoria = {ruta: (mtime_ns, tamanio, json.loads(resumen)) for ruta, mtime_ns, tamanio, resumen
+                       in db.execute("SELECT ruta, mtime_ns, tamanio, resumen FROM metadatos")}
+        self._memoria = memoria
+
+    def _conexion(self) -> sqlite3.Connection:
+        # Se llama con el lock tomado
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self._ruta_db, check_same_thread=False)
+            self._pid = os.getpid()
+        return self._db
+
+    def __len__(self):
+        return len(self._memoria)
+
+    def obtener(self, ruta: str):
+        """Resumen guardado de `ruta` si sigue valiendo para el archivo actual, None si no hay (nunca analiza)."""
+        try:
+            st = os.stat(ruta)
+        except FileNotFoundError:
+            return None
+        dato = self._memoria.get(ruta)
+        if dato is None or (st.st_mtime_ns, st.st_size) != dato[:2]:
+            # Puede haberlo analizado otro worker después de que este cargó la base
+            dato = self._leer(ruta)
+            if dato is None:
+                return None
+            if (st.st_mtime_ns, st.st_size) != dato[:2]:
+                self._vencidas.add(ruta)
+                return None
+            self._memoria[ruta] = dato
+            self._vencidas.discard(ruta)
+        return dato[2]
+
+    def _leer(self, ruta: str):
+        with self._lock:
+            fila = self._conexion().execute(
+                "SELECT mtime_ns, tamanio, resumen FROM metadatos WHERE ruta = ?", (ruta,)).fetchone()
+        return None if fila is None else (fila[0], fila[1], json.loads(fila[2]))
+
+    def detalle(self, ruta: str):
+        """Resumen más keyframes y tamaño (los keyframes solo están en la base, no en memoria)."""
+        resumen = self.obtener(ruta)
+        if resumen is None:
+            return None
+        with self._lock:
+            fila = self._conexion().execute("SELECT tamanio, keyframes FROM metadatos WHERE ruta = ?", (ruta,)).fetchone()
+        if fila is None:
+            return None
+        return {**resumen, "bytes": fila[0], "keyframes": json.loads(fila[1])}
+
+    async def _correr(self, cmd: list) -> tuple:
+        if self.niceness:
+            # Con `nice` adelante y no con preexec_fn, que no es seguro con threads corriendo en el proceso
+            cmd = ["nice", "-n", str(self.niceness), *cmd]
+        proceso = await asyncio.create_subprocess_exec(
+            *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        stdout, stderr = await proceso.communicate()
+        return proceso.returncode, stdout.decode(errors="replace"), stderr.decode(errors="replace")
+
+    async def analizar(self, ruta: str) -> dict:
+        """Corre ffprobe sobre `ruta` y guarda el resultado (también si el archivo está dañado)."""
+        st = await asyncio.to_thread(os.stat, ruta)
+        keyframes = []
+        codigo, salida, error = await self._correr(comando_streams(ruta, self.ffprobe_bin))
+        try:
+            if codigo != 0:
+                raise ValueError(error.strip().splitlines()[-1] if error.strip() else f"ffprobe salió con {codigo}")
+            resumen = parsear_streams(json.loads(salida))
+        except ValueError as e:
+            resumen = {"error": str(e)}
+        if not resumen.get("error") and resumen["video"] is not None:
+            codigo, salida, _ = await self._correr(comando_keyframes(ruta, self.ffprobe_bin))
+            if codigo == 0:
+                keyframes = parsear_keyframes(salida, resumen["inicio_pts"])
+
+        if resumen.get("error"):
+            self.fallidos += 1
+            logger.warning("Segmento ilegible", extra={"archivo": ruta, "error": resumen["error"]})
+        self.analizados += 1
+        await asyncio.to_thread(self._guardar, ruta, st, resumen, keyframes)
+        return resumen
+
+    def _guardar(self, ruta: str, st, resumen: dict, keyframes: list):
+        with self._lock:
+            db = self._conexion()
+            db.execute(
+                "INSERT OR REPLACE INTO metadatos (ruta, mtime_ns, tamanio, resumen, keyframes) VALUES (?, ?, ?, ?, ?)",
+                (ruta, st.st_mtime_ns, st.st_size, json.dumps(resumen), json.dumps(keyframes)),
+            )
+            db.commit()
+        self._memoria[ruta] = (st.st_mtime_ns, st.st_size, resumen)
+        self._vencidas.discard(ruta)
+
+    def mover(self, origen: str, destino: str):
+        """El segmento se movió de raíz sin cambiar (mismo mtime y tamaño): el dato guardado sigue valiendo."""
+        with self._lock:
+            db = self._conexion()
+            db.execute("UPDATE OR REPLACE metadatos SET ruta = ? WHERE ruta = ?", (destino, origen))
+            db.commit()
+        dato = self._memoria.pop(origen, None)
+        if dato is not None:
+            self._memoria[destino] = dato
+        self._vencidas.discard(origen)
+
+    def pendientes(self, canal: str) -> list:
+        """Rutas del canal sin analizar (o con un dato vencido), de los segmentos más nuevos a los más viejos."""
+        catalogo = self.catalogo.canal(canal)
+        catalogo.refrescar()
+        rutas = [s.ruta for s in reversed(catalogo.segmentos)]
+        return [r for r in rutas if r not in self._memoria or r in self._vencidas]
+
+    def canales(self) -> list:
+        return self.catalogo.canales()
+
+    async def vigilar(self, intervalo: float, por_vuelta: int = 32):
+        """
+        Analiza los segmentos nuevos de a `por_vuelta`, `concurrencia` a la vez. Mientras haya atraso
+        sigue sin pausa; al ponerse al día revisa cada `intervalo` segundos.
+        """
+        if shutil.which(self.ffprobe_bin) is None:
+            logger.warning("No se encontró ffprobe, los segmentos no se van a analizar", extra={"ffprobe": self.ffprobe_bin})
+            return
+        # Con varios workers este puede haber tomado el vigilante de otro que se cayó:
+        # lo que ese analizó está en la base pero no en la memoria de antes del fork
+        await asyncio.to_thread(self._cargar)
+        semaforo = asyncio.Semaphore(self.concurrencia)
+
+        async def analizar(ruta):
+            async with semaforo:
+                try:
+                    # Recién grabado: puede estar escribiéndose todavía, queda para la vuelta siguiente
+                    if time.time() - (await asyncio.to_thread(os.stat, ruta)).st_mtime < ESPERA_ESCRITURA_SEGUNDOS:
+                        return
+                    await self.analizar(ruta)
+                except FileNotFoundError:
+                    pass
+
+        def armar_lote():
+            # Lista las carpetas y recorre el catálogo entero: va en un thread, no en el loop
+            por_canal = [self.pendientes(canal) for canal in self.canales()]
+            return list(itertools.islice(roundrobin(por_canal), por_vuelta))
+
+        while True:
+            try:
+                lote = await asyncio.to_thread(armar_lote)
+                analizados = self.analizados
+                await asyncio.gather(*(analizar(ruta) for ruta in lote))
+                if len(lote) == por_vuelta and self.analizados > analizados:
+                    # Con atraso se sigue sin esperar el intervalo, pero dejando pasar a los requests entre lote y lote
+                    await asyncio.sleep(0)
+                    continue
+            except Exception:
+                logger.exception("Error analizando segmentos")
+            await asyncio.sleep(intervalo)
+
+    def cerrar(self):
+        with self._lock:
+            if self._db is not None and self._pid == os.getpid():
+                self._db.close()
+            self._db = None
@@ -0,0 +1,266 @@
+import contextvars
+import logging
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Métricas en formato de texto de Prometheus y perfilado por request.
+# Se implementan acá (sin prometheus_client) porque alcanzan contadores,
+# histogramas y valores que se leen al exponer (largo de la cola, aciertos del cache).
+#
+# Perfilado: con el header "X-Perfil: 1" (o al azar con TASA_MUESTREO_PERFIL) cada
+# `medir(...)` que se ejecuta durante el request queda anotado, y la respuesta
+# trae el desglose en el header estándar Server-Timing (lo muestran las DevTools).
+
+logger = logging.getLogger(__name__)
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+CONTENT_TYPE_PROMETHEUS = "text/plain; version=0.0.4; charset=utf-8"
+HEADER_PERFIL = b"x-perfil"
+
+
+def _escapar(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatear_etiquetas(nombres, valores, extra=()) -> str:
+    pares = [*zip(nombres, valores), *extra]
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{n}="{_escapar(v)}"' for n, v in pares) + "}"
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = ()):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self._valores = {}
+        self._lock = threading.Lock()
+
+    def inc(self, valor: float = 1, **etiquetas):
+        clave = tuple(str(etiquetas[e]) for e in self.etiquetas)
+        with self._lock:
+            self._valores[clave] = self._valores.get(clave, 0) + valor
+
+    def muestras(self):
+        with self._lock:
+            valores = list(self._valores.items())
+        for clave, valor in valores:
+            yield self.nombre + _formatear_etiquetas(self.etiquetas, clave), valor
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre: str, ayuda: str, etiquetas: tuple = (), buckets: tuple = BUCKETS_SEGUNDOS):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.etiquetas = etiquetas
+        self.buckets = tuple(buckets)
+        # clave -> [conteo por bucket (no acumulado), suma, cantidad]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observar(self, valor: float, **etiquetas):
+        clave = tuple(str(etiquetas[e]) for e in self.etiquetas)
+        with self._lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    serie[0][i] += 1
+                    break
+            serie[1] += valor
+            serie[2] += 1
+
+    def muestras(self):
+        with self._lock:
+            series = [(clave, list(conteos), suma, cantidad) for clave, (conteos, suma, cantidad) in self._series.items()]
+        for clave, conteos, suma, cantidad in series:
+            acumulado = 0
+            for limite, conteo in zip(self.buckets, conteos):
+                acumulado += conteo
+                yield self.nombre + "_bucket" + _formatear_etiquetas(self.etiquetas, clave, [("le", limite)]), acumulado
+            yield self.nombre + "_bucket" + _formatear_etiquetas(self.etiquetas, clave, [("le", "+Inf")]), cantidad
+            yield self.nombre + "_sum" + _formatear_etiquetas(self.etiquetas, clave), suma
+            yield self.nombre + "_count" + _formatear_etiquetas(self.etiquetas, clave), cantidad
+
+
+class Funcion:
+    """Valor que se lee al exponer (p. ej. el largo de la cola). `tipo` es "gauge" o "counter"."""
+
+    def __init__(self, nombre: str, ayuda: str, funcion, tipo: str = "gauge"):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.funcion = funcion
+        self.tipo = tipo
+
+    def muestras(self):
+        yield self.nombre, self.funcion()
+
+
+class Registro:
+    def __init__(self):
+        self._metricas = {}
+
+    def registrar(self, metrica):
+        # Reemplaza si ya existía (p. ej. al recargar la app en desarrollo)
+        self._metricas[metrica.nombre] = metrica
+        return metrica
+
+    def exponer(self) -> str:
+        lineas = []
+        for metrica in self._metricas.values():
+            lineas.append(f"# HELP {metrica.nombre} {metrica.ayuda}")
+            lineas.append(f"# TYPE {metrica.nombre} {metrica.tipo}")
+            for nombre, valor in metrica.muestras():
+                lineas.append(f"{nombre} {valor}")
+        return "\n".join(lineas) + "\n"
+
+
+def combinar_exposiciones(exposiciones: dict) -> str:
+    """
+    {worker: texto de Registro.exponer()} -> una sola exposición, con la etiqueta worker en
+    cada muestra y HELP/TYPE una vez por métrica (para servidor.py con varios workers).
+    """
+    encabezados = {}
+    muestras = {}
+    for worker, texto in sorted(exposiciones.items()):
+        metrica = None
+        for linea in texto.splitlines():
+            if linea.startswith(("# HELP ", "# TYPE ")):
+                metrica = linea.split(" ", 3)[2]
+                lineas = encabezados.setdefault(metrica, [])
+                if linea not in lineas:
+                    lineas.append(linea)
+                continue
+            if not linea or metrica is None:
+                continue
+            nombre, _, valor = linea.rpartition(" ")
+            etiqueta = f'worker="{_escapar(worker)}"'
+            nombre = nombre[:-1] + "," + etiqueta + "}" if nombre.endswith("}") else nombre + "{" + etiqueta + "}"
+            muestras.setdefault(metrica, []).append(f"{nombre} {valor}")
+    lineas = []
+    for metrica, encabezado in encabezados.items():
+        lineas.extend(encabezado)
+        lineas.extend(muestras.get(metrica, []))
+    return "\n".join(lineas) + "\n"
+
+
+REGISTRO = Registro()
+
+latencia_http = REGISTRO.registrar(Histograma(
+    "clips_http_duracion_segundos", "Duración de los requests HTTP, hasta el último byte de la respuesta",
+    ("metodo", "ruta", "estado"),
+))
+duracion_ffmpeg = REGISTRO.registrar(Histograma(
+    "clips_ffmpeg_duracion_segundos", "Tiempo de reloj de cada proceso ffmpeg", ("resultado",),
+))
+procesos_ffmpeg = REGISTRO.registrar(Contador(
+    "clips_ffmpeg_procesos_total", "Procesos ffmpeg terminados, por código de salida", ("codigo",),
+))
+bytes_servidos = REGISTRO.registrar(Contador(
+    "clips_bytes_servidos_total", "Bytes de video mandados en respuestas (segmentos, clips y exportaciones)",
+))
+refresco_catalogo = REGISTRO.registrar(Histograma(
+    "clips_catalogo_refresco_segundos", "Tiempo de relistar la carpeta de un canal cuando cambió",
+))
+precarga_segmentos = REGISTRO.registrar(Contador(
+    "clips_precarga_segmentos_total", "Segmentos pedidos para precargar, por resultado", ("resultado",),
+))
+precarga_bytes = REGISTRO.registrar(Contador(
+    "clips_precarga_bytes_total", "Bytes de segmentos que se pidieron al page cache por adelantado",
+))
+precarga_usos = REGISTRO.registrar(Contador(
+    "clips_precarga_usos_total", "Segmentos leídos por el reproductor o por ffmpeg, según si se habían precargado",
+    ("uso", "precargado"),
+))
+migracion_segmentos = REGISTRO.registrar(Contador(
+    "clips_migracion_segmentos_total", "Segmentos copiados a una raíz de archivo y originales borrados", ("resultado",),
+))
+migracion_bytes = REGISTRO.registrar(Contador(
+    "clips_migracion_bytes_total", "Bytes de segmentos copiados entre raíces de almacenamiento",
+))
+suscripciones_eventos = REGISTRO.registrar(Contador(
+    "clips_suscripciones_eventos_total", "Transcripciones nuevas para las suscripciones, entregadas o descartadas por cliente lento",
+    ("resultado",),
+))
+
+# Desglose del request en curso: lista de (nombre, segundos), o None si no se perfila
+_perfil = contextvars.ContextVar("perfil", default=None)
+
+
+@contextmanager
+def medir(nombre: str, histograma: Histograma = None, **etiquetas):
+    """
+    Mide el bloque: lo anota en el perfil del request (si se está perfilando)
+    y, si se pasa, lo observa en `histograma`.
+    """
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        segundos = time.perf_counter() - inicio
+        perfil = _perfil.get()
+        if perfil is not None:
+            perfil.append((nombre, segundos))
+        if histograma is not None:
+            histograma.observar(segundos, **etiquetas)
+
+
+def server_timing(perfil: list, total: float) -> str:
+    """'busqueda;dur=3.2, total;dur=4.0' (milisegundos), sumando los pasos con el mismo nombre."""
+    acumulado = {}
+    for nombre, segundos in perfil:
+        acumulado[nombre] = acumulado.get(nombre, 0.0) + segundos
+    acumulado["total"] = total
+    return ", ".join(f"{nombre};dur={segundos * 1000:.1f}" for nombre, segundos in acumulado.items())
+
+
+class MiddlewareMetricas:
+    """
+    Middleware ASGI (no BaseHTTPMiddleware, que no deja pasar zerocopysend) que mide
+    cada request y, si corresponde, agrega el header Server-Timing.
+    """
+
+    def __init__(self, app, tasa_muestreo: float = 0.0):
+        self.app = app
+        self.tasa_muestreo = tasa_muestreo
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        inicio = time.perf_counter()
+        perfilar = (dict(scope["headers"]).get(HEADER_PERFIL) in (b"1", b"true")
+                    or (self.tasa_muestreo and random.random() < self.tasa_muestreo))
+        perfil = [] if perfilar else None
+        token = _perfil.set(perfil)
+        estado = 500
+
+        async def enviar(mensaje):
+            nonlocal estado
+            if mensaje["type"] == "http.response.start":
+                estado = mensaje["status"]
+                if perfil is not None:
+                    valor = server_timing(perfil, time.perf_counter() - inicio)
+                    mensaje = {**mensaje, "headers": [*mensaje.get("headers", []), (b"server-timing", valor.encode())]}
+            await send(mensaje)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            _perfil.reset(token)
+            total = time.perf_counter() - inicio
+            # La plantilla de la ruta ("/segmentos/{canal}/{archivo}") y no el path, para no
+            # crear una serie por archivo
+            ruta = getattr(scope.get("route"), "path", "sin_ruta")
+            latencia_http.observar(total, metodo=scope["method"], ruta=ruta, estado=estado)
+            if perfil is not None:
+                logger.info("perfil", extra={"metodo": scope["method"], "ruta": scope["path"], "estado": estado,
+                                             "server_timing": server_timing(perfil, total)})
@@ -0,0 +1,123 @@
+import math
+import os
+import uuid
+
+from cola_trabajos import Trabajo
+from procesamiento_segmentos import ProcesadorSegmentos
+
+# Miniaturas de los segmentos para revisar resultados sin bajar el .ts entero.
+# Por cada segmento se genera, con un solo ffmpeg:
+#   poster.jpg      primer cuadro, chico (para la tarjeta del resultado)
+#   sprite.jpg      grilla con un cuadro cada INTERVALO_SPRITE segundos
+#   miniaturas.vtt  pista WebVTT de thumbnails que apunta a cada celda del sprite (#xywh)
+# Todo queda en miniaturas/<canal>/<segmento sin .ts>/. Los segmentos no cambian una
+# vez escritos, así que el nombre alcanza como clave. El .vtt se escribe último:
+# si existe, el resto también. Cada trabajo escribe a temporales propios y recién al
+# final los renombra, así dos workers que generan lo mismo no se pisan.
+
+ARCHIVO_POSTER = "poster.jpg"
+ARCHIVO_SPRITE = "sprite.jpg"
+ARCHIVO_VTT = "miniaturas.vtt"
+ARCHIVOS = {ARCHIVO_POSTER: "image/jpeg", ARCHIVO_SPRITE: "image/jpeg", ARCHIVO_VTT: "text/vtt"}
+
+ANCHO_POSTER, ALTO_POSTER = 320, 180
+ANCHO_CELDA, ALTO_CELDA = 160, 90
+INTERVALO_SPRITE = 10
+COLUMNAS_SPRITE = 5
+
+
+def escala(ancho: int, alto: int) -> str:
+    """Filtro que encaja el video en ancho x alto sin deformarlo (con bandas si hace falta)."""
+    return (f"scale={ancho}:{alto}:force_original_aspect_ratio=decrease,"
+            f"pad={ancho}:{alto}:(ow-iw)/2:(oh-ih)/2")
+
+
+def grilla(duracion: float) -> tuple:
+    """(cuadros, columnas, filas) del sprite de un segmento de `duracion` segundos."""
+    cuadros = max(1, math.ceil(duracion / INTERVALO_SPRITE))
+    columnas = min(cuadros, COLUMNAS_SPRITE)
+    return cuadros, columnas, math.ceil(cuadros / columnas)
+
+
+def comando_miniaturas(ruta_segmento: str, poster: str, sprite: str, duracion: float, ffmpeg_bin: str = "ffmpeg") -> list:
+    """Un solo ffmpeg que decodifica el segmento una vez y escribe el poster y el sprite."""
+    _, columnas, filas = grilla(duracion)
+    filtros = (
+        f"[0:v]split=2[p][s];"
+        f"[p]{escala(ANCHO_POSTER, ALTO_POSTER)}[poster];"
+        f"[s]fps=1/{INTERVALO_SPRITE},{escala(ANCHO_CELDA, ALTO_CELDA)},tile={columnas}x{filas}[sprite]"
+    )
+    return [
+        ffmpeg_bin, "-y", "-loglevel", "error", "-i", ruta_segmento,
+        "-filter_complex", filtros,
+        "-map", "[poster]", "-frames:v", "1", "-q:v", "4", "-update", "1", poster,
+        "-map", "[sprite]", "-frames:v", "1", "-q:v", "6", "-update", "1", sprite,
+    ]
+
+
+def formato_vtt(segundos: float) -> str:
+    """75.5 -> '00:01:15.500'"""
+    milis = round(segundos * 1000)
+    return f"{milis // 3600000:02d}:{milis // 60000 % 60:02d}:{milis // 1000 % 60:02d}.{milis % 1000:03d}"
+
+
+def armar_vtt(duracion: float) -> str:
+    """Pista de thumbnails: un cue por celda del sprite, con el tiempo relativo al segmento."""
+    cuadros, columnas, _ = grilla(duracion)
+    lineas = ["WEBVTT", ""]
+    for i in range(cuadros):
+        desde = i * INTERVALO_SPRITE
+        hasta = min(desde + INTERVALO_SPRITE, duracion)
+        x, y = (i % columnas) * ANCHO_CELDA, (i // columnas) * ALTO_CELDA
+        lineas += [f"{formato_vtt(desde)} --> {formato_vtt(hasta)}",
+                   f"{ARCHIVO_SPRITE}#xywh={x},{y},{ANCHO_CELDA},{ALTO_CELDA}", ""]
+    return "\n".join(lineas)
+
+
+class Miniaturas(ProcesadorSegmentos):
+    """
+    Genera y ubica las miniaturas de los segmentos. Los ffmpeg pasan por su propia
+    ColaTrabajos, así el vigilante no le quita lugar a /concatenar ni a /recortar.
+    """
+
+    nombre = "miniaturas"
+
+    def __init__(self, directorio: str, video_dir: str, catalogo, cola, ffmpeg_bin: str = "ffmpeg"):
+        super().__init__(video_dir, catalogo, cola, ffmpeg_bin)
+        self.directorio = directorio
+
+    def carpeta(self, canal: str, segmento: str) -> str:
+        return os.path.join(self.directorio, canal, os.path.splitext(segmento)[0])
+
+    def existe(self, canal: str, segmento: str) -> bool:
+        return os.path.exists(os.path.join(self.carpeta(canal, segmento), ARCHIVO_VTT))
+
+    def armar_trabajo(self, canal: str, segmento, prioridad: int) -> Trabajo:
+        carpeta = self.carpeta(canal, segmento.nombre)
+        os.makedirs(carpeta, exist_ok=True)
+        sufijo = uuid.uuid4().hex
+        poster = os.path.join(carpeta, f"poster.{sufijo}.tmp.jpg")
+        sprite = os.path.join(carpeta, f"sprite.{sufijo}.tmp.jpg")
+        duracion = segmento.duracion
+
+        def al_terminar(trabajo):
+            if os.path.exists(os.path.join(carpeta, ARCHIVO_VTT)):
+                # Otro worker las terminó primero: las suyas sirven igual (los temporales los borra la cola)
+                return
+            if not os.path.exists(poster):
+                raise RuntimeError("ffmpeg no generó el poster")
+            os.replace(poster, os.path.join(carpeta, ARCHIVO_POSTER))
+            os.replace(sprite, os.path.join(carpeta, ARCHIVO_SPRITE))
+            temporal = os.path.join(carpeta, f"miniaturas.{sufijo}.tmp.vtt")
+            with open(temporal, "w", encoding="utf-8") as f:
+                f.write(armar_vtt(duracion))
+            os.replace(temporal, os.path.join(carpeta, ARCHIVO_VTT))
+
+        return Trabajo(
+            comando_miniaturas(segmento.ruta, poster, sprite, duracion, self.ffmpeg_bin),
+            salida=sprite,
+            duracion_total=duracion,
+            temporales=[poster, sprite],
+            prioridad=prioridad,
+            al_terminar=al_terminar,
+        )
@@ -1,14 +1,26 @@
+import json
 import os
 import shutil
+import subprocess
 from datetime import datetime, timedelta
 
 # Configuración
 carpeta_origen = "videos"   # donde están video_1, video_2...
 carpeta_destino = "ln+"       # donde vamos a guardar con nombres nuevos
 canal = "ln+"               # nombre del canal mock
-duracion_segundos = 90           # cada video dura 90 segundos
+duracion_segundos = 90           # duración por defecto si no hay ffprobe para medir cada video
 timestamp_inicial = datetime(2025, 9, 12, 12, 0, 0)  # mock inicio
 
+def duracion_real(ruta):
+    """Duración del video según ffprobe, o duracion_segundos si no se puede medir."""
+    try:
+        salida = subprocess.run(["ffprobe", "-v", "error", "-of", "json", "-show_format", ruta],
+                                capture_output=True, check=True, text=True).stdout
+        return round(float(json.loads(salida)["format"]["duration"]))
+    except (OSError, subprocess.CalledProcessError, KeyError, ValueError):
+        return duracion_segundos
+
+
 # Crear carpeta de salida
 os.makedirs(carpeta_destino, exist_ok=True)
 
@@ -18,13 +30,13 @@ archivos = sorted([f for f in os.listdir(carpeta_origen) if f.startswith("video_
 # Iterar y renombrar
 ts_inicio = timestamp_inicial
 for archivo in archivos:
-    ts_fin = ts_inicio + timedelta(seconds=duracion_segundos)
+    ruta_origen = os.path.join(carpeta_origen, archivo)
+    ts_fin = ts_inicio + timedelta(seconds=duracion_real(ruta_origen))
 
     nombre_nuevo = (
         f"{canal}_{ts_inicio.strftime('%Y%m%d_%H%M%S')}_{ts_fin.strftime('%Y%m%d_%H%M%S')}.ts"
     )
 
-    ruta_origen = os.path.join(carpeta_origen, archivo)
     ruta_destino = os.path.join(carpeta_destino, nombre_nuevo)
 
     shutil.copy(ruta_origen, ruta_destino)  # o shutil.move si querés mover 
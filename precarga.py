@@ -0,0 +1,137 @@
+import logging
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from metricas import precarga_segmentos, precarga_bytes, precarga_usos
+
+# Precarga de segmentos en el page cache.
+# Después de /videos casi siempre se reproduce la ventana y muchas veces se la
+# concatena, y en discos lentos (rotacionales o de red) lo que más tarda es la
+# primera lectura. Cuando se resuelve una ventana sus segmentos se encolan acá y
+# un hilo en segundo plano le pide al kernel que los vaya leyendo
+# (posix_fadvise WILLNEED, que devuelve enseguida y lee de forma asíncrona).
+# Donde no hay fadvise se leen los archivos en bloques y se descartan.
+# La cola es acotada (si está llena se descarta, no se bloquea el request) y
+# no se repite un archivo que ya está en la cola o que se precargó hace poco.
+# Hay una cola y un hilo por dispositivo: con los segmentos repartidos en varios
+# discos (almacenamiento_segmentos.py) cada disco lee lo suyo en paralelo y uno
+# lento no frena a los demás.
+
+TAMANIO_BLOQUE_LECTURA = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+
+class Precarga:
+    def __init__(self, capacidad: int = 64, vigencia: float = 120.0, recordados: int = 4096):
+        """
+        Args:
+            capacidad (int): Segmentos esperando como máximo por dispositivo; los que no entran se descartan
+            vigencia (float): Segundos en los que un segmento precargado no se vuelve a pedir
+                (y en los que una lectura cuenta como aprovechada)
+            recordados (int): Cuántos segmentos precargados se recuerdan como máximo
+        """
+        self.capacidad = capacidad
+        self.vigencia = vigencia
+        self.recordados = recordados
+        self._lock = threading.Lock()
+        # dispositivo (st_dev) -> (cola, hilo)
+        self._colas = {}
+        # carpeta -> dispositivo, para no hacer un stat por cada segmento pedido
+        self._dispositivos = {}
+        # Rutas en la cola o leyéndose
+        self._pendientes = set()
+        # ruta -> momento en que se precargó, de la más vieja a la más nueva
+        self._recientes = OrderedDict()
+
+    @property
+    def en_espera(self):
+        return sum(cola.qsize() for cola, _ in list(self._colas.values()))
+
+    def _vigente(self, ruta: str, ahora: float) -> bool:
+        # Se llama con el lock tomado
+        momento = self._recientes.get(ruta)
+        return momento is not None and ahora - momento < self.vigencia
+
+    def pedir(self, rutas: list[str]):
+        """Encola las rutas (en ese orden, cada una en la cola de su dispositivo) sin bloquear."""
+        ahora = time.monotonic()
+        for ruta in rutas:
+            carpeta = os.path.dirname(ruta)
+            dispositivo = self._dispositivos.get(carpeta)
+            if dispositivo is None:
+                try:
+                    dispositivo = self._dispositivos[carpeta] = os.stat(carpeta).st_dev
+                except OSError:
+                    precarga_segmentos.inc(resultado="error")
+                    continue
+            with self._lock:
+                if ruta in self._pendientes or self._vigente(ruta, ahora):
+                    precarga_segmentos.inc(resultado="repetido")
+                    continue
+                try:
+                    self._cola_de(dispositivo).put_nowait(ruta)
+                except queue.Full:
+                    precarga_segmentos.inc(resultado="descartado")
+                    continue
+                self._pendientes.add(ruta)
+
+    def registrar_uso(self, rutas: list[str], uso: str):
+        """Anota si los segmentos que se van a leer (uso: "segmento" o "concatenar") estaban precargados."""
+        ahora = time.monotonic()
+        with self._lock:
+            for ruta in rutas:
+                precarga_usos.inc(uso=uso, precargado="si" if self._vigente(ruta, ahora) else "no")
+
+    def detener(self):
+        with self._lock:
+            colas, self._colas = list(self._colas.values()), {}
+        for cola, _ in colas:
+            cola.put(None)
+        for _, hilo in colas:
+            hilo.join(timeout=5)
+
+    def _cola_de(self, dispositivo: int) -> queue.Queue:
+        # Se llama con el lock tomado
+        if dispositivo not in self._colas:
+            cola = queue.Queue(maxsize=self.capacidad)
+            hilo = threading.Thread(target=self._trabajar, args=(cola,), name=f"precarga-{dispositivo}", daemon=True)
+            hilo.start()
+            self._colas[dispositivo] = (cola, hilo)
+        return self._colas[dispositivo][0]
+
+    def _trabajar(self, cola: queue.Queue):
+        while True:
+            ruta = cola.get()
+            if ruta is None:
+                return
+            try:
+                bytes_pedidos = precargar(ruta)
+                precarga_bytes.inc(bytes_pedidos)
+                precarga_segmentos.inc(resultado="precargado")
+                with self._lock:
+                    self._recientes[ruta] = time.monotonic()
+                    self._recientes.move_to_end(ruta)
+                    while len(self._recientes) > self.recordados:
+                        self._recientes.popitem(last=False)
+            except OSError as e:
+                precarga_segmentos.inc(resultado="error")
+                logger.warning("No se pudo precargar el segmento", extra={"archivo": ruta, "error": str(e)})
+            finally:
+                with self._lock:
+                    self._pendientes.discard(ruta)
+
+
+def precargar(ruta: str) -> int:
+    """Pide que el archivo quede en el page cache. Devuelve el tamaño en bytes."""
+    with open(ruta, "rb") as f:
+        tamanio = os.fstat(f.fileno()).st_size
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, tamanio, os.POSIX_FADV_WILLNEED)
+        else:
+            while f.read(TAMANIO_BLOQUE_LECTURA):
+                pass
+    return tamanio
@@ -0,0 +1,182 @@
+import asyncio
+import itertools
+import logging
+import time
+
+from cola_trabajos import ESTADOS_FINALES, ERROR, TERMINADO
+
+# Base de los procesos que generan algo por cada segmento (miniaturas, proxies).
+# Un vigilante revisa canales/<canal>/ cada tanto y encola en una ColaTrabajos
+# propia lo que falta, de los segmentos más nuevos a los más viejos e intercalando
+# canales. Los pedidos de un usuario se encolan con más prioridad que el vigilante.
+# El vigilante solo mira una ventana reciente del catálogo (lo anterior se genera
+# cuando alguien lo pide) y revisa el disco en un thread, no en el loop.
+
+# Menor número = se atiende antes (ver ColaTrabajos)
+PRIORIDAD_PEDIDO = 0
+PRIORIDAD_FONDO = 10
+
+# Cada cuánto el vigilante olvida los listos/fallidos de segmentos que ya no están en el catálogo
+PODA_SEGUNDOS = 600
+
+logger = logging.getLogger(__name__)
+
+
+def roundrobin(listas: list):
+    """[[a1, a2], [b1]] -> a1, b1, a2"""
+    for grupo in itertools.zip_longest(*listas):
+        yield from (x for x in grupo if x is not None)
+
+
+class ProcesadorSegmentos:
+    """
+    Las subclases definen `existe` (si el resultado ya está en disco) y
+    `armar_trabajo` (el Trabajo de ffmpeg que lo genera).
+    """
+
+    nombre = "segmentos"
+
+    def __init__(self, video_dir: str, catalogo, cola, ffmpeg_bin: str = "ffmpeg"):
+        self.video_dir = video_dir
+        self.catalogo = catalogo
+        self.cola = cola
+        self.ffmpeg_bin = ffmpeg_bin
+        # (canal, segmento) -> Trabajo en curso, para no generar dos veces lo mismo
+        self._en_vuelo = {}
+        # Segmentos que ya se sabe que están listos (evita un stat por segmento en cada vuelta)
+        self._listos = set()
+        # Segmentos en los que ffmpeg falló; el vigilante no los reintenta (un pedido sí)
+        self._fallidos = set()
+        # Los dos se podan cada PODA_SEGUNDOS, si no crecen con cada segmento que rota el disco
+        self._podado = time.monotonic()
+        # Lo que faltaba dentro de la ventana en la última vuelta del vigilante: (segmentos, segundos de video)
+        self.atraso = (0, 0)
+
+    def existe(self, canal: str, segmento: str) -> bool:
+        raise NotImplementedError
+
+    def armar_trabajo(self, canal: str, segmento, prioridad: int):
+        raise NotImplementedError
+
+    def listo(self, canal: str, segmento: str) -> bool:
+        if (canal, segmento) in self._listos:
+            return True
+        if self.existe(canal, segmento):
+            self._listos.add((canal, segmento))
+            return True
+        return False
+
+    async def listos(self, canal: str, segmentos: list) -> list:
+        """Como `listo` para varios segmentos; los que todavía no se sabe si están se miran en disco en un solo thread."""
+        faltan = [s for s in segmentos if (canal, s) not in self._listos]
+        if faltan:
+            await asyncio.to_thread(lambda: [self.listo(canal, s) for s in faltan])
+        return [(canal, s) in self._listos for s in segmentos]
+
+    def generar(self, canal: str, segmento, prioridad: int = PRIORIDAD_PEDIDO):
+        """
+        Encola el procesamiento de `segmento` (un Segmento del catálogo).
+        Returns:
+            Trabajo: el que ya estaba en curso para ese segmento, si había uno
+        """
+        clave = (canal, segmento.nombre)
+        trabajo = self._en_vuelo.get(clave)
+        if trabajo is not None and trabajo.estado not in ESTADOS_FINALES:
+            return trabajo
+        trabajo = self.armar_trabajo(canal, segmento, prioridad)
+        self._en_vuelo[clave] = trabajo
+        self.cola.enviar(trabajo)
+        asyncio.get_running_loop().create_task(self._olvidar(clave, trabajo))
+        return trabajo
+
+    async def _olvidar(self, clave, trabajo):
+        await trabajo.esperar()
+        if trabajo.estado == TERMINADO:
+            self._listos.add(clave)
+        elif trabajo.estado == ERROR:
+            self._fallidos.add(clave)
+        if self._en_vuelo.get(clave) is trabajo:
+            del self._en_vuelo[clave]
+
+    def pendientes(self, canal: str, limite: int = None, desde: int = None) -> list:
+        """
+        Segmentos del canal sin procesar ni en curso (hasta `limite`), de los más nuevos a los más viejos.
+        Con `desde` (epoch) no se miran los que empiezan antes.
+        """
+        faltan = []
+        catalogo = self.catalogo.canal(canal)
+        catalogo.refrescar()
+        for segmento in reversed(catalogo.segmentos):
+            if limite is not None and len(faltan) >= limite:
+                break
+            if desde is not None and segmento.inicio < desde:
+                break
+            clave = (canal, segmento.nombre)
+            if clave in self._en_vuelo or clave in self._fallidos or self.listo(*clave):
+                continue
+            faltan.append(segmento)
+        return faltan
+
+    def _atraso(self, canal: str, desde: int = None) -> tuple:
+        """(segmentos, segundos de video) de la ventana que no se sabe que estén listos; solo mira memoria."""
+        cantidad = segundos = 0
+        for segmento in reversed(self.catalogo.canal(canal).segmentos):
+            if desde is not None and segmento.inicio < desde:
+                break
+            clave = (canal, segmento.nombre)
+            if clave not in self._listos and clave not in self._fallidos:
+                cantidad += 1
+                segundos += segmento.duracion
+        return cantidad, segundos
+
+    def canales(self) -> list:
+        return self.catalogo.canales()
+
+    def _vigentes(self) -> set:
+        """(canal, segmento) de todo lo que hay en el catálogo. Refresca los canales: va en un thread."""
+        vigentes = set()
+        for canal in self.canales():
+            catalogo = self.catalogo.canal(canal)
+            catalogo.refrescar()
+            vigentes.update((canal, s.nombre) for s in catalogo.segmentos)
+        return vigentes
+
+    def _podar(self, vigentes: set):
+        """Olvida los listos/fallidos de segmentos que ya no están (borrados o rotados). Corre en el loop."""
+        self._listos &= vigentes
+        self._fallidos &= vigentes
+        self._podado = time.monotonic()
+
+    async def vigilar(self, intervalo: float, por_vuelta: int = 4, ventana: float = None):
+        """
+        Revisa canales/<canal>/ cada `intervalo` segundos y encola los segmentos nuevos.
+        Mantiene a lo sumo `por_vuelta` trabajos propios en la cola; los segmentos de las
+        últimas `ventana` segundos (todos si es None) que faltan se van completando de a poco,
+        después de los nuevos.
+        """
+
+        def revisar(desde, podar):
+            # Con stat de los segmentos que no se sabe si están: va en un thread
+            por_canal, atraso = [], (0, 0)
+            for canal in self.canales():
+                por_canal.append([(canal, s) for s in self.pendientes(canal, limite=por_vuelta, desde=desde)])
+                cantidad, segundos = self._atraso(canal, desde)
+                atraso = (atraso[0] + cantidad, atraso[1] + segundos)
+            # Los sets se leen y se modifican solo en el loop; acá se arma lo que hay en el catálogo
+            return por_canal, atraso, self._vigentes() if podar else None
+
+        while True:
+            try:
+                desde = int(time.time() - ventana) if ventana else None
+                podar = time.monotonic() - self._podado >= PODA_SEGUNDOS
+                por_canal, self.atraso, vigentes = await asyncio.to_thread(revisar, desde, podar)
+                if vigentes is not None:
+                    self._podar(vigentes)
+                en_cola = [t for t in self._en_vuelo.values() if t.estado not in ESTADOS_FINALES]
+                libres = por_vuelta - sum(1 for t in en_cola if t.prioridad == PRIORIDAD_FONDO)
+                # Intercalados por canal, así el atraso de uno no frena a los demás
+                for canal, segmento in itertools.islice(roundrobin(por_canal), max(0, libres)):
+                    self.generar(canal, segmento, prioridad=PRIORIDAD_FONDO)
+            except Exception:
+                logger.exception("Error revisando segmentos nuevos", extra={"proceso": self.nombre})
+            await asyncio.sleep(intervalo)
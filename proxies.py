@@ -0,0 +1,69 @@
+import os
+import uuid
+
+from cola_trabajos import Trabajo
+from procesamiento_segmentos import ProcesadorSegmentos
+
+# Versiones livianas (proxies) de los segmentos para la vista previa.
+# El original es calidad de emisión y pesa demasiado para un usuario remoto con
+# poca conexión; el proxy es el mismo segmento en H.264 a 360p y ~0,5 Mbps, con
+# los mismos timestamps (-copyts), así se puede reproducir y encadenar en HLS
+# igual que el original. Se guarda en la raíz principal, aunque el original ya
+# se haya movido al archivo: canales/<canal>/proxy/<segmento>.ts (el catálogo
+# ignora la carpeta porque no tiene nombre de segmento).
+# Solo la vista previa usa el proxy; /concatenar, /exportar y /recortar siguen
+# trabajando con los originales.
+
+CARPETA_PROXY = "proxy"
+CALIDAD_PROXY = "proxy"
+CALIDAD_ORIGINAL = "original"
+
+
+def comando_proxy(ruta_segmento: str, salida: str, altura: int = 360, bitrate_video: str = "400k",
+                  bitrate_audio: str = "64k", hilos: int = 1, ffmpeg_bin: str = "ffmpeg") -> list:
+    """
+    Recodifica un segmento a un proxy MPEG-TS liviano. Con `hilos` fijo cada proceso usa
+    a lo sumo esa cantidad de núcleos, así el presupuesto total es procesos x hilos.
+    """
+    return [
+        ffmpeg_bin, "-y", "-loglevel", "error", "-i", ruta_segmento,
+        "-map", "0:v:0?", "-map", "0:a:0?",
+        "-vf", f"scale=-2:'min({altura},ih)'",
+        "-c:v", "libx264", "-preset", "veryfast", "-profile:v", "main",
+        "-b:v", bitrate_video, "-maxrate", bitrate_video, "-bufsize", bitrate_video,
+        "-c:a", "aac", "-b:a", bitrate_audio, "-ac", "2",
+        "-threads", str(hilos), "-copyts", "-muxdelay", "0",
+        "-f", "mpegts", salida,
+    ]
+
+
+class Proxies(ProcesadorSegmentos):
+    nombre = "proxies"
+
+    def __init__(self, video_dir: str, catalogo, cola, altura: int = 360, bitrate_video: str = "400k",
+                 hilos: int = 1, ffmpeg_bin: str = "ffmpeg"):
+        super().__init__(video_dir, catalogo, cola, ffmpeg_bin)
+        self.altura = altura
+        self.bitrate_video = bitrate_video
+        self.hilos = hilos
+
+    def ruta(self, canal: str, segmento: str) -> str:
+        return os.path.join(self.video_dir, canal, CARPETA_PROXY, segmento)
+
+    def existe(self, canal: str, segmento: str) -> bool:
+        return os.path.exists(self.ruta(canal, segmento))
+
+    def armar_trabajo(self, canal: str, segmento, prioridad: int) -> Trabajo:
+        destino = self.ruta(canal, segmento.nombre)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        # Se escribe aparte y se renombra al terminar: si el archivo existe, está completo.
+        # Un temporal por trabajo, así dos que generan el mismo proxy (otro worker, un reintento) no se pisan
+        temporal = f"{destino}.{uuid.uuid4().hex}.tmp"
+
+        def al_terminar(trabajo):
+            os.replace(temporal, destino)
+
+        cmd = comando_proxy(segmento.ruta, temporal, self.altura,
+                            self.bitrate_video, hilos=self.hilos, ffmpeg_bin=self.ffmpeg_bin)
+        return Trabajo(cmd, salida=temporal, duracion_total=segmento.duracion, temporales=[temporal],
+                       prioridad=prioridad, al_terminar=al_terminar)
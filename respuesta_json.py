@@ -0,0 +1,32 @@
+import gzip
+import json
+
+from starlette.responses import Response
+
+# Respuestas JSON para endpoints con payloads grandes (/buscar):
+# se serializan con orjson si está instalado y se comprimen con gzip si el
+# cliente lo acepta. No se usa GZipMiddleware para toda la app porque también
+# comprimiría los videos y rompería las respuestas con Range.
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional, con json de la stdlib funciona igual (más lento)
+    orjson = None
+
+TAMANIO_MINIMO_GZIP = 1024
+NIVEL_GZIP = 5
+
+
+def serializar(contenido) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(contenido)
+    return json.dumps(contenido, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def respuesta_json(request, contenido, status_code: int = 200) -> Response:
+    cuerpo = serializar(contenido)
+    headers = {"Vary": "Accept-Encoding"}
+    if len(cuerpo) >= TAMANIO_MINIMO_GZIP and "gzip" in request.headers.get("accept-encoding", ""):
+        cuerpo = gzip.compress(cuerpo, compresslevel=NIVEL_GZIP)
+        headers["Content-Encoding"] = "gzip"
+    return Response(content=cuerpo, status_code=status_code, media_type="application/json", headers=headers)
@@ -0,0 +1,128 @@
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+# Arranque con varios workers que comparten lo que se carga al importar main.py.
+# El proceso principal importa la app una sola vez (índice de transcripciones en
+# memoria o mapeado, metadatos de los segmentos, catálogo) y recién después hace
+# fork: los workers heredan esas estructuras por copy-on-write en vez de cargar
+# cada uno la suya. gc.freeze() antes del fork saca los objetos ya cargados de las
+# pasadas del recolector, que si no los tocarían y forzarían la copia de las páginas.
+# Todos los workers aceptan conexiones del mismo socket; si uno se muere se levanta
+# otro. Los objetos de main.py (colas de ffmpeg, cache de búsquedas, suscripciones)
+# se crean al importarlo, así que después del fork cada worker tiene su copia; lo que
+# tiene que verse igual desde cualquier worker (estado de los trabajos, métricas,
+# transcripciones nuevas) pasa por la carpeta --estado (ver estado_workers.py) y el
+# cache de clips lleva la cuenta en clips/ mismo. El cliente de Elasticsearch se crea
+# en el lifespan de cada worker, y los vigilantes que escriben en disco corren en uno
+# solo (ver VIGILANTES_LOCK en main.py).
+#
+#     python servidor.py --workers 4 --port 8000
+#
+# Con --workers 1 (o donde no hay fork) es lo mismo que `uvicorn main:app`.
+
+logger = logging.getLogger("servidor")
+
+
+def abrir_socket(host: str, puerto: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, puerto))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def correr_worker(app, sock: socket.socket, args):
+    # El worker no hereda el manejo de señales del principal: uvicorn instala el suyo
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    config = uvicorn.Config(app, lifespan="on", log_level=args.log_level, timeout_keep_alive=args.keep_alive)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+def lanzar(workers: set, app, sock: socket.socket, args) -> int:
+    pid = os.fork()
+    if pid == 0:
+        codigo = 0
+        try:
+            correr_worker(app, sock, args)
+        except BaseException:
+            logger.exception("El worker terminó con error")
+            codigo = 1
+        finally:
+            os._exit(codigo)
+    workers.add(pid)
+    logger.info("Worker arrancado", extra={"pid": pid})
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API de clips con varios workers que comparten los índices cargados")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Procesos que atienden requests (por defecto uno por núcleo)")
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--keep-alive", type=int, default=5, help="Segundos que se mantiene abierta una conexión ociosa")
+    parser.add_argument("--estado", default="estado_workers",
+                        help="Carpeta del estado compartido entre workers (se vacía al arrancar)")
+    args = parser.parse_args()
+
+    if args.workers <= 1 or not hasattr(os, "fork"):
+        uvicorn.run("main:app", host=args.host, port=args.port, log_level=args.log_level,
+                    timeout_keep_alive=args.keep_alive)
+        return
+
+    sock = abrir_socket(args.host, args.port)
+    # Se carga todo una vez, antes del fork
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import estado_workers
+    estado_workers.preparar(args.estado)
+    os.environ["ESTADO_WORKERS"] = os.path.abspath(args.estado)
+    from main import app
+    gc.collect()
+    gc.freeze()
+
+    workers = set()
+    deteniendo = False
+
+    def detener(signum, frame):
+        nonlocal deteniendo
+        deteniendo = True
+        for pid in list(workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, detener)
+    signal.signal(signal.SIGINT, detener)
+    for _ in range(args.workers):
+        lanzar(workers, app, sock, args)
+    logger.info("Escuchando", extra={"host": args.host, "puerto": args.port, "workers": args.workers})
+
+    while workers:
+        try:
+            pid, estado = os.wait()
+        except ChildProcessError:
+            break
+        workers.discard(pid)
+        if not deteniendo:
+            logger.warning("Un worker terminó, se levanta otro",
+                           extra={"pid": pid, "codigo": os.waitstatus_to_exitcode(estado)})
+            # Si el worker falla al arrancar, que no sea un fork por milisegundo
+            time.sleep(1)
+            lanzar(workers, app, sock, args)
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import Response
+
+from metricas import bytes_servidos
+
+# Servido de segmentos y clips con soporte de Range (206 Partial Content) y
+# validadores ETag/Last-Modified, para que el navegador pida solo los bytes que
+# le faltan al hacer seek y no vuelva a bajar un archivo que ya tiene.
+
+TAMANIO_BLOQUE = 256 * 1024
+# Extensión ASGI para mandar un fd con sendfile (zero-copy) si el servidor la ofrece
+EXTENSION_ZEROCOPY = "http.response.zerocopysend"
+# Los segmentos no cambian una vez escritos y los clips tienen nombre por contenido
+CACHE_INMUTABLE = "public, max-age=31536000, immutable"
+
+PATRON_RANGO = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class ArchivoIncompleto(Exception):
+    """El archivo terminó antes de los bytes anunciados en Content-Length (se truncó mientras se mandaba)."""
+
+
+def abrir(ruta: str) -> tuple:
+    """
+    Abre `ruta` y devuelve (archivo, stat). Se abre antes de mandar los headers: si después
+    se borra o se rota, el fd abierto sigue leyendo el mismo archivo que se anunció.
+    Raises:
+        FileNotFoundError: si `ruta` no existe
+    """
+    f = open(ruta, "rb")
+    try:
+        return f, os.fstat(f.fileno())
+    except BaseException:
+        f.close()
+        raise
+
+
+async def enviar_archivo(scope, send, f, inicio: int, cantidad: int, ultimo: bool = True):
+    """
+    Manda `cantidad` bytes del archivo abierto `f` desde `inicio` como cuerpo de la respuesta.
+    Usa sendfile si el servidor soporta la extensión zerocopysend; si no, lee en bloques en el threadpool.
+    Raises:
+        ArchivoIncompleto: si el archivo tiene menos bytes; el servidor corta la conexión
+            en vez de dar por terminada una respuesta más corta que su Content-Length
+    """
+    zerocopy = EXTENSION_ZEROCOPY in scope.get("extensions", {})
+    bytes_servidos.inc(cantidad)
+    if zerocopy:
+        await send({
+            "type": EXTENSION_ZEROCOPY,
+            "file": f.fileno(),
+            "offset": inicio,
+            "count": cantidad,
+            "more_body": not ultimo,
+        })
+        return
+    f.seek(inicio)
+    # Se manda exactamente lo que se anunció en Content-Length,
+    # aunque el archivo haya crecido mientras tanto
+    restante = cantidad
+    while restante > 0:
+        bloque = await run_in_threadpool(f.read, min(TAMANIO_BLOQUE, restante))
+        if not bloque:
+            raise ArchivoIncompleto(f"faltan {restante} de {cantidad} bytes")
+        restante -= len(bloque)
+        await send({"type": "http.response.body", "body": bloque, "more_body": True})
+    if ultimo:
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def etag_de(st) -> str:
+    return f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+
+
+def parsear_rango(valor: str, tamanio: int):
+    """
+    Devuelve (inicio, fin) inclusivo, None si el header no sirve (se ignora y va el archivo
+    entero) o "insatisfacible" si el rango cae fuera del archivo.
+    Solo se soporta un rango; con varios se manda el archivo completo, que la RFC permite.
+    """
+    m = PATRON_RANGO.match(valor.strip())
+    if not m:
+        return None
+    desde, hasta = m.groups()
+    if not desde and not hasta:
+        return None
+    if not desde:
+        # "bytes=-500": los últimos 500 bytes
+        sufijo = int(hasta)
+        if sufijo == 0:
+            return "insatisfacible"
+        return max(0, tamanio - sufijo), tamanio - 1
+    inicio = int(desde)
+    fin = int(hasta) if hasta else tamanio - 1
+    if inicio >= tamanio or fin < inicio:
+        return "insatisfacible"
+    return inicio, min(fin, tamanio - 1)
+
+
+class RespuestaArchivo(Response):
+    def __init__(self, archivo, status_code: int, headers: dict, inicio: int = 0, cantidad: int = 0):
+        # Abierto por respuesta_archivo; se cierra al terminar de mandarlo
+        self.archivo = archivo
+        self.inicio = inicio
+        self.cantidad = cantidad
+        self.status_code = status_code
+        self.background = None
+        self.init_headers(headers)
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await send({
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            })
+            if scope["method"] == "HEAD" or self.cantidad == 0:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+            await enviar_archivo(scope, send, self.archivo, self.inicio, self.cantidad)
+        finally:
+            self.archivo.close()
+
+
+async def respuesta_archivo(request, ruta: str, media_type: str, cache_control: str = CACHE_INMUTABLE, filename: str = None):
+    """
+    Arma la respuesta para `ruta` según los headers del request:
+    304 si el cliente ya tiene esta versión, 206 si pidió un rango, 416 si el rango no existe y 200 si no.
+    Raises:
+        FileNotFoundError: si `ruta` no existe
+    """
+    # Abrir también puede bloquear (disco lento o de red): va al threadpool como las lecturas
+    archivo, st = await run_in_threadpool(abrir, ruta)
+    etag = etag_de(st)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+        "Content-Type": media_type,
+    }
+    if filename:
+        headers["Content-Disposition"] = f"attachment; filename={filename}"
+
+    if no_modificado(request, etag, st.st_mtime):
+        del headers["Content-Type"]
+        return RespuestaArchivo(archivo, 304, headers)
+
+    rango = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    # If-Range: el rango solo vale si el cliente tiene la misma versión; si no, archivo completo
+    if rango and if_range and if_range.strip() != etag and if_range.strip() != headers["Last-Modified"]:
+        rango = None
+    tramo = parsear_rango(rango, st.st_size) if rango else None
+
+    if tramo == "insatisfacible":
+        headers["Content-Range"] = f"bytes */{st.st_size}"
+        headers["Content-Length"] = "0"
+        return RespuestaArchivo(archivo, 416, headers)
+    if tramo is None:
+        headers["Content-Length"] = str(st.st_size)
+        return RespuestaArchivo(archivo, 200, headers, 0, st.st_size)
+
+    inicio, fin = tramo
+    headers["Content-Range"] = f"bytes {inicio}-{fin}/{st.st_size}"
+    headers["Content-Length"] = str(fin - inicio + 1)
+    return RespuestaArchivo(archivo, 206, headers, inicio, fin - inicio + 1)
+
+
+def no_modificado(request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match manda sobre If-Modified-Since
+        etiquetas = [e.strip().removeprefix("W/") for e in if_none_match.split(",")]
+        return "*" in etiquetas or etag in etiquetas
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
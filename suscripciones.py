@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+import logging
+from collections import deque
+
+from indice_invertido import tokenizar, resaltar
+from metricas import suscripciones_eventos
+
+# Suscripciones a transcripciones nuevas (alertas en vivo).
+# Un cliente registra palabras (y opcionalmente canales) y recibe cada transcripción
+# que entra por TranscripcionesHandler.agregar_transcripcion y las menciona, en vez de
+# repetir /buscar cada tantos segundos.
+# Las palabras de todas las suscripciones activas se compilan en un solo autómata de
+# Aho-Corasick, así cada transcripción nueva se recorre una sola vez sin importar
+# cuántas suscripciones haya. El match es el mismo que el de /buscar: frase con la
+# última palabra como prefijo, sin acentos ni mayúsculas.
+# Cada suscripción tiene una cola acotada: si el cliente no lee al ritmo en que llegan
+# las transcripciones se descartan las más viejas (nunca se frena la ingesta) y el
+# próximo evento avisa cuántas se perdieron.
+
+logger = logging.getLogger(__name__)
+
+
+class AhoCorasick:
+    """Autómata sobre caracteres: encuentra todos los patrones de una lista en una sola pasada."""
+
+    def __init__(self, patrones: list[str]):
+        # Nodo 0 = raíz. Por nodo: transiciones, enlace de falla y patrones que terminan ahí
+        self._hijos = [{}]
+        self._falla = [0]
+        self._salida = [[]]
+        for numero, patron in enumerate(patrones):
+            nodo = 0
+            for caracter in patron:
+                siguiente = self._hijos[nodo].get(caracter)
+                if siguiente is None:
+                    siguiente = len(self._hijos)
+                    self._hijos[nodo][caracter] = siguiente
+                    self._hijos.append({})
+                    self._falla.append(0)
+                    self._salida.append([])
+                nodo = siguiente
+            self._salida[nodo].append(numero)
+
+        # Enlaces de falla por niveles (BFS): el sufijo propio más largo que también es prefijo de algún patrón
+        pendientes = deque(self._hijos[0].values())
+        while pendientes:
+            nodo = pendientes.popleft()
+            for caracter, hijo in self._hijos[nodo].items():
+                falla = self._falla[nodo]
+                while falla and caracter not in self._hijos[falla]:
+                    falla = self._falla[falla]
+                destino = self._hijos[falla].get(caracter, 0)
+                self._falla[hijo] = destino if destino != hijo else 0
+                self._salida[hijo] = self._salida[hijo] + self._salida[self._falla[hijo]]
+                pendientes.append(hijo)
+
+    def buscar(self, texto: str) -> set:
+        """Números (posición en `patrones`) de los patrones que aparecen en `texto`."""
+        encontrados = set()
+        nodo = 0
+        hijos, falla, salida = self._hijos, self._falla, self._salida
+        for caracter in texto:
+            while nodo and caracter not in hijos[nodo]:
+                nodo = falla[nodo]
+            nodo = hijos[nodo].get(caracter, 0)
+            if salida[nodo]:
+                encontrados.update(salida[nodo])
+        return encontrados
+
+
+def patron(palabras: str) -> str:
+    """
+    " inflacion del" encuentra "...la inflación del mes..." y "...la inflación delirante...":
+    el espacio inicial obliga a empezar en un borde de palabra y, sin espacio al final,
+    la última palabra vale como prefijo (igual que /buscar).
+    """
+    return " " + " ".join(tokenizar(palabras))
+
+
+def texto_normalizado(texto: str) -> str:
+    return " " + " ".join(tokenizar(texto)) + " "
+
+
+class Suscripcion:
+    def __init__(self, numero: int, palabras: list[str], canales: set = None, capacidad: int = 100):
+        self.numero = numero
+        self.palabras = palabras
+        # None = todos los canales
+        self.canales = canales
+        self.capacidad = capacidad
+        self.perdidas = 0
+        self._eventos = deque()
+        self._hay_eventos = asyncio.Event()
+
+    def entregar(self, evento: dict):
+        if len(self._eventos) >= self.capacidad:
+            # Cliente lento: se descarta lo más viejo en vez de frenar al que publica
+            self._eventos.popleft()
+            self.perdidas += 1
+            suscripciones_eventos.inc(resultado="descartado")
+        self._eventos.append(evento)
+        self._hay_eventos.set()
+
+    async def siguiente(self, timeout: float = None):
+        """
+        El próximo evento, o None si pasan `timeout` segundos sin ninguno.
+        Si se descartaron eventos desde el último entregado, el evento trae "perdidas".
+        """
+        if not self._eventos:
+            self._hay_eventos.clear()
+            try:
+                await asyncio.wait_for(self._hay_eventos.wait(), timeout)
+            except asyncio.TimeoutError:
+                return None
+        evento = self._eventos.popleft()
+        if self.perdidas:
+            evento = {**evento, "perdidas": self.perdidas}
+            self.perdidas = 0
+        suscripciones_eventos.inc(resultado="entregado")
+        return evento
+
+
+class Suscripciones:
+    def __init__(self, capacidad_cola: int = 100, maximo: int = 1000):
+        """
+        Args:
+            capacidad_cola (int): Eventos sin leer por suscripción; por encima se descartan los más viejos
+            maximo (int): Suscripciones activas como máximo
+        """
+        self.capacidad_cola = capacidad_cola
+        self.maximo = maximo
+        self._activas = {}
+        self._numeros = itertools.count(1)
+        # Se recompila cuando cambian las suscripciones, en la próxima publicación
+        self._automata = None
+        self._patrones = []
+        # patrón -> números de las suscripciones que lo tienen
+        self._interesados = {}
+
+    def __len__(self):
+        return len(self._activas)
+
+    def suscribir(self, palabras: list[str], canales: list[str] = None) -> Suscripcion:
+        """
+        Raises:
+            ValueError: si no queda ninguna palabra buscable o se llegó al máximo de suscripciones
+        """
+        palabras = [p for p in palabras if tokenizar(p)]
+        if not palabras:
+            raise ValueError("No se enviaron palabras")
+        if len(self._activas) >= self.maximo:
+            raise ValueError(f"Hay {self.maximo} suscripciones activas, el máximo")
+        suscripcion = Suscripcion(next(self._numeros), palabras, set(canales) if canales else None, self.capacidad_cola)
+        self._activas[suscripcion.numero] = suscripcion
+        self._automata = None
+        logger.info("Nueva suscripción", extra={"suscripcion": suscripcion.numero, "palabras": palabras,
+                                                "canales": canales})
+        return suscripcion
+
+    def desuscribir(self, suscripcion: Suscripcion):
+        if self._activas.pop(suscripcion.numero, None) is not None:
+            self._automata = None
+
+    def _compilar(self):
+        self._interesados = {}
+        for suscripcion in self._activas.values():
+            for palabras in suscripcion.palabras:
+                self._interesados.setdefault(patron(palabras), set()).add(suscripcion.numero)
+        self._patrones = list(self._interesados)
+        self._automata = AhoCorasick(self._patrones)
+
+    def publicar(self, transcripcion):
+        """Entrega `transcripcion` a las suscripciones que la mencionan. No bloquea."""
+        if not self._activas:
+            return
+        if self._automata is None:
+            self._compilar()
+        encontrados = self._automata.buscar(texto_normalizado(transcripcion.texto))
+        # suscripción -> palabras suyas que aparecieron
+        coincidencias = {}
+        for numero_patron in encontrados:
+            for numero in self._interesados[self._patrones[numero_patron]]:
+                suscripcion = self._activas[numero]
+                if suscripcion.canales is not None and transcripcion.canal not in suscripcion.canales:
+                    continue
+                coincidencias.setdefault(numero, []).append(self._patrones[numero_patron])
+
+        for numero, patrones in coincidencias.items():
+            suscripcion = self._activas[numero]
+            palabras = [p for p in suscripcion.palabras if patron(p) in patrones]
+            suscripcion.entregar({
+                "id": transcripcion.id,
+                "canal": transcripcion.canal,
+                "start_timestamp": transcripcion.start_timestamp,
+                "end_timestamp": transcripcion.end_timestamp,
+                "palabras": palabras,
+                "fragmento": resaltar(transcripcion.texto, palabras[0]),
+            })
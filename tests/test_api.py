@@ -0,0 +1,77 @@
+import importlib
+import os
+import sys
+
+import pytest
+from fastapi.testclient import TestClient
+
+# Pruebas de los endpoints contra la app real con el backend en memoria (transcripciones del mock).
+# main.py crea clips/, la base de metadatos, etc. en el directorio actual al importarse,
+# así que se importa desde una carpeta temporal.
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture(scope="module")
+def cliente(tmp_path_factory):
+    directorio = tmp_path_factory.mktemp("app")
+    anterior = os.getcwd()
+    os.chdir(directorio)
+    sys.path.insert(0, RAIZ)
+    try:
+        main = importlib.import_module("main")
+        with TestClient(main.app) as cliente:
+            yield cliente
+    finally:
+        sys.path.remove(RAIZ)
+        os.chdir(anterior)
+
+
+def test_transcripcion_completa(cliente):
+    hit = cliente.get("/buscar", params={"palabra": "amet", "tamanio": 1}).json()["resultados"][0]
+
+    respuesta = cliente.get("/transcripcion", params={"canal": hit["canal"], "start_timestamp": hit["start_timestamp"]})
+
+    assert respuesta.status_code == 200
+    datos = respuesta.json()
+    assert set(datos) == {"id", "canal", "texto", "start_timestamp", "end_timestamp"}
+    assert datos["id"] == hit["id"]
+    assert datos["end_timestamp"] == hit["end_timestamp"]
+    assert "amet" in datos["texto"]
+
+
+def test_transcripcion_inexistente(cliente):
+    respuesta = cliente.get("/transcripcion", params={"canal": "a24", "start_timestamp": "1999-01-01T00:00:00Z"})
+
+    assert respuesta.status_code == 404
+
+
+def test_reingestar_transcripcion_no_la_duplica(cliente):
+    cuerpo = {"canal": "a24", "texto": "primera version zarzaparrilla", "start_timestamp": "2030-01-01T10:00:00Z",
+              "end_timestamp": "2030-01-01T10:01:00Z"}
+    assert cliente.post("/transcripciones", json=cuerpo).json()["nueva"] is True
+
+    respuesta = cliente.post("/transcripciones", json={**cuerpo, "texto": "segunda version zarzaparrilla"})
+
+    assert respuesta.json()["nueva"] is False
+    resultados = cliente.get("/buscar", params={"palabra": "zarzaparrilla", "completo": True}).json()["resultados"]
+    assert [r["texto"] for r in resultados] == ["segunda version zarzaparrilla"]
+    assert cliente.get("/buscar", params={"palabra": "primera version zarzaparrilla"}).json()["resultados"] == []
+
+
+def test_videos_canal_invalido_o_inexistente(cliente):
+    parametros = {"timestamp_start": "2025-09-12T12:07:30Z", "timestamp_end": "2025-09-12T12:09:00Z"}
+
+    assert cliente.get("/videos", params={**parametros, "canal": ".."}).status_code == 400
+    respuesta = cliente.get("/videos", params={**parametros, "canal": "nope"})
+
+    assert respuesta.json() == {"videos": [], "referencia": None}
+    catalogo = sys.modules["main"].transcripciones_handler.catalogo
+    assert "nope" not in catalogo._canales and ".." not in catalogo._canales
+
+
+def test_prioridad_negativa_rechazada(cliente):
+    respuesta = cliente.post("/trabajos/recortar", json={"canal": "a24", "start": "2025-09-12T12:07:30Z",
+                                                         "end": "2025-09-12T12:07:50Z", "prioridad": -5})
+
+    assert respuesta.status_code == 422
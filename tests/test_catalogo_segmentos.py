@@ -0,0 +1,55 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalogo_segmentos import CatalogoCanal  # noqa: E402
+from hls import armar_playlist  # noqa: E402
+
+# Numeración HLS de las playlists en vivo: cada segmento tiene que conservar su número
+# (y los cortes de grabación su cuenta) entre una recarga y la siguiente.
+
+
+def crear(directorio, *horas):
+    """Un segmento vacío por cada (inicio, fin) en formato HHMMSS del 2025-09-12."""
+    for inicio, fin in horas:
+        open(os.path.join(directorio, f"ln+_20250912_{inicio}_20250912_{fin}.ts"), "w").close()
+
+
+def secuencias(playlist: str) -> tuple:
+    valores = dict(linea[1:].split(":", 1) for linea in playlist.splitlines() if linea.startswith("#EXT-X-") and ":" in linea)
+    return int(valores["EXT-X-MEDIA-SEQUENCE"]), int(valores["EXT-X-DISCONTINUITY-SEQUENCE"])
+
+
+def playlist(catalogo, cantidad):
+    segmentos, (secuencia, discontinuidades) = catalogo.ultimos(cantidad)
+    return armar_playlist("ln+", segmentos, secuencia, discontinuidades, vivo=True)
+
+
+def test_mismo_segmento_mismo_numero_con_cortes(tmp_path):
+    # Un corte de 10 minutos entre el segundo y el tercero
+    crear(tmp_path, ("120000", "120130"), ("120130", "120300"), ("121300", "121430"), ("121430", "121600"))
+    catalogo = CatalogoCanal(str(tmp_path))
+    catalogo.refrescar(forzar=True)
+
+    # La de 3 arranca un segmento antes que la de 2
+    assert secuencias(playlist(catalogo, 3)) == (1, 0)
+    assert secuencias(playlist(catalogo, 2)) == (2, 1)
+
+
+def test_numeracion_sigue_al_borrar_los_viejos(tmp_path):
+    crear(tmp_path, ("120000", "120130"), ("120130", "120300"), ("121300", "121430"))
+    catalogo = CatalogoCanal(str(tmp_path))
+    catalogo.refrescar(forzar=True)
+    assert secuencias(playlist(catalogo, 1)) == (2, 1)
+
+    os.remove(tmp_path / "ln+_20250912_120000_20250912_120130.ts")
+    os.remove(tmp_path / "ln+_20250912_120130_20250912_120300.ts")
+    crear(tmp_path, ("121430", "121600"))
+    # Que el mtime de la carpeta cambie aunque el sistema de archivos tenga poca resolución
+    os.utime(tmp_path, ns=(0, os.stat(tmp_path).st_mtime_ns + 1))
+    catalogo.refrescar(forzar=True)
+
+    assert [s.nombre[-10:-3] for s in catalogo.segmentos] == ["_121430", "_121600"]
+    assert secuencias(playlist(catalogo, 2)) == (2, 1)
+    assert secuencias(playlist(catalogo, 1)) == (3, 1)
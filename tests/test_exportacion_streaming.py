@@ -0,0 +1,42 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from exportacion_streaming import RespuestaSegmentosTS  # noqa: E402
+
+# La exportación en .ts abre los segmentos antes de mandar los headers: si uno falta
+# todavía se puede responder 404, y si se borra después se termina de mandar igual.
+
+
+def enviar(respuesta) -> list:
+    mensajes = []
+
+    async def send(mensaje):
+        mensajes.append(mensaje)
+
+    asyncio.run(respuesta({"type": "http", "method": "GET"}, None, send))
+    return mensajes
+
+
+def test_segmento_faltante_antes_de_los_headers(tmp_path):
+    (tmp_path / "a.ts").write_bytes(b"a" * 10)
+
+    with pytest.raises(FileNotFoundError):
+        RespuestaSegmentosTS([str(tmp_path / "a.ts"), str(tmp_path / "b.ts")], filename="x.ts")
+
+
+def test_segmento_borrado_despues_se_manda_completo(tmp_path):
+    (tmp_path / "a.ts").write_bytes(b"a" * 10)
+    (tmp_path / "b.ts").write_bytes(b"b" * 5)
+    respuesta = RespuestaSegmentosTS([str(tmp_path / "a.ts"), str(tmp_path / "b.ts")], filename="x.ts")
+    os.remove(tmp_path / "b.ts")
+
+    mensajes = enviar(respuesta)
+
+    assert dict(mensajes[0]["headers"])[b"content-length"] == b"15"
+    assert b"".join(m.get("body", b"") for m in mensajes[1:]) == b"a" * 10 + b"b" * 5
+    assert all(archivo.closed for archivo in respuesta.archivos)
@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalogo_segmentos import CatalogoSegmentos  # noqa: E402
+from procesamiento_segmentos import ProcesadorSegmentos  # noqa: E402
+
+# Los listos/fallidos que recuerda el procesador no pueden crecer sin fin en un servidor
+# que corre meses: se olvidan los segmentos que ya rotaron fuera del catálogo.
+
+
+def test_poda_olvida_segmentos_rotados(tmp_path):
+    carpeta = tmp_path / "ln+"
+    carpeta.mkdir()
+    for nombre in ("ln+_20250912_120000_20250912_120130.ts", "ln+_20250912_120130_20250912_120300.ts"):
+        (carpeta / nombre).touch()
+    procesador = ProcesadorSegmentos(str(tmp_path), CatalogoSegmentos(str(tmp_path)), cola=None)
+    procesador._listos.update({("ln+", "ln+_20250912_120000_20250912_120130.ts"), ("ln+", "borrado.ts")})
+    procesador._fallidos.update({("ln+", "ln+_20250912_120130_20250912_120300.ts"), ("otro", "x.ts")})
+
+    procesador._podar(procesador._vigentes())
+
+    assert procesador._listos == {("ln+", "ln+_20250912_120000_20250912_120130.ts")}
+    assert procesador._fallidos == {("ln+", "ln+_20250912_120130_20250912_120300.ts")}
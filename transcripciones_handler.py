@@ -1,38 +1,123 @@
 from transcripciones_mock import objetos_transcripciones
+import asyncio
+import logging
 import os
+from collections import defaultdict
 from datetime import datetime
 
+from backends_busqueda import BackendMemoria
+from catalogo_segmentos import CatalogoSegmentos, iso_a_epoch
+from metricas import medir
+
+logger = logging.getLogger(__name__)
+
 class TranscripcionesHandler:
-    def __init__(self):
-        global transcripciones
-        self.transcripciones = objetos_transcripciones
-
-    def get_transcripciones(self, palabra: str):
-        resultados = []
-        for t in self.transcripciones:
-            if t.tiene_palabra(palabra):
-                resultados.append(t)
-        return resultados
+    def __init__(self, stemming=False, base_dir="canales", backend=None, cache=None, suscripciones=None):
+        # Backend de búsqueda: por defecto el índice en memoria sobre el mock,
+        # en producción BackendElasticsearch (se configura al levantar la app)
+        self.backend = backend or BackendMemoria(objetos_transcripciones, stemming=stemming)
+        # Catálogo de segmentos por canal, se refresca solo cuando cambia la carpeta
+        self.catalogo = CatalogoSegmentos(base_dir)
+        # CacheBusquedas opcional delante del backend
+        self.cache = cache
+        # Suscripciones (alertas en vivo) a las que se les publica cada transcripción nueva
+        self.suscripciones = suscripciones
+        # BusTranscripciones (estado_workers.py) con varios workers: lo que entra acá les llega a los demás
+        self.bus = None
+
+    async def agregar_transcripcion(self, transcripcion) -> bool:
+        """
+        Suma una transcripción nueva (p. ej. recién transcripta) al backend.
+        Returns:
+            bool: False si ya estaba (se reemplazó y no se avisa de nuevo a las suscripciones)
+        """
+        nueva = await self.backend.agregar(transcripcion)
+        self._avisar(transcripcion, nueva)
+        if self.bus is not None:
+            await asyncio.to_thread(self.bus.publicar, transcripcion, nueva)
+        return nueva
+
+    async def recibir_transcripcion(self, transcripcion, nueva: bool = True):
+        """Una transcripción que entró por otro worker (ver BusTranscripciones)."""
+        if not self.backend.compartido:
+            await self.backend.agregar(transcripcion)
+        self._avisar(transcripcion, nueva)
+
+    def _avisar(self, transcripcion, nueva: bool):
+        if self.cache is not None:
+            self.cache.invalidar(transcripcion.canal, transcripcion.start_timestamp)
+        if nueva and self.suscripciones is not None:
+            self.suscripciones.publicar(transcripcion)
+
+    async def get_transcripciones(self, palabra: str):
+        """Todos los resultados, sin paginar."""
+        return (await self.backend.buscar(palabra)).resultados
+
+    async def buscar(self, palabra: str, canal=None, desde=None, hasta=None, tamanio=None, despues_de=None):
+        """Una página de resultados (ver BackendBusqueda.buscar)."""
+        async def buscar_en_backend():
+            with medir("busqueda"):
+                return await self.backend.buscar(palabra, canal=canal, desde=desde, hasta=hasta,
+                                                 tamanio=tamanio, despues_de=despues_de)
+
+        if self.cache is None:
+            return await buscar_en_backend()
+        clave = self.cache.clave(palabra, canal=canal, desde=desde, hasta=hasta, tamanio=tamanio, despues_de=despues_de)
+        return await self.cache.obtener(clave, buscar_en_backend)
+
+    async def obtener_transcripcion(self, canal: str, start_timestamp: str):
+        with medir("busqueda"):
+            return await self.backend.obtener(canal, start_timestamp)
+
+    async def obtener_transcripciones(self, pares: list):
+        """Varias transcripciones completas de una vez: [(canal, start_timestamp), ...] -> [Transcripcion o None, ...]"""
+        with medir("busqueda"):
+            return await self.backend.obtener_varios(pares)
     
     # Ejemplo de nombre de clip: "a24_20250905_234106_20250905_234236.ts"
     # Timestamp inicial, timestamp final
     # Canal: a24
 
+    def obtener_ventana_videos(self, carpeta_canal, timestamp_start_format, timestamp_end_format, rango=3):
+        """
+        Devuelve {"videos": [...], "referencia": nombre}. La referencia es el segmento que
+        contiene timestamp_start aunque el timestamp no coincida con un nombre de archivo.
+        """
+        logger.debug("Buscando ventana de videos", extra={"canal": carpeta_canal, "timestamp_start": timestamp_start_format,
+                                                          "timestamp_end": timestamp_end_format})
+        tm_start = iso_a_epoch(timestamp_start_format)
+        tm_end = iso_a_epoch(timestamp_end_format)
+        videos, referencia = self.catalogo.canal(carpeta_canal).ventana(tm_start, tm_end, rango)
+        if referencia is None:
+            logger.info("No hay un segmento que contenga el timestamp", extra={"canal": carpeta_canal,
+                                                                               "timestamp_start": timestamp_start_format})
+        return {"videos": videos, "referencia": referencia}
+
+    def obtener_ventanas_videos(self, pedidos: list, rango=3) -> list:
+        """
+        Varias ventanas de una vez (p. ej. todos los hits de una página de /buscar).
+        Args:
+            pedidos (list): [(canal, timestamp_start, timestamp_end), ...]
+        Returns:
+            list: en el mismo orden, {"videos", "referencia"} o {"error"} si las fechas no son válidas
+        """
+        resultados = [None] * len(pedidos)
+        # Agrupados por canal: cada catálogo se refresca y se consulta una sola vez
+        por_canal = defaultdict(list)
+        for i, (canal, inicio, fin) in enumerate(pedidos):
+            try:
+                por_canal[canal].append((i, iso_a_epoch(inicio), iso_a_epoch(fin)))
+            except (TypeError, ValueError):
+                resultados[i] = {"error": "Formato de fecha inválido, se espera 2025-09-12T12:07:30Z"}
+        for canal, grupo in por_canal.items():
+            ventanas = self.catalogo.canal(canal).ventanas([(inicio, fin) for _, inicio, fin in grupo], rango)
+            for (i, _, _), (videos, referencia) in zip(grupo, ventanas):
+                resultados[i] = {"videos": videos, "referencia": referencia}
+        logger.debug("Ventanas de videos en lote", extra={"pedidos": len(pedidos), "canales": len(por_canal)})
+        return resultados
+
     def obtener_lista_videos_vecinos(self, carpeta_canal, timestamp_start_format, timestamp_end_format, rango=3):
-        print(f"Buscando en canal: {carpeta_canal}, timestamp_start: {timestamp_start_format}, timestamp_end: {timestamp_end_format}")
-        tm_start= self.formatear_timestamp(timestamp_start_format)
-        tm_end= self.formatear_timestamp(timestamp_end_format)
-        archivo_referencia = f"{carpeta_canal}_{tm_start}_{tm_end}.ts"
-        base_dir = "canales"
-        archivos = sorted([f for f in os.listdir(f"{base_dir}/{carpeta_canal}") if f.endswith(".ts")])
-        if archivo_referencia not in archivos:
-            print(f"El archivo de referencia no está en la carpeta: {carpeta_canal}")
-            return []
-        
-        idx = archivos.index(archivo_referencia)
-        start_idx = max(0, idx - rango)
-        end_idx = min(len(archivos), idx + rango + 1)
-        return archivos[start_idx:end_idx]
+        return self.obtener_ventana_videos(carpeta_canal, timestamp_start_format, timestamp_end_format, rango)["videos"]
 
     def formatear_timestamp(self, ts):
         dt = datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ")
@@ -233,6 +233,8 @@ transcripciones =[
 ]
 
 class Transcripcion:
+    __slots__ = ("id", "canal", "texto", "start_timestamp", "end_timestamp")
+
     def __init__(self, id, canal, texto, start_timestamp, end_timestamp):
         self.id = id
         self.canal = canal
@@ -248,7 +250,8 @@ from datetime import datetime
 def parse_ts(ts):
     return datetime.strptime(ts, "%Y-%m-%dT%H:%M:%SZ")
 
+# Los timestamps ISO con Z ordenan igual como strings que como fechas, no hace falta parsearlos
 objetos_transcripciones = [
     Transcripcion(**t)
-    for t in sorted(transcripciones, key=lambda x: parse_ts(x["start_timestamp"]))
+    for t in sorted(transcripciones, key=lambda x: x["start_timestamp"])
 ]
\ No newline at end of file